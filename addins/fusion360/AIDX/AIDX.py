@@ -4,6 +4,10 @@ import adsk.fusion
 import traceback
 import importlib
 import sys
+import threading
+import time
+from collections import deque
+from concurrent.futures import Executor, Future
 from pathlib import Path
 
 # モジュールパス追加
@@ -13,18 +17,118 @@ if str(_script_dir) not in sys.path:
 
 from protocol import AIDXServer
 import protocol
+from entity_resolver import resolver
 from commands.base import AIDXCommand
 
+# メインスレッドでコマンドを実行するためのカスタムイベント
+EXECUTE_EVENT_ID = "AIDX_ExecuteOnMainThread"
+EXECUTE_SLICE = 0.1  # 1回のイベントで実行を続ける最大時間（秒）、残りは次のイベントで実行
+
 # グローバル変数
 _app: adsk.core.Application = None
 _ui: adsk.core.UserInterface = None
 _server: AIDXServer = None
+_executor: "MainThreadExecutor" = None
 _handlers = []
 
 
+class _ExecuteEventHandler(adsk.core.CustomEventHandler):
+    """カスタムイベント（メインスレッド）で実行待ちの処理を実行"""
+    def __init__(self, executor: "MainThreadExecutor"):
+        super().__init__()
+        self.executor = executor
+
+    def notify(self, args):
+        self.executor._run_pending()
+
+
+class MainThreadExecutor(Executor):
+    """
+    Fusion 360のメインスレッド（UIスレッド）で処理を実行するExecutor
+
+    Fusion APIはメインスレッドからのみ安全に呼び出せるため、AIDXServerの実行段から
+    渡された処理をカスタムイベントでメインスレッドへ渡します。1回のイベントで
+    実行待ちの処理をまとめて実行し（EXECUTE_SLICE秒まで）、結果はFutureで返します。
+    """
+
+    def __init__(self, app: adsk.core.Application):
+        self._app = app
+        self._lock = threading.Lock()
+        # 実行待ちの処理（(Future, 関数, 位置引数, キーワード引数)）
+        self._pending: deque = deque()
+        # 発火済みで未処理のイベントがあるか（連続したsubmitでイベントを重複して発火しない）
+        self._fired = False
+        self._shutdown = False
+
+        # 前回のアドイン起動時の登録が残っていれば解除
+        try:
+            app.unregisterCustomEvent(EXECUTE_EVENT_ID)
+        except Exception:
+            pass
+        self._event = app.registerCustomEvent(EXECUTE_EVENT_ID)
+        self._handler = _ExecuteEventHandler(self)
+        self._event.add(self._handler)
+
+    def submit(self, fn, /, *args, **kwargs) -> Future:
+        """処理をメインスレッドの実行待ちに追加（任意のスレッドから呼び出し可能）"""
+        future = Future()
+        with self._lock:
+            if self._shutdown:
+                raise RuntimeError("cannot schedule new futures after shutdown")
+            self._pending.append((future, fn, args, kwargs))
+            fire = not self._fired
+            self._fired = True
+        if fire:
+            self._app.fireCustomEvent(EXECUTE_EVENT_ID)
+        return future
+
+    def _run_pending(self):
+        """実行待ちの処理をまとめて実行（メインスレッド、EXECUTE_SLICE秒を超えたら残りは次のイベントへ）"""
+        with self._lock:
+            self._fired = False
+        deadline = time.monotonic() + EXECUTE_SLICE
+        while True:
+            with self._lock:
+                if not self._pending:
+                    return
+                if time.monotonic() >= deadline:
+                    fire = not self._fired
+                    self._fired = True
+                    break
+                future, fn, args, kwargs = self._pending.popleft()
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                result = fn(*args, **kwargs)
+            except BaseException as e:
+                future.set_exception(e)
+            else:
+                future.set_result(result)
+        if fire:
+            self._app.fireCustomEvent(EXECUTE_EVENT_ID)
+
+    def shutdown(self, wait: bool = True, *, cancel_futures: bool = False):
+        """
+        カスタムイベントの登録を解除
+
+        解除後はメインスレッドで実行できないため、実行待ちの処理はwait・cancel_futuresによらず取り消します。
+        """
+        with self._lock:
+            self._shutdown = True
+            pending = list(self._pending)
+            self._pending.clear()
+        for future, _, _, _ in pending:
+            future.cancel()
+        try:
+            self._event.remove(self._handler)
+            self._app.unregisterCustomEvent(EXECUTE_EVENT_ID)
+        except Exception as e:
+            protocol._log(f"Warning: Failed to unregister custom event: {e}")
+
+
 def run(context):
     """アドイン起動時に呼ばれる"""
-    global _app, _ui, _server
+    global _app, _ui, _server, _executor
 
     try:
         protocol._log("=== AIDX Addin run() started ===")
@@ -41,21 +145,37 @@ def run(context):
                 protocol._log(f"Warning: Failed to stop existing server: {e}")
             _server = None
             protocol._log("Existing server cleaned up")
+        if _executor is not None:
+            _executor.shutdown()
+            _executor = None
+
+        # entityTokenキャッシュの破棄イベントを登録
+        resolver.start(_app)
 
         # コマンド自動ロード
         protocol._log("Loading commands...")
         commands = load_commands()
         protocol._log(f"Loaded {len(commands)} commands")
 
-        # AIDXサーバー起動
+        # AIDXサーバー起動（CAD APIを呼ぶコマンドはメインスレッドで実行）
         protocol._log("Creating AIDXServer instance...")
-        _server = AIDXServer(host="127.0.0.1", port=8109)
+        _executor = MainThreadExecutor(_app)
+        _server = AIDXServer(
+            host="127.0.0.1", port=8109, socket_path=str(protocol.SOCKET_PATH), executor=_executor
+        )
         protocol._log("AIDXServer instance created")
 
         # コマンド登録
         protocol._log("Registering commands...")
         for cmd_id, command_instance in commands.items():
-            _server.register_command(cmd_id, command_instance.execute)
+            command_instance.server = _server
+            _server.register_command(
+                cmd_id,
+                command_instance.execute,
+                thread_safe=command_instance.THREAD_SAFE,
+                raw_payload=command_instance.RAW_PAYLOAD
+            )
+            _server.add_close_handler(command_instance.connection_closed)
         protocol._log("All commands registered")
 
         # サーバー起動（バックグラウンドスレッド）
@@ -77,13 +197,19 @@ def run(context):
 
 def stop(context):
     """アドイン停止時に呼ばれる"""
-    global _server, _ui
+    global _server, _executor, _ui
 
     try:
         if _server:
             _server.stop()
             _server = None
 
+        if _executor:
+            _executor.shutdown()
+            _executor = None
+
+        resolver.stop()
+
         if _ui:
             _ui.messageBox("AIDX Addin stopped.")
 
@@ -1,5 +1,8 @@
 """AIDXコマンド抽象基底クラス"""
 from abc import ABC, abstractmethod
+from typing import Any, Iterable, Optional
+import protocol
+from entity_resolver import resolver
 
 
 class AIDXCommand(ABC):
@@ -8,23 +11,85 @@ class AIDXCommand(ABC):
 
     サブクラスは以下を実装する必要があります:
     - COMMAND_ID: コマンドID（0x0100～0xFFFE）
-    - execute(payload): コマンド実行メソッド
+    - execute(request): コマンド実行メソッド
+
+    CAD APIを一切使用しないコマンドは THREAD_SAFE = True とすることで、
+    実行待ちキューを経由せずI/Oスレッドで即時実行されます。
+    RAW_PAYLOAD = True のコマンドはペイロードをデコードせず、受信したバイナリ（bytearray）を
+    そのまま受け取ります（ファイル転送等）。
+    時間のかかるコマンドは remaining_time() でクライアントが指定した期限までの残り時間を
+    確認し、期限切れなら処理を打ち切ることができます。
+    登録先のサーバーは server 属性に設定され、他のコマンドを呼び出すコマンド（BATCH等）は
+    server.run_command() を使用します。
+    entityTokenは find_entity() / find_entities() で解決します（解決結果はアドイン全体でキャッシュされる）。
+    接続ごとにCADの状態を変更するコマンド（再計算の保留等）は current_connection() で変更した接続を記録し、
+    connection_closed() をオーバーライドしてクライアントの切断時に状態を戻します。
     """
 
     COMMAND_ID: int  # サブクラスで必ず定義
+    THREAD_SAFE: bool = False
+    RAW_PAYLOAD: bool = False
+    server: Optional["protocol.AIDXServer"] = None  # 登録先のサーバー（登録時に設定）
 
     @abstractmethod
-    def execute(self, payload: bytes) -> bytes:
+    def execute(self, request: Any) -> Any:
         """
         コマンド実行
 
         Args:
-            payload: リクエストペイロード（分割受信済みの完全なデータ）
+            request: デコード済みのリクエスト（通常はdict、ペイロードが空の場合は空のdict）。
+                ワイヤ形式（JSON / MessagePack / CBOR）はプロトコル層が接続ごとに選択してデコードする。
+                RAW_PAYLOAD = True の場合は受信したbytearray
 
         Returns:
-            レスポンスペイロード（64KB超過時は自動で分割送信される）
+            レスポンス。dict等のオブジェクトはリクエストと同じ形式でエンコードされ、
+            bytesはそのまま生バイナリとして送信される（64KB超過時は自動で分割送信される）
 
         Raises:
             Exception: コマンド実行エラー（プロトコル層でERR_EXECUTION_ERRORに変換される）
         """
         pass
+
+    def remaining_time(self) -> Optional[float]:
+        """
+        実行中のリクエストの期限までの残り時間（秒）
+
+        Returns:
+            残り時間（期限切れなら0以下）。期限が指定されていない場合はNone
+        """
+        return protocol.remaining_time()
+
+    def current_connection(self) -> Any:
+        """実行中のリクエストを送信した接続（connection_closed() の引数と比較する識別子）"""
+        return protocol.current_connection()
+
+    def connection_closed(self, connection: Any):
+        """
+        クライアントの接続が閉じられた（コマンドと同じ実行段で呼ばれる）
+
+        Args:
+            connection: 閉じられた接続。アドイン停止時は全ての接続を表すNone
+        """
+        pass
+
+    def find_entity(self, design: Any, token: str) -> Any:
+        """
+        entityTokenをエンティティに解決（キャッシュ付きの design.findEntityByToken()）
+
+        Returns:
+            エンティティ（見つからない場合はNone）
+        """
+        return resolver.find(design, token)
+
+    def find_entities(self, design: Any, tokens: Iterable[str]) -> list:
+        """
+        複数のentityTokenをまとめてエンティティに解決
+
+        Returns:
+            トークンと同じ順のエンティティのリスト（見つからないトークンはNone）
+        """
+        return resolver.find_all(design, tokens)
+
+    def forget_entity(self, token: str):
+        """entityTokenの解決結果をキャッシュから破棄（エンティティを削除した場合）"""
+        resolver.discard(token)
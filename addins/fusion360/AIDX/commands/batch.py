@@ -0,0 +1,146 @@
+"""バッチコマンド実装"""
+import re
+from contextlib import nullcontext
+from typing import Any
+from .base import AIDXCommand
+from .defer_compute import deferred_compute
+
+# 前のステップの結果への参照（"$0.id"、"$2.result_body_ids.1" 等）
+_REFERENCE = re.compile(r"^\$(\d+)((?:\.[^.]+)*)$")
+
+
+class BatchCommand(AIDXCommand):
+    """
+    複数のコマンドを1回の往復で順に実行
+
+    各ステップは登録済みのコマンドハンドラで実行され、全ステップの結果を1つのレスポンスで返します。
+    ステップのリクエスト中の文字列 "$N.キー" は N 番目（0始まり）のステップの結果で置き換えます。
+    defer_compute を指定すると、全ステップの実行中はタイムラインの再計算を保留し、最後に1回だけ再計算します。
+    """
+
+    COMMAND_ID = 0x0800
+
+    def execute(self, request: dict) -> dict:
+        """
+        バッチ実行
+
+        Args:
+            request: リクエスト {
+                "steps": [
+                    {"command_id": 0x0500, "request": {...}},
+                    {"command_id": 0x0700, "request": {"edge_ids": ["$0.id"], ...}},
+                    ...
+                ],
+                "stop_on_error": true,  # 失敗したステップで中断するか
+                "defer_compute": false  # 再計算を最後の1回にまとめるか
+            }
+
+        Returns:
+            {"success": true, "results": [...], "completed": 実行したステップ数} または
+                     {"success": false, "results": [...], "completed": ..., "failed_step": N, "error": "..."}
+        """
+        try:
+            # リクエスト解析
+            steps = request["steps"]
+            stop_on_error = request.get("stop_on_error", True)
+            defer_compute = request.get("defer_compute", False)
+            if not isinstance(steps, list):
+                raise ValueError("steps must be a list")
+
+            results = []
+            failed_step = None
+            error = None
+
+            with deferred_compute() if defer_compute else nullcontext():
+                for index, step in enumerate(steps):
+                    # 期限切れなら残りのステップは実行しない
+                    remaining = self.remaining_time()
+                    if remaining is not None and remaining <= 0:
+                        failed_step, error = index, "Deadline exceeded"
+                        break
+
+                    result = self._execute_step(step, results)
+                    results.append(result)
+
+                    if isinstance(result, dict) and result.get("success") is False:
+                        if failed_step is None:
+                            failed_step, error = index, result.get("error")
+                        if stop_on_error:
+                            break
+
+            # レスポンス
+            response = {
+                "success": failed_step is None,
+                "results": results,
+                "completed": len(results)
+            }
+            if failed_step is not None:
+                response["failed_step"] = failed_step
+                response["error"] = error
+
+            return response
+
+        except Exception as e:
+            # エラーレスポンス
+            response = {
+                "success": False,
+                "error": str(e)
+            }
+            return response
+
+    def _execute_step(self, step: dict, results: list) -> Any:
+        """
+        1ステップを実行（失敗は {"success": false, "error": "..."} として返す）
+
+        Args:
+            step: ステップ {"command_id": ..., "request": {...}}
+            results: 実行済みステップの結果
+
+        Returns:
+            コマンドハンドラの戻り値
+        """
+        try:
+            cmd_id = step["command_id"]
+            if cmd_id == self.COMMAND_ID:
+                raise ValueError("BATCH cannot be nested")
+            step_request = self._resolve(step.get("request", {}), results)
+            return self.server.run_command(cmd_id, step_request)
+
+        except Exception as e:
+            return {
+                "success": False,
+                "error": str(e)
+            }
+
+    def _resolve(self, value: Any, results: list) -> Any:
+        """
+        リクエスト中の参照を前のステップの結果で置き換える
+
+        "$N" はN番目のステップの結果全体、"$N.キー.インデックス" はその要素を表します。
+        "$$" で始まる文字列は先頭の "$" を1つ取り除いた文字列として扱います。
+        """
+        if isinstance(value, dict):
+            return {key: self._resolve(item, results) for key, item in value.items()}
+        if isinstance(value, list):
+            return [self._resolve(item, results) for item in value]
+        if not isinstance(value, str) or not value.startswith("$"):
+            return value
+        if value.startswith("$$"):
+            return value[1:]
+
+        match = _REFERENCE.match(value)
+        if match is None:
+            return value
+        index = int(match.group(1))
+        if index >= len(results):
+            raise ValueError(f"Reference to a step that has not run: {value}")
+
+        resolved = results[index]
+        for key in match.group(2).split(".")[1:]:
+            if isinstance(resolved, list):
+                resolved = resolved[int(key)]
+            elif isinstance(resolved, dict) and key in resolved:
+                resolved = resolved[key]
+            else:
+                raise ValueError(f"Unresolved reference: {value}")
+        return resolved
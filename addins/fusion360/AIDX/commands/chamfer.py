@@ -1,7 +1,6 @@
 """シャンファーコマンド実装"""
 import adsk.core
 import adsk.fusion
-import json
 from .base import AIDXCommand
 
 
@@ -10,12 +9,12 @@ class ChamferCommand(AIDXCommand):
 
     COMMAND_ID = 0x0701
 
-    def execute(self, payload: bytes) -> bytes:
+    def execute(self, request: dict) -> dict:
         """
         シャンファー実行
 
         Args:
-            payload: JSON形式 {
+            request: リクエスト {
                 "edge_ids": ["エッジのentityToken", ...],
                 "distance": 距離 (mm),  # 等距離面取り
                 または
@@ -25,12 +24,11 @@ class ChamferCommand(AIDXCommand):
             }
 
         Returns:
-            JSON形式 {"success": true, "feature_id": "..."} または
+            {"success": true, "feature_id": "..."} または
                      {"success": false, "error": "..."}
         """
         try:
-            # ペイロード解析
-            request = json.loads(payload.decode("utf-8"))
+            # リクエスト解析
             edge_ids = request["edge_ids"]
             body_id = request.get("body_id")
 
@@ -52,11 +50,10 @@ class ChamferCommand(AIDXCommand):
 
             # エッジ検索
             edges = adsk.core.ObjectCollection.create()
-            for edge_id in edge_ids:
-                edge_entity = design.findEntityByToken(edge_id)
-                if not edge_entity or not isinstance(edge_entity[0], adsk.fusion.BRepEdge):
+            for edge_id, edge in zip(edge_ids, self.find_entities(design, edge_ids)):
+                if not isinstance(edge, adsk.fusion.BRepEdge):
                     raise RuntimeError(f"Edge not found: {edge_id}")
-                edges.add(edge_entity[0])
+                edges.add(edge)
 
             # ChamferFeature作成
             chamfer_features = root_comp.features.chamferFeatures
@@ -77,7 +74,7 @@ class ChamferCommand(AIDXCommand):
                 "feature_id": chamfer_feature.entityToken
             }
 
-            return json.dumps(response).encode("utf-8")
+            return response
 
         except Exception as e:
             # エラーレスポンス
@@ -85,4 +82,4 @@ class ChamferCommand(AIDXCommand):
                 "success": False,
                 "error": str(e)
             }
-            return json.dumps(response).encode("utf-8")
+            return response
@@ -1,7 +1,6 @@
 """結合演算コマンド実装"""
 import adsk.core
 import adsk.fusion
-import json
 from .base import AIDXCommand
 
 
@@ -10,12 +9,12 @@ class CombineCommand(AIDXCommand):
 
     COMMAND_ID = 0x0703
 
-    def execute(self, payload: bytes) -> bytes:
+    def execute(self, request: dict) -> dict:
         """
         結合演算実行
 
         Args:
-            payload: JSON形式 {
+            request: リクエスト {
                 "target_body_id": "対象ボディのentityToken",
                 "tool_body_ids": ["ツールボディのentityToken", ...],
                 "operation": "join" | "cut" | "intersect",
@@ -23,12 +22,11 @@ class CombineCommand(AIDXCommand):
             }
 
         Returns:
-            JSON形式 {"success": true, "result_body_id": "..."} または
+            {"success": true, "result_body_id": "..."} または
                      {"success": false, "error": "..."}
         """
         try:
-            # ペイロード解析
-            request = json.loads(payload.decode("utf-8"))
+            # リクエスト解析
             target_body_id = request["target_body_id"]
             tool_body_ids = request["tool_body_ids"]
             operation = request["operation"]
@@ -40,18 +38,16 @@ class CombineCommand(AIDXCommand):
             root_comp = design.rootComponent
 
             # 対象ボディ検索
-            target_entity = design.findEntityByToken(target_body_id)
-            if not target_entity or not isinstance(target_entity[0], adsk.fusion.BRepBody):
+            target_body, *tool_entities = self.find_entities(design, [target_body_id, *tool_body_ids])
+            if not isinstance(target_body, adsk.fusion.BRepBody):
                 raise RuntimeError(f"Target body not found: {target_body_id}")
-            target_body = target_entity[0]
 
             # ツールボディ検索
             tool_bodies = adsk.core.ObjectCollection.create()
-            for tool_id in tool_body_ids:
-                tool_entity = design.findEntityByToken(tool_id)
-                if not tool_entity or not isinstance(tool_entity[0], adsk.fusion.BRepBody):
+            for tool_id, tool_body in zip(tool_body_ids, tool_entities):
+                if not isinstance(tool_body, adsk.fusion.BRepBody):
                     raise RuntimeError(f"Tool body not found: {tool_id}")
-                tool_bodies.add(tool_entity[0])
+                tool_bodies.add(tool_body)
 
             # 操作タイプ変換
             if operation == "join":
@@ -85,7 +81,7 @@ class CombineCommand(AIDXCommand):
                 "result_body_id": result_body_id
             }
 
-            return json.dumps(response).encode("utf-8")
+            return response
 
         except Exception as e:
             # エラーレスポンス
@@ -93,4 +89,4 @@ class CombineCommand(AIDXCommand):
                 "success": False,
                 "error": str(e)
             }
-            return json.dumps(response).encode("utf-8")
+            return response
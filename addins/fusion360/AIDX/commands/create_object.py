@@ -1,7 +1,6 @@
 """オブジェクト作成コマンド実装"""
 import adsk.core
 import adsk.fusion
-import json
 import math
 from .base import AIDXCommand
 
@@ -11,12 +10,12 @@ class CreateObjectCommand(AIDXCommand):
 
     COMMAND_ID = 0x0500
 
-    def execute(self, payload: bytes) -> bytes:
+    def execute(self, request: dict) -> dict:
         """
         オブジェクト作成
 
         Args:
-            payload: JSON形式 {
+            request: リクエスト {
                 "type": "box" | "cylinder" | "sphere" | "torus",
                 "params": {...},
                 "position": [x, y, z],  # mm
@@ -24,11 +23,10 @@ class CreateObjectCommand(AIDXCommand):
             }
 
         Returns:
-            JSON形式 {"success": true, "id": "...", "type": "BRepBody"}
+            {"success": true, "id": "...", "type": "BRepBody"}
         """
         try:
-            # ペイロード解析
-            request = json.loads(payload.decode("utf-8"))
+            # リクエスト解析
             shape_type = request["type"]
             params = request["params"]
             pos_mm = request.get("position", [0, 0, 0])
@@ -61,7 +59,7 @@ class CreateObjectCommand(AIDXCommand):
                 "type": "BRepBody"
             }
 
-            return json.dumps(response).encode("utf-8")
+            return response
 
         except Exception as e:
             # エラーレスポンス
@@ -69,7 +67,7 @@ class CreateObjectCommand(AIDXCommand):
                 "success": False,
                 "error": str(e)
             }
-            return json.dumps(response).encode("utf-8")
+            return response
 
     def _create_box(
         self,
@@ -0,0 +1,122 @@
+"""再計算の保留コマンド実装"""
+from contextlib import contextmanager
+from typing import Any, Iterator, Optional
+import adsk.core
+import adsk.fusion
+from .base import AIDXCommand
+
+
+def _parametric_design() -> Optional[adsk.fusion.Design]:
+    """アクティブなパラメトリックデザイン（ダイレクトモデリング・デザイン以外ならNone）"""
+    app = adsk.core.Application.get()
+    design = adsk.fusion.Design.cast(app.activeProduct)
+    if design is None or design.designType != adsk.fusion.DesignTypes.ParametricDesignType:
+        return None
+    return design
+
+
+def set_compute_deferred(deferred: bool) -> bool:
+    """
+    タイムラインの再計算を保留 / 再開
+
+    保留を解除すると、保留中に追加したフィーチャーをまとめて1回だけ再計算し、ビューポートを更新します。
+
+    Args:
+        deferred: 保留する場合True
+
+    Returns:
+        変更前に保留中だったか（パラメトリックデザインでない場合はFalse）
+    """
+    design = _parametric_design()
+    if design is None:
+        return False
+
+    was_deferred = design.isComputeDeferred
+    if was_deferred != deferred:
+        design.isComputeDeferred = deferred
+        if not deferred:
+            adsk.core.Application.get().activeViewport.refresh()
+    return was_deferred
+
+
+@contextmanager
+def deferred_compute() -> Iterator[None]:
+    """
+    ブロック内の操作の再計算を保留し、終了時に1回だけ再計算する
+
+    ブロック内で例外が発生しても終了時に保留前の状態へ戻します。
+    既に保留中（DeferComputeCommandで保留した区間内）の場合は何もしません。
+    """
+    was_deferred = set_compute_deferred(True)
+    try:
+        yield
+    finally:
+        if not was_deferred:
+            set_compute_deferred(False)
+
+
+class DeferComputeCommand(AIDXCommand):
+    """
+    タイムラインの再計算を保留 / 再開
+
+    保留中に実行したフィーチャー操作（create_object, combine, fillet, extrude 等）は再計算されず、
+    保留を解除した時点でまとめて1回だけ再計算されます。
+    保留した接続が解除せずに閉じられた場合（クライアントの切断）やアドインの停止時は、保留前の状態に戻します。
+    """
+
+    COMMAND_ID = 0x0801
+
+    def __init__(self):
+        # 再計算を保留した接続と、最初に保留する前の状態（保留していなければNone）
+        self._owner: Optional[tuple[Any, bool]] = None
+
+    def execute(self, request: dict) -> dict:
+        """
+        再計算の保留 / 再開
+
+        Args:
+            request: リクエスト {"deferred": true | false}
+
+        Returns:
+            {"success": true, "deferred": 変更後の状態, "was_deferred": 変更前の状態} または
+                     {"success": false, "error": "..."}
+        """
+        try:
+            # リクエスト解析
+            deferred = bool(request["deferred"])
+
+            if _parametric_design() is None:
+                raise RuntimeError("Active product is not a parametric design")
+
+            was_deferred = set_compute_deferred(deferred)
+            if deferred:
+                # 後から保留した接続を記録（戻す状態は最初に保留する前のもの）
+                original = self._owner[1] if self._owner is not None else was_deferred
+                self._owner = (self.current_connection(), original)
+            else:
+                self._owner = None
+
+            # 成功レスポンス
+            response = {
+                "success": True,
+                "deferred": deferred,
+                "was_deferred": was_deferred
+            }
+
+            return response
+
+        except Exception as e:
+            # エラーレスポンス
+            response = {
+                "success": False,
+                "error": str(e)
+            }
+            return response
+
+    def connection_closed(self, connection: Any):
+        """保留した接続が閉じられた（アドイン停止時はNone）場合、再計算を保留前の状態に戻す"""
+        if self._owner is None or (connection is not None and self._owner[0] is not connection):
+            return
+        _, original = self._owner
+        self._owner = None
+        set_compute_deferred(original)
@@ -1,7 +1,6 @@
 """オブジェクト削除コマンド実装"""
 import adsk.core
 import adsk.fusion
-import json
 from .base import AIDXCommand
 
 
@@ -10,22 +9,21 @@ class DeleteObjectCommand(AIDXCommand):
 
     COMMAND_ID = 0x0600
 
-    def execute(self, payload: bytes) -> bytes:
+    def execute(self, request: dict) -> dict:
         """
         オブジェクト削除
 
         Args:
-            payload: JSON形式 {
+            request: リクエスト {
                 "id": "entityToken",
                 "type": "BRepBody" | "Occurrence" | "Sketch"
             }
 
         Returns:
-            JSON形式 {"success": true, "deleted": "entityToken"}
+            {"success": true, "deleted": "entityToken"}
         """
         try:
-            # ペイロード解析
-            request = json.loads(payload.decode("utf-8"))
+            # リクエスト解析
             object_id = request["id"]
             object_type = request.get("type", "BRepBody")
 
@@ -35,27 +33,27 @@ class DeleteObjectCommand(AIDXCommand):
             root_comp = design.rootComponent
 
             # オブジェクト検索
-            entity = design.findEntityByToken(object_id)
-            if not entity:
+            entity = self.find_entity(design, object_id)
+            if entity is None:
                 raise RuntimeError(f"Object not found: {object_id}")
 
             # タイプに応じて削除
             deleted_id = None
 
-            if object_type == "BRepBody" and isinstance(entity[0], adsk.fusion.BRepBody):
-                body: adsk.fusion.BRepBody = entity[0]
+            if object_type == "BRepBody" and isinstance(entity, adsk.fusion.BRepBody):
+                body: adsk.fusion.BRepBody = entity
                 # BRepBodyを削除（deleteMe()を使用）
                 body.deleteMe()
                 deleted_id = object_id
 
-            elif object_type == "Occurrence" and isinstance(entity[0], adsk.fusion.Occurrence):
-                occurrence: adsk.fusion.Occurrence = entity[0]
+            elif object_type == "Occurrence" and isinstance(entity, adsk.fusion.Occurrence):
+                occurrence: adsk.fusion.Occurrence = entity
                 # Occurrenceを削除
                 occurrence.deleteMe()
                 deleted_id = object_id
 
-            elif object_type == "Sketch" and isinstance(entity[0], adsk.fusion.Sketch):
-                sketch: adsk.fusion.Sketch = entity[0]
+            elif object_type == "Sketch" and isinstance(entity, adsk.fusion.Sketch):
+                sketch: adsk.fusion.Sketch = entity
                 # Sketchを削除
                 sketch.deleteMe()
                 deleted_id = object_id
@@ -63,16 +61,19 @@ class DeleteObjectCommand(AIDXCommand):
             else:
                 raise RuntimeError(
                     f"Type mismatch or unsupported type: "
-                    f"expected {object_type}, got {type(entity[0]).__name__}"
+                    f"expected {object_type}, got {type(entity).__name__}"
                 )
 
+            # 削除したエンティティのキャッシュを破棄
+            self.forget_entity(object_id)
+
             # 成功レスポンス
             response = {
                 "success": True,
                 "deleted": deleted_id
             }
 
-            return json.dumps(response).encode("utf-8")
+            return response
 
         except Exception as e:
             # エラーレスポンス
@@ -80,4 +81,4 @@ class DeleteObjectCommand(AIDXCommand):
                 "success": False,
                 "error": str(e)
             }
-            return json.dumps(response).encode("utf-8")
+            return response
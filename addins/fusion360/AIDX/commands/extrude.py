@@ -1,7 +1,6 @@
 """押し出しコマンド実装"""
 import adsk.core
 import adsk.fusion
-import json
 from .base import AIDXCommand
 
 
@@ -10,12 +9,12 @@ class ExtrudeCommand(AIDXCommand):
 
     COMMAND_ID = 0x0702
 
-    def execute(self, payload: bytes) -> bytes:
+    def execute(self, request: dict) -> dict:
         """
         押し出し実行
 
         Args:
-            payload: JSON形式 {
+            request: リクエスト {
                 "profile_ids": ["プロファイルまたは面のentityToken", ...],
                 "distance": 押し出し距離 (mm),
                 "operation": "new" | "join" | "cut" | "intersect",
@@ -24,12 +23,11 @@ class ExtrudeCommand(AIDXCommand):
             }
 
         Returns:
-            JSON形式 {"success": true, "feature_id": "...", "bodies": [...]} または
+            {"success": true, "feature_id": "...", "bodies": [...]} または
                      {"success": false, "error": "..."}
         """
         try:
-            # ペイロード解析
-            request = json.loads(payload.decode("utf-8"))
+            # リクエスト解析
             profile_ids = request["profile_ids"]
             distance_mm = request["distance"]
             operation = request["operation"]
@@ -46,18 +44,17 @@ class ExtrudeCommand(AIDXCommand):
 
             # プロファイル/面検索
             profiles = adsk.core.ObjectCollection.create()
-            for profile_id in profile_ids:
-                entity = design.findEntityByToken(profile_id)
-                if not entity:
+            for profile_id, entity in zip(profile_ids, self.find_entities(design, profile_ids)):
+                if entity is None:
                     raise RuntimeError(f"Profile/Face not found: {profile_id}")
 
                 # ProfileまたはBRepFaceを追加
-                if isinstance(entity[0], adsk.fusion.Profile):
-                    profiles.add(entity[0])
-                elif isinstance(entity[0], adsk.fusion.BRepFace):
-                    profiles.add(entity[0])
+                if isinstance(entity, adsk.fusion.Profile):
+                    profiles.add(entity)
+                elif isinstance(entity, adsk.fusion.BRepFace):
+                    profiles.add(entity)
                 else:
-                    raise RuntimeError(f"Invalid entity type: {type(entity[0])}")
+                    raise RuntimeError(f"Invalid entity type: {type(entity)}")
 
             # ExtrudeFeature作成
             extrude_features = root_comp.features.extrudeFeatures
@@ -106,7 +103,7 @@ class ExtrudeCommand(AIDXCommand):
                 "bodies": body_ids
             }
 
-            return json.dumps(response).encode("utf-8")
+            return response
 
         except Exception as e:
             # エラーレスポンス
@@ -114,4 +111,4 @@ class ExtrudeCommand(AIDXCommand):
                 "success": False,
                 "error": str(e)
             }
-            return json.dumps(response).encode("utf-8")
+            return response
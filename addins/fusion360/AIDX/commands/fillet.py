@@ -1,7 +1,6 @@
 """フィレットコマンド実装"""
 import adsk.core
 import adsk.fusion
-import json
 from .base import AIDXCommand
 
 
@@ -10,24 +9,23 @@ class FilletCommand(AIDXCommand):
 
     COMMAND_ID = 0x0700
 
-    def execute(self, payload: bytes) -> bytes:
+    def execute(self, request: dict) -> dict:
         """
         フィレット実行
 
         Args:
-            payload: JSON形式 {
+            request: リクエスト {
                 "edge_ids": ["エッジのentityToken", ...],
                 "radius": 半径 (mm),
                 "body_id": "対象ボディのentityToken（オプション）"
             }
 
         Returns:
-            JSON形式 {"success": true, "feature_id": "..."} または
+            {"success": true, "feature_id": "..."} または
                      {"success": false, "error": "..."}
         """
         try:
-            # ペイロード解析
-            request = json.loads(payload.decode("utf-8"))
+            # リクエスト解析
             edge_ids = request["edge_ids"]
             radius_mm = request["radius"]
             body_id = request.get("body_id")
@@ -42,11 +40,10 @@ class FilletCommand(AIDXCommand):
 
             # エッジ検索
             edges = adsk.core.ObjectCollection.create()
-            for edge_id in edge_ids:
-                edge_entity = design.findEntityByToken(edge_id)
-                if not edge_entity or not isinstance(edge_entity[0], adsk.fusion.BRepEdge):
+            for edge_id, edge in zip(edge_ids, self.find_entities(design, edge_ids)):
+                if not isinstance(edge, adsk.fusion.BRepEdge):
                     raise RuntimeError(f"Edge not found: {edge_id}")
-                edges.add(edge_entity[0])
+                edges.add(edge)
 
             # FilletFeature作成
             fillet_features = root_comp.features.filletFeatures
@@ -62,7 +59,7 @@ class FilletCommand(AIDXCommand):
                 "feature_id": fillet_feature.entityToken
             }
 
-            return json.dumps(response).encode("utf-8")
+            return response
 
         except Exception as e:
             # エラーレスポンス
@@ -70,4 +67,4 @@ class FilletCommand(AIDXCommand):
                 "success": False,
                 "error": str(e)
             }
-            return json.dumps(response).encode("utf-8")
+            return response
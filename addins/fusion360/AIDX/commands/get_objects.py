@@ -1,7 +1,6 @@
 """オブジェクト情報取得コマンド実装"""
 import adsk.core
 import adsk.fusion
-import json
 from .base import AIDXCommand
 
 
@@ -10,15 +9,15 @@ class GetObjectsCommand(AIDXCommand):
 
     COMMAND_ID = 0x0300
 
-    def execute(self, payload: bytes) -> bytes:
+    def execute(self, request: dict) -> dict:
         """
         オブジェクト情報取得
 
         Args:
-            payload: JSON形式 {"filter": {...}} (フィルタ条件、現在は未使用)
+            request: リクエスト {"filter": {...}} (フィルタ条件、現在は未使用)
 
         Returns:
-            JSON形式 {"objects": [...]} (Fusion 360固有のフォーマット)
+            {"objects": [...]} (Fusion 360固有のフォーマット)
         """
         try:
             # Fusion 360 API取得
@@ -39,7 +38,7 @@ class GetObjectsCommand(AIDXCommand):
                 "objects": objects
             }
 
-            return json.dumps(response).encode("utf-8")
+            return response
 
         except Exception as e:
             # エラー時は空配列を返す
@@ -47,7 +46,7 @@ class GetObjectsCommand(AIDXCommand):
                 "objects": [],
                 "error": str(e)
             }
-            return json.dumps(response).encode("utf-8")
+            return response
 
     def _extract_body_info(self, body: adsk.fusion.BRepBody) -> dict:
         """
@@ -1,8 +1,9 @@
 """ファイルインポートコマンド実装"""
+import os
 import adsk.core
 import adsk.fusion
-import json
 from .base import AIDXCommand
+from .upload_file import is_uploaded_file
 
 
 class ImportFileCommand(AIDXCommand):
@@ -10,22 +11,22 @@ class ImportFileCommand(AIDXCommand):
 
     COMMAND_ID = 0x0200
 
-    def execute(self, payload: bytes) -> bytes:
+    def execute(self, request: dict) -> dict:
         """
         ファイルインポート
 
         Args:
-            payload: JSON形式 {"path": "...", "pos": [x, y, z], "rot": [rx, ry, rz]}
-                - path: ファイルパス
+            request: リクエスト {"path": "...", "pos": [x, y, z], "rot": [rx, ry, rz]}
+                - path: ファイルパス（UploadFileCommandが返したパスの場合、インポート後に削除）
                 - pos: 配置座標 [x, y, z] (mm単位)
                 - rot: 回転角度 [x, y, z] (度数法)
 
         Returns:
-            JSON形式 {"success": true, "id": "オブジェクトID"} または {"success": false, "error": "エラーメッセージ"}
+            {"success": true, "id": "オブジェクトID"} または {"success": false, "error": "エラーメッセージ"}
         """
+        file_path = None
         try:
-            # ペイロード解析
-            request = json.loads(payload.decode("utf-8"))
+            # リクエスト解析
             file_path = request["path"]
             pos_mm = request.get("pos", [0, 0, 0])
             rot_deg = request.get("rot", [0, 0, 0])
@@ -63,7 +64,7 @@ class ImportFileCommand(AIDXCommand):
                 "id": occurrence.entityToken
             }
 
-            return json.dumps(response).encode("utf-8")
+            return response
 
         except Exception as e:
             # エラーレスポンス
@@ -71,7 +72,15 @@ class ImportFileCommand(AIDXCommand):
                 "success": False,
                 "error": str(e)
             }
-            return json.dumps(response).encode("utf-8")
+            return response
+
+        finally:
+            # アップロードされた一時ファイルは成否によらず削除
+            if file_path is not None and is_uploaded_file(file_path):
+                try:
+                    os.remove(file_path)
+                except OSError:
+                    pass
 
     def _create_transform_matrix(self, pos_cm: list[float], rot_deg: list[float]) -> adsk.core.Matrix3D:
         """
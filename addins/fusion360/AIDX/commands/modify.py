@@ -1,7 +1,6 @@
 """オブジェクト変形コマンド実装"""
 import adsk.core
 import adsk.fusion
-import json
 from .base import AIDXCommand
 
 
@@ -10,19 +9,18 @@ class ModifyCommand(AIDXCommand):
 
     COMMAND_ID = 0x0400
 
-    def execute(self, payload: bytes) -> bytes:
+    def execute(self, request: dict) -> dict:
         """
         オブジェクト変形
 
         Args:
-            payload: JSON形式 {"id": "オブジェクトID", "matrix": [16要素の4x4行列]}
+            request: リクエスト {"id": "オブジェクトID", "matrix": [16要素の4x4行列]}
 
         Returns:
-            JSON形式 {"success": true} または {"success": false, "error": "エラーメッセージ"}
+            {"success": true} または {"success": false, "error": "エラーメッセージ"}
         """
         try:
-            # ペイロード解析
-            request = json.loads(payload.decode("utf-8"))
+            # リクエスト解析
             object_id = request["id"]
             matrix_values = request["matrix"]
 
@@ -35,13 +33,13 @@ class ModifyCommand(AIDXCommand):
             root_comp = design.rootComponent
 
             # オブジェクト検索
-            entity = design.findEntityByToken(object_id)
-            if not entity:
+            entity = self.find_entity(design, object_id)
+            if entity is None:
                 raise RuntimeError(f"Object not found: {object_id}")
 
             # Occurrenceかどうか確認
-            if isinstance(entity[0], adsk.fusion.Occurrence):
-                occurrence = entity[0]
+            if isinstance(entity, adsk.fusion.Occurrence):
+                occurrence = entity
 
                 # 4x4行列を作成
                 transform = self._create_matrix_from_values(matrix_values)
@@ -51,9 +49,9 @@ class ModifyCommand(AIDXCommand):
 
                 response = {"success": True}
             else:
-                raise RuntimeError(f"Entity is not an Occurrence: {type(entity[0])}")
+                raise RuntimeError(f"Entity is not an Occurrence: {type(entity)}")
 
-            return json.dumps(response).encode("utf-8")
+            return response
 
         except Exception as e:
             # エラーレスポンス
@@ -61,7 +59,7 @@ class ModifyCommand(AIDXCommand):
                 "success": False,
                 "error": str(e)
             }
-            return json.dumps(response).encode("utf-8")
+            return response
 
     def _create_matrix_from_values(self, values: list[float]) -> adsk.core.Matrix3D:
         """
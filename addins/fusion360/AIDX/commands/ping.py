@@ -1,5 +1,4 @@
 """Ping コマンド - 接続確認用の最軽量コマンド"""
-import json
 from .base import AIDXCommand
 
 
@@ -9,26 +8,27 @@ class PingCommand(AIDXCommand):
 
     接続確認用の最軽量コマンド。
     ペイロードなしで呼び出し可能で、即座にpongを返します。
+    CAD APIを使用しないため、実行中の重いコマンドを待たずに応答します。
     """
 
     COMMAND_ID = 0x0001
+    THREAD_SAFE = True
 
-    def execute(self, payload: bytes) -> bytes:
+    def execute(self, request: dict) -> dict:
         """
         Ping実行
 
         Args:
-            payload: 空またはオプションのメッセージ
+            request: 空、またはオプションのメッセージ {"message": "..."}
 
         Returns:
-            {"status": "pong", "message": ...} のJSON
+            {"status": "pong", "message": ...}
         """
-        # ペイロードがあればデコード、なければ空文字列
-        message = payload.decode("utf-8") if payload else ""
+        message = request.get("message", "") if isinstance(request, dict) else ""
 
         response = {
             "status": "pong",
             "message": message if message else "AIDX server is alive"
         }
 
-        return json.dumps(response, ensure_ascii=False).encode("utf-8")
+        return response
@@ -10,15 +10,15 @@ class ScreenshotCommand(AIDXCommand):
 
     COMMAND_ID = 0x0100
 
-    def execute(self, payload: bytes) -> bytes:
+    def execute(self, request: dict) -> bytes:
         """
         スクリーンショット取得
 
         Args:
-            payload: 空（このコマンドはペイロードを使用しない）
+            request: 空（このコマンドはリクエストを使用しない）
 
         Returns:
-            PNG形式の画像バイナリ
+            PNG形式の画像バイナリ（bytesを返すため生バイナリとして送信される）
         """
         app = adsk.core.Application.get()
         viewport = app.activeViewport
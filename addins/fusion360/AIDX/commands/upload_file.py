@@ -0,0 +1,63 @@
+"""ファイルアップロードコマンド実装"""
+import tempfile
+import uuid
+from pathlib import Path
+from .base import AIDXCommand
+
+# アップロードされたファイルの保存先（ImportFileCommandはインポート後にこのディレクトリのファイルを削除）
+UPLOAD_DIR = Path(tempfile.gettempdir()) / "aidx_uploads"
+
+
+def is_uploaded_file(path: str) -> bool:
+    """UploadFileCommandが保存したファイルか"""
+    return Path(path).resolve().parent == UPLOAD_DIR.resolve()
+
+
+class UploadFileCommand(AIDXCommand):
+    """
+    インポートするファイル（STEP）の内容を受信し、アドイン側の一時ファイルに保存
+
+    ペイロードはファイルの内容そのもの（生バイナリ）で、大きなファイルは分割送信されます。
+    返したパスを ImportFileCommand（0x0200）に渡すと、インポート後に一時ファイルは削除されます。
+    MCPサーバーとFusion 360が別の環境で動作していても、MCPサーバー側のファイルをインポートできます。
+    """
+
+    COMMAND_ID = 0x0201
+    RAW_PAYLOAD = True
+
+    def execute(self, request: bytearray) -> dict:
+        """
+        ファイル保存
+
+        Args:
+            request: ファイルの内容
+
+        Returns:
+            {"success": true, "path": "保存先のパス", "size": バイト数} または
+                     {"success": false, "error": "エラーメッセージ"}
+        """
+        try:
+            if len(request) == 0:
+                raise ValueError("File is empty")
+
+            UPLOAD_DIR.mkdir(parents=True, exist_ok=True)
+            path = UPLOAD_DIR / f"{uuid.uuid4().hex}.step"
+            with open(path, "wb") as f:
+                f.write(request)
+
+            # 成功レスポンス
+            response = {
+                "success": True,
+                "path": str(path),
+                "size": len(request)
+            }
+
+            return response
+
+        except Exception as e:
+            # エラーレスポンス
+            response = {
+                "success": False,
+                "error": str(e)
+            }
+            return response
@@ -0,0 +1,135 @@
+"""entityTokenの解決キャッシュ"""
+import threading
+from typing import Iterable, Optional
+import adsk.core
+import adsk.fusion
+
+MAX_ENTRIES = 100000  # キャッシュするトークン数の上限（超えたら全て破棄）
+
+
+class _InvalidateOnDocumentEvent(adsk.core.DocumentEventHandler):
+    """ドキュメントの切り替え・クローズでキャッシュを破棄"""
+    def __init__(self, resolver: "EntityResolver"):
+        super().__init__()
+        self.resolver = resolver
+
+    def notify(self, args):
+        self.resolver.invalidate()
+
+
+class _InvalidateOnCommandEvent(adsk.core.ApplicationCommandEventHandler):
+    """UIのコマンド（編集・元に戻す・タイムライン操作等）の終了でキャッシュを破棄"""
+    def __init__(self, resolver: "EntityResolver"):
+        super().__init__()
+        self.resolver = resolver
+
+    def notify(self, args):
+        self.resolver.invalidate()
+
+
+class EntityResolver:
+    """
+    entityToken → エンティティの解決結果をキャッシュ
+
+    design.findEntityByToken() の結果をアクティブなデザインごとに保持し、
+    ドキュメントの切り替え・クローズやUIでのデザイン変更（タイムライン操作・元に戻す等）で破棄します。
+    コマンドの実行によって無効になったエンティティ（フィレットで置き換わったエッジ等）は
+    isValid で判定して解決し直します。実行スレッドとイベント（メインスレッド）から使用します。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._design: Optional[adsk.fusion.Design] = None
+        self._entities: dict[str, adsk.core.Base] = {}
+        # 登録したイベントハンドラ（(イベント, ハンドラ)、参照を保持しないと解放される）
+        self._handlers: list[tuple[adsk.core.Event, adsk.core.EventHandler]] = []
+
+    def start(self, app: adsk.core.Application):
+        """デザイン変更のイベントを登録"""
+        self.stop()
+        document_handler = _InvalidateOnDocumentEvent(self)
+        command_handler = _InvalidateOnCommandEvent(self)
+        for event, handler in (
+            (app.documentActivated, document_handler),
+            (app.documentClosed, document_handler),
+            (app.userInterface.commandTerminated, command_handler),
+        ):
+            event.add(handler)
+            self._handlers.append((event, handler))
+
+    def stop(self):
+        """イベントの登録を解除し、キャッシュを破棄"""
+        for event, handler in self._handlers:
+            try:
+                event.remove(handler)
+            except Exception:
+                pass
+        self._handlers.clear()
+        self.invalidate()
+
+    def invalidate(self):
+        """キャッシュを全て破棄"""
+        with self._lock:
+            self._design = None
+            self._entities.clear()
+
+    def discard(self, token: str):
+        """トークンのキャッシュを破棄（エンティティを削除した場合等）"""
+        with self._lock:
+            self._entities.pop(token, None)
+
+    def find(self, design: adsk.fusion.Design, token: str) -> Optional[adsk.core.Base]:
+        """
+        トークンをエンティティに解決
+
+        Args:
+            design: 検索対象のデザイン
+            token: entityToken
+
+        Returns:
+            エンティティ（見つからない場合はNone）
+        """
+        return self.find_all(design, [token])[0]
+
+    def find_all(self, design: adsk.fusion.Design, tokens: Iterable[str]) -> list[Optional[adsk.core.Base]]:
+        """
+        複数のトークンをまとめてエンティティに解決
+
+        キャッシュにない・無効になったトークンのみ design.findEntityByToken() で検索します
+        （同じトークンは1回だけ検索）。
+
+        Args:
+            design: 検索対象のデザイン
+            tokens: entityTokenのリスト
+
+        Returns:
+            トークンと同じ順のエンティティのリスト（見つからないトークンはNone）
+        """
+        tokens = list(tokens)
+        with self._lock:
+            if self._design is None or self._design != design:
+                self._design = design
+                self._entities.clear()
+            cached = {token: self._entities.get(token) for token in tokens}
+
+        resolved = {}
+        for token, entity in cached.items():
+            if entity is not None and getattr(entity, "isValid", True):
+                resolved[token] = entity
+                continue
+            found = design.findEntityByToken(token)
+            resolved[token] = found[0] if found else None
+
+        with self._lock:
+            if self._design is not None and self._design == design:
+                if len(self._entities) + len(resolved) > MAX_ENTRIES:
+                    self._entities.clear()
+                self._entities.update(
+                    (token, entity) for token, entity in resolved.items() if entity is not None
+                )
+
+        return [resolved[token] for token in tokens]
+
+
+# アドイン全体で共有するリゾルバ
+resolver = EntityResolver()
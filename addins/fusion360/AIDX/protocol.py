@@ -1,20 +1,89 @@
 """AIDXプロトコル実装（TCPサーバー側 / Fusion 360）"""
 import socket
+import selectors
 import struct
 import threading
 import queue
 import json
 import os
+import sys
+import time
+import zlib
+from collections import deque
+from concurrent.futures import Executor, Future, wait as wait_futures
 from pathlib import Path
-from typing import Optional, Callable
+from typing import Any, Optional, Callable
 from datetime import datetime
 
+# 任意のバイナリコーデック（インストールされている場合のみ使用）
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import cbor2
+except ImportError:
+    cbor2 = None
+
+# 任意の圧縮ライブラリ（インストールされている場合のみ使用）
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+try:
+    import lz4.frame
+except ImportError:
+    lz4 = None
+
+# 共有メモリ（大きなレスポンスのバルク転送）
+try:
+    from multiprocessing import shared_memory
+except ImportError:
+    shared_memory = None
+
+# POSIXでは3.12以前のSharedMemoryがresource_tracker（sys.executableを起動する子プロセス）に
+# 登録されるため、Fusion 360内蔵Pythonでは追跡を無効化できる3.13以降のみ使用する
+if shared_memory is not None and sys.platform != "win32" and sys.version_info < (3, 13):
+    shared_memory = None
+SHARED_MEMORY_KWARGS = {"track": False} if sys.version_info >= (3, 13) else {}
+
 # プロトコル定数
 AIDX_MAGIC = 0x41494458
-CHUNK_SIZE = 64 * 1024  # 64KB
-RECV_TIMEOUT = 30  # 秒
+AIDX_MAGIC_V2 = 0x41494432  # v2ヘッダ（HELLOでversion 2をネゴシエーションした接続の送信に使用）
+PROTOCOL_VERSION = 2
+# ヘッダ形式（受信はMagicで判別、v1とv2の先頭20バイトのうちMagic・CommandID・Flagsは同じ位置）
+# v1: Magic, CommandID, Flags, Sequence(16bit), Reserved(16bit), PayloadSize(32bit), TotalSize(32bit)
+# v2: Magic, CommandID, Flags, Sequence(32bit), Reserved(32bit), PayloadSize(32bit), TotalSize(64bit)
+HEADER_FORMAT = "<IHHHHII"
+HEADER_FORMAT_V2 = "<IHHIIIQ"
+HEADER_SIZE = struct.calcsize(HEADER_FORMAT)  # 20
+HEADER_SIZE_V2 = struct.calcsize(HEADER_FORMAT_V2)  # 28
+MAX_TOTAL_SIZE = 0xFFFFFFFF  # v1ヘッダで送信できるTotalSizeの上限（v2は64bit）
+CHUNK_SIZE = 64 * 1024  # 64KB（HELLOでネゴシエーションするまでの既定値）
+MAX_CHUNK_SIZE = 4 * 1024 * 1024  # HELLOで受け入れるチャンクサイズの上限
+MIN_CHUNK_SIZE = 1024  # HELLOで受け入れるチャンクサイズの下限
+MAX_IN_FLIGHT = 64  # HELLOで通知する同時実行リクエスト数の上限
+RECV_WINDOW = 8 * 1024 * 1024  # 分割受信のSequenceごとのウィンドウ（CREDITで返すまで送信側が送れるバイト数）
+MAX_REQUEST_SIZE = 1024 * 1024 * 1024  # 分割受信するリクエストのTotalSizeの上限（開始チャンクで拒否）
+MAX_RECV_MEMORY = 2 * 1024 * 1024 * 1024  # 全接続の分割受信バッファの合計の上限（超える開始チャンクは拒否）
+TRANSFER_TTL = 300  # 切断された接続の転送途中の状態をRESUME待ちで保持する時間（秒）
+RECV_BATCH = 64  # 1回の読み込み可能イベントで読み込む最大回数（他の接続を待たせない）
+MAX_CONNECTIONS = 8  # 同時接続数の上限（超過した接続は即座に閉じる）
+SEND_BATCH_FRAMES = 16  # 1回のsendmsgでまとめて送信する最大フレーム数
+SEND_BATCH_BYTES = 256 * 1024  # 1回のsendmsgでまとめる最大バイト数（超えても最低1フレームは送信）
+PRIORITY_MAX_SIZE = 16 * 1024  # これ以下のレスポンスは優先レーンで大きな転送より先に送信
+EXECUTOR_BATCH = 64  # executor使用時に1回でまとめて渡す実行待ちリクエストの最大数
+STOP_EXEC_TIMEOUT = 0.1  # 停止時に実行スレッドの終了を待つ時間（秒、実行中のコマンドの完了は待たない）
+DEADLINE_UNIT = 0.01  # ヘッダのReservedに入る期限（受信時点からの相対時間）の単位: 10ms、0は期限なし
 
-# CommandID
+# CommandID（0xFF00以降は制御コマンド）
+CMD_HELLO = 0xFF00
+CMD_SHM_RELEASE = 0xFF01
+CMD_CANCEL = 0xFF02
+CMD_CREDIT = 0xFF03
+CMD_RESUME = 0xFF04
 CMD_ERROR = 0xFFFF
 
 # Flags (ChunkState: bit 0-1)
@@ -23,6 +92,48 @@ FLAG_START = 0x0001
 FLAG_MIDDLE = 0x0002
 FLAG_END = 0x0003
 
+# Flags (圧縮: bit 2 = 圧縮済み, bit 3-4 = 圧縮コーデック, bit 7 = 圧縮レスポンス受入可)
+FLAG_COMPRESSED = 0x0004
+COMPRESSION_MASK = 0x0018
+COMPRESSION_SHIFT = 3
+FLAG_ACCEPT_COMPRESSION = 0x0080
+
+# Flags (bit 8: ペイロードは共有メモリの記述子 {"name", "offset", "size"})
+FLAG_SHARED_MEMORY = 0x0100
+
+# 圧縮コーデック
+COMPRESSION_ZLIB = 0
+COMPRESSION_ZSTD = 1
+COMPRESSION_LZ4 = 2
+
+# Flags (コンテントタイプ: bit 5-6)
+CONTENT_TYPE_MASK = 0x0060
+CONTENT_TYPE_SHIFT = 5
+
+# コンテントタイプ
+CONTENT_RAW = 0  # 生バイナリ（従来形式のリクエストはJSONテキストとして解釈）
+CONTENT_JSON = 1
+CONTENT_MSGPACK = 2
+CONTENT_CBOR = 3
+
+# HELLOで交換するコンテントタイプ名・圧縮コーデック名
+CONTENT_NAMES = {
+    CONTENT_JSON: "json",
+    CONTENT_MSGPACK: "msgpack",
+    CONTENT_CBOR: "cbor",
+}
+COMPRESSION_NAMES = {
+    COMPRESSION_ZLIB: "zlib",
+    COMPRESSION_ZSTD: "zstd",
+    COMPRESSION_LZ4: "lz4",
+}
+
+COMPRESS_MIN_SIZE = 1024  # これ未満のペイロードは圧縮しない
+COMPRESS_SAMPLE_SIZE = 16 * 1024  # 圧縮効果の事前判定に使う先頭サンプルのサイズ
+COMPRESS_MIN_RATIO = 0.9  # 圧縮後サイズがこの比率以上なら非圧縮で送信
+
+SHARED_MEMORY_MIN_SIZE = 256 * 1024  # これ以上のレスポンスは共有メモリ経由で送信（HELLOで有効化時）
+
 # エラーコード
 ERR_PARSE_ERROR = 0x1000
 ERR_INVALID_COMMAND = 0x1001
@@ -30,11 +141,22 @@ ERR_INVALID_PAYLOAD = 0x1002
 ERR_INVALID_SEQUENCE = 0x1003
 ERR_EXECUTION_ERROR = 0x2000
 ERR_TIMEOUT = 0x3000
+ERR_RESOURCE_BUSY = 0x3001
 
 # ログファイルパス（Windowsの場合はTempディレクトリ）
 LOG_FILE = Path(os.environ.get("TEMP", "/tmp")) / "aidx_fusion360.log"
 LOG_ERROR_FILE = Path(os.environ.get("TEMP", "/tmp")) / "aidx_fusion360_error.log"
 
+# Unixドメインソケットのパス（同一マシン上のMCPサーバーからの接続用、AF_UNIX対応環境のみ）
+SOCKET_PATH = Path(os.environ.get("TEMP", "/tmp")) / "aidx_fusion360.sock"
+
+# セレクタに登録するソケットの種別（接続ソケットには_ClientConnectionを登録）
+_LISTENER = "listener"
+_WAKEUP = "wakeup"
+
+# ハンドラを実行中のスレッドごとのリクエスト期限・接続（remaining_time() / current_connection()で参照）
+_execution_context = threading.local()
+
 
 def _log(message: str):
     """ファイルにログ出力"""
@@ -54,6 +176,165 @@ def _log(message: str):
             pass
 
 
+def _content_codecs() -> dict[int, tuple[Callable[[Any], bytes], Callable[[bytes], Any]]]:
+    """利用可能なコンテントコーデック（コンテントタイプ → (エンコード関数, デコード関数)）"""
+    codecs = {
+        CONTENT_JSON: (
+            lambda obj: json.dumps(obj, ensure_ascii=False).encode("utf-8"),
+            json.loads,
+        ),
+    }
+    if msgpack is not None:
+        # floatは8バイトのバイナリ（float64）としてそのまま格納される
+        codecs[CONTENT_MSGPACK] = (
+            lambda obj: msgpack.packb(obj, use_bin_type=True),
+            lambda data: msgpack.unpackb(data, raw=False),
+        )
+    if cbor2 is not None:
+        codecs[CONTENT_CBOR] = (cbor2.dumps, cbor2.loads)
+    return codecs
+
+
+CONTENT_CODECS = _content_codecs()
+
+
+def decode_request(payload: bytes, flags: int, cmd_id: int = 0, seq: int = 0) -> Any:
+    """
+    リクエストペイロードをFlagsのコンテントタイプに従ってデコード
+
+    空のペイロードは空のdictになります。生バイナリ（従来形式）はJSONテキストとして解釈します。
+    """
+    if len(payload) == 0:
+        return {}
+
+    content_type = (flags & CONTENT_TYPE_MASK) >> CONTENT_TYPE_SHIFT
+    if content_type == CONTENT_RAW:
+        content_type = CONTENT_JSON
+
+    if content_type not in CONTENT_CODECS:
+        raise AIDXProtocolError(
+            ERR_INVALID_PAYLOAD,
+            f"Unsupported content type: {content_type}",
+            cmd_id,
+            seq
+        )
+
+    try:
+        return CONTENT_CODECS[content_type][1](payload)
+    except Exception as e:
+        raise AIDXProtocolError(
+            ERR_INVALID_PAYLOAD,
+            f"Failed to decode payload (content type {content_type}): {type(e).__name__}: {e}",
+            cmd_id,
+            seq
+        )
+
+
+def encode_response(result: Any, content_type: int) -> tuple[bytes, int]:
+    """
+    ハンドラの戻り値をエンコード
+
+    Returns:
+        (ペイロード, コンテントタイプ) のタプル。bytes系の戻り値は生バイナリのまま
+    """
+    if isinstance(result, (bytes, bytearray, memoryview)):
+        return result, CONTENT_RAW
+
+    if content_type not in CONTENT_CODECS:
+        content_type = CONTENT_JSON
+    return CONTENT_CODECS[content_type][0](result), content_type
+
+
+def _compressors() -> dict[int, tuple[Callable[[bytes], bytes], Callable[[bytes], bytes]]]:
+    """利用可能な圧縮コーデック（コーデックID → (圧縮関数, 展開関数)）"""
+    codecs = {
+        COMPRESSION_ZLIB: (lambda data: zlib.compress(data, 1), zlib.decompress),
+    }
+    if zstandard is not None:
+        codecs[COMPRESSION_ZSTD] = (
+            lambda data: zstandard.ZstdCompressor().compress(data),
+            lambda data: zstandard.ZstdDecompressor().decompress(data),
+        )
+    if lz4 is not None:
+        codecs[COMPRESSION_LZ4] = (lz4.frame.compress, lz4.frame.decompress)
+    return codecs
+
+
+COMPRESSORS = _compressors()
+
+
+def compress_payload(payload: bytes, codec: int) -> Optional[bytes]:
+    """
+    ペイロードを圧縮
+
+    小さいペイロード、および先頭サンプルの圧縮効果が乏しいもの（PNG等の圧縮済みデータ）は圧縮しません。
+
+    Returns:
+        圧縮後のデータ、または圧縮しない場合None
+    """
+    if len(payload) < COMPRESS_MIN_SIZE or codec not in COMPRESSORS:
+        return None
+
+    compress = COMPRESSORS[codec][0]
+    if len(payload) > COMPRESS_SAMPLE_SIZE:
+        sample = memoryview(payload)[:COMPRESS_SAMPLE_SIZE]
+        if len(compress(sample)) >= len(sample) * COMPRESS_MIN_RATIO:
+            return None
+
+    compressed = compress(payload)
+    if len(compressed) >= len(payload) * COMPRESS_MIN_RATIO:
+        return None
+    return compressed
+
+
+def decompress_payload(payload: bytes, flags: int, cmd_id: int = 0, seq: int = 0) -> bytes:
+    """Flagsの圧縮ビットに従ってペイロードを展開"""
+    if not flags & FLAG_COMPRESSED:
+        return payload
+
+    codec = (flags & COMPRESSION_MASK) >> COMPRESSION_SHIFT
+    if codec not in COMPRESSORS:
+        raise AIDXProtocolError(
+            ERR_INVALID_PAYLOAD,
+            f"Unsupported compression codec: {codec}",
+            cmd_id,
+            seq
+        )
+
+    try:
+        return COMPRESSORS[codec][1](payload)
+    except Exception as e:
+        raise AIDXProtocolError(
+            ERR_INVALID_PAYLOAD,
+            f"Failed to decompress payload (codec {codec}): {e}",
+            cmd_id,
+            seq
+        )
+
+
+def remaining_time() -> Optional[float]:
+    """
+    実行中のリクエストの残り時間（秒）
+
+    コマンドハンドラから呼び出し、長い処理を途中で打ち切る判断に使います。
+    期限のないリクエスト、またはハンドラの外ではNoneを返します。期限切れなら0以下です。
+    """
+    deadline = getattr(_execution_context, "deadline", None)
+    if deadline is None:
+        return None
+    return deadline - time.monotonic()
+
+
+def current_connection() -> Any:
+    """
+    実行中のリクエストを送信した接続
+
+    接続ごとにCADの状態を変更するコマンドが、AIDXServer.add_close_handler()で登録した後処理と
+    対応付けるために使います（値は接続の識別にのみ使用）。ハンドラの外ではNoneを返します。
+    """
+    return getattr(_execution_context, "connection", None)
+
+
 class AIDXProtocolError(Exception):
     """AIDXプロトコルエラー"""
     def __init__(self, code: int, message: str, cmd_id: int = 0, seq: int = 0):
@@ -64,138 +345,845 @@ class AIDXProtocolError(Exception):
         self.seq = seq
 
 
+class _ClientConnection:
+    """
+    クライアント接続ごとの状態（ソケット・受信中のフレーム・分割受信バッファ・送信待ちレスポンス）
+
+    ソケットはノンブロッキングで、受信・送信ともI/Oスレッドのイベントループで処理します。
+    """
+
+    def __init__(
+        self,
+        sock: socket.socket,
+        addr,
+        encode_queue: queue.Queue,
+        on_ready: Callable[["_ClientConnection"], None]
+    ):
+        self.sock = sock
+        self.addr = addr
+        self.closed = False
+        # 受信用の固定バッファ（ヘッダ / 不正ペイロードの読み捨て）
+        self.header_buf = bytearray(HEADER_SIZE_V2)
+        self.discard_buf = bytearray(CHUNK_SIZE)
+        # 受信中のフレーム（受信先バッファ・受信済みバイト数・バッファが埋まった時の処理）
+        self.recv_view = memoryview(self.header_buf)[:HEADER_SIZE]
+        self.recv_filled = 0
+        self.on_received: Optional[Callable[["_ClientConnection"], None]] = None
+        # 分割受信バッファ（Sequence → {total_size, buffer, received_size}）
+        self.recv_buffers: dict[int, dict] = {}
+        # 実行待ち・実行中・送信待ちのリクエスト（Sequence → _Request、I/Oスレッドのみ使用、CANCEL用）
+        self.requests: dict[int, _Request] = {}
+        # 送信チャンクサイズ（HELLOでネゴシエーション）
+        self.chunk_size = CHUNK_SIZE
+        # 送信するヘッダのバージョン（HELLOでversion 2をネゴシエーションした接続のみv2）
+        self.header_version = 1
+        # 共有メモリによるバルク転送（HELLOで有効化）
+        self.shared_memory = False
+        # クレジットによるフロー制御（HELLOで有効化）
+        # send_window: クライアントの受信ウィンドウ（分割送信するレスポンスの初期クレジット）
+        self.flow_control = False
+        self.send_window = 0
+        # クライアントのセッションID（HELLOで通知、切断後も同じセッションの再接続で転送を再開できる）
+        self.session: Optional[str] = None
+        # クライアントの解放待ちの共有メモリ（名前 → SharedMemory）
+        self.shm_segments: dict[str, Any] = {}
+        self.shm_lock = threading.Lock()
+        # エンコード待ちレスポンス（サーバー共通のキュー、(接続, _OutgoingResponse)）
+        self.encode_queue = encode_queue
+        # エンコード済みレスポンスをreadyへ追加した後の通知（I/Oスレッドへ送信を依頼）
+        self.on_ready = on_ready
+        # エンコード済みレスポンス（エンコードスレッド → I/Oスレッド）
+        self.ready: deque[_OutgoingResponse] = deque()
+        # 送信中のレスポンス（I/Oスレッドのみ使用）
+        # priority: PRIORITY_MAX_SIZE以下の小さなレスポンス（制御・エラー・Ping等）、activeより先に送信
+        # active: 大きなレスポンス（チャンク単位で交互に送信）
+        self.priority: deque[_OutgoingResponse] = deque()
+        self.active: deque[_OutgoingResponse] = deque()
+        # クレジット切れで送信を止めているレスポンス（Sequence → _OutgoingResponse、CREDITで再開）
+        self.blocked: dict[int, _OutgoingResponse] = {}
+        # send_viewsにフレームを積んだレスポンス（最終フレームが送信途中のまま切断された場合の再開用）
+        self.batch: list[_OutgoingResponse] = []
+        # 送信途中のバッファ列（I/Oスレッドのみ使用）
+        self.send_views: deque[memoryview] = deque()
+        # 書き込み可能イベントを待機中か（送信バッファが一杯の間のみ）
+        self.want_write = False
+
+    def enqueue_response(
+        self,
+        cmd_id: int,
+        seq: int,
+        result: Any,
+        compression: Optional[int] = None,
+        content_type: int = CONTENT_JSON,
+        request: Optional["_Request"] = None,
+        inline: bool = False
+    ):
+        """
+        レスポンスをエンコードキューに追加（切断済みの場合は破棄）
+
+        Args:
+            result: ハンドラの戻り値（bytesは生バイナリ、それ以外はcontent_typeでエンコード）
+            compression: 圧縮コーデックID（Noneなら非圧縮）
+            content_type: レスポンスのコンテントタイプ
+            request: 応答元のリクエスト（CANCEL済みなら送信前に破棄）
+            inline: 呼び出し元のスレッドでエンコードする（制御・エラー・Ping等の小さなレスポンスが
+                エンコードスレッドで大きなレスポンスの後ろに並ばないように）
+        """
+        if self.closed and (request is None or self.session is None):
+            _log(f"Discarding response for closed connection: CMD=0x{cmd_id:04X}, Seq={seq}")
+            return
+        response = _OutgoingResponse(
+            cmd_id, seq, result, compression, content_type, self.chunk_size,
+            self if self.shared_memory else None, request,
+            self.send_window if self.flow_control else None,
+            MAX_TOTAL_SIZE if self.header_version == 1 else None
+        )
+        if not inline or self.closed:
+            # 切断済みでもセッションがあれば、エンコードスレッド経由でRESUME待ちとして保持される
+            self.encode_queue.put((self, response))
+            return
+        response.prepare()
+        self.ready.append(response)
+        self.on_ready(self)
+
+    def put_shared_memory(self, payload) -> Optional[dict]:
+        """
+        ペイロードを共有メモリへ書き込む（エンコードスレッドで実行）
+
+        共有メモリはクライアントがCMD_SHM_RELEASEで解放するか、切断時に解放されます。
+
+        Returns:
+            記述子 {"name", "offset", "size"}、または作成できなかった場合None
+        """
+        size = len(payload)
+        try:
+            shm = shared_memory.SharedMemory(create=True, size=size, **SHARED_MEMORY_KWARGS)
+        except Exception as e:
+            _log(f"Failed to create shared memory ({size} bytes): {type(e).__name__}: {e}")
+            return None
+        shm.buf[:size] = payload
+
+        with self.shm_lock:
+            self.shm_segments[shm.name] = shm
+        if self.closed:
+            self.release_shared_memory(shm.name)
+        return {"name": shm.name, "offset": 0, "size": size}
+
+    def release_shared_memory(self, name: str) -> bool:
+        """共有メモリを解放（クライアントがマップ済み、または切断時）"""
+        with self.shm_lock:
+            shm = self.shm_segments.pop(name, None)
+        if shm is None:
+            return False
+        try:
+            shm.close()
+            shm.unlink()
+        except Exception as e:
+            _log(f"Failed to release shared memory {name}: {type(e).__name__}: {e}")
+        return True
+
+    def close(self):
+        """接続を閉じ、未送信のレスポンスと共有メモリを破棄（I/Oスレッドで実行）"""
+        if self.closed:
+            return
+        self.closed = True
+        try:
+            self.sock.close()
+        except:
+            pass
+        self.ready.clear()
+        self.priority.clear()
+        self.active.clear()
+        self.blocked.clear()
+        self.batch.clear()
+        self.send_views.clear()
+        # 受信途中のバッファへの参照を外す（RESUMEで引き継いだ分割受信バッファを拡張できるように）
+        self.recv_view = memoryview(self.header_buf)[:0]
+        for name in list(self.shm_segments):
+            self.release_shared_memory(name)
+
+
+class _OutgoingResponse:
+    """送信中のレスポンス（接続のチャンクサイズ単位でフレームを切り出す）"""
+
+    def __init__(
+        self,
+        cmd_id: int,
+        seq: int,
+        result: Any,
+        compression: Optional[int] = None,
+        content_type: int = CONTENT_JSON,
+        chunk_size: int = CHUNK_SIZE,
+        shm_conn: Optional[_ClientConnection] = None,
+        request: Optional["_Request"] = None,
+        credit: Optional[int] = None,
+        max_total_size: Optional[int] = MAX_TOTAL_SIZE
+    ):
+        self.cmd_id = cmd_id
+        self.seq = seq
+        self.chunk_size = chunk_size
+        # 応答元のリクエスト（CANCEL済みかの判定に使用、制御コマンド・プロトコルエラーではNone）
+        self.request = request
+        # 共有メモリ転送に使用する接続（Noneなら無効）
+        self.shm_conn = shm_conn
+        # ハンドラの戻り値（prepare()でエンコードされる）
+        self.result = result
+        self.compression = compression
+        self.content_type = content_type
+        # 全フレームに共通で立てるFlags（コンテントタイプ・圧縮ビット）
+        self.extra_flags = 0
+        self.view: Optional[memoryview] = None
+        # 共有メモリ経由で送信する場合の共有メモリ名
+        self.shm_name: Optional[str] = None
+        self.total_size = 0
+        self.offset = 0
+        self.done = False
+        # 分割送信で送信できる残りバイト数（クライアントがCREDITで追加、Noneならフロー制御なし）
+        self.credit = credit
+        # ヘッダで表せるTotalSizeの上限（v1ヘッダの接続のみ、Noneなら上限なし）
+        self.max_total_size = max_total_size
+
+    @property
+    def cancelled(self) -> bool:
+        """応答元のリクエストがCANCEL済みか（以降のフレームは送信しない）"""
+        return self.request is not None and self.request.cancelled
+
+    def prepare(self):
+        """
+        送信開始前の準備（エンコードスレッドで実行）
+
+        ハンドラの戻り値をエンコード・圧縮し、TotalSizeを確定します。
+        エンコードできない戻り値はエラーレスポンスに置き換えます。
+        共有メモリが有効な接続では、大きなペイロードを共有メモリへ書き込み、記述子のみを送信します。
+        v1ヘッダの接続でTotalSizeが32bitに収まらないレスポンスはエラーレスポンスに置き換えます。
+        """
+        self._encode()
+        if self.max_total_size is not None and self.total_size > self.max_total_size:
+            _log(f"Response too large for v1 header: Seq={self.seq}, {self.total_size} bytes")
+            payload, content_type = self._error_payload(
+                f"Response too large for protocol version 1: {self.total_size} > {self.max_total_size} bytes"
+            )
+            self.extra_flags = content_type << CONTENT_TYPE_SHIFT
+            self.view = memoryview(payload)
+            self.total_size = len(payload)
+
+    def _encode(self):
+        """ハンドラの戻り値をエンコードし、共有メモリへの書き込み・圧縮を行う"""
+        try:
+            payload, content_type = encode_response(self.result, self.content_type)
+        except Exception as e:
+            _log(f"Failed to encode response for Seq={self.seq}: {type(e).__name__}: {e}")
+            payload, content_type = self._error_payload(f"Failed to encode response: {type(e).__name__}: {e}")
+        self.result = None
+
+        self.extra_flags = content_type << CONTENT_TYPE_SHIFT
+        self.view = memoryview(payload).cast("B")
+        self.total_size = len(self.view)
+
+        if self.shm_conn is not None and self.total_size >= SHARED_MEMORY_MIN_SIZE:
+            descriptor = self.shm_conn.put_shared_memory(self.view)
+            if descriptor is not None:
+                self.shm_name = descriptor["name"]
+                self.extra_flags |= FLAG_SHARED_MEMORY
+                self.view = memoryview(json.dumps(descriptor).encode("utf-8"))
+                self.total_size = len(self.view)
+                return
+
+        if self.compression is None:
+            return
+        compressed = compress_payload(payload, self.compression)
+        if compressed is None:
+            return
+        self.extra_flags |= FLAG_COMPRESSED | (self.compression << COMPRESSION_SHIFT)
+        self.view = memoryview(compressed)
+        self.total_size = len(compressed)
+
+    def _error_payload(self, message: str) -> tuple[bytes, int]:
+        """送信できないレスポンスをエラーレスポンス（ERR_EXECUTION_ERROR）に置き換える"""
+        error = {
+            "ErrorCode": ERR_EXECUTION_ERROR,
+            "Message": message,
+            "OriginalCommandID": self.cmd_id,
+            "OriginalSequence": self.seq
+        }
+        self.cmd_id = CMD_ERROR
+        return encode_response(error, CONTENT_JSON)
+
+    def has_credit(self) -> bool:
+        """次のフレームを送信できるだけのクレジットがあるか（単一パケットはクレジット不要）"""
+        if self.credit is None or self.total_size <= self.chunk_size:
+            return True
+        return self.credit >= min(self.chunk_size, self.total_size - self.offset)
+
+    def next_frame(self) -> tuple[int, memoryview]:
+        """
+        次に送信するフレームを取得
+
+        Returns:
+            (Flags, チャンク) のタプル
+        """
+        total_size = self.total_size
+
+        if total_size <= self.chunk_size:
+            # 単一パケット
+            self.done = True
+            return FLAG_SINGLE | self.extra_flags, self.view
+
+        chunk_size = min(self.chunk_size, total_size - self.offset)
+        chunk = self.view[self.offset:self.offset + chunk_size]
+
+        # Flags算出
+        if self.offset == 0:
+            flags = FLAG_START
+        elif self.offset + chunk_size >= total_size:
+            flags = FLAG_END
+        else:
+            flags = FLAG_MIDDLE
+
+        self.offset += chunk_size
+        self.done = self.offset >= total_size
+        if self.credit is not None:
+            self.credit -= chunk_size
+        return flags | self.extra_flags, chunk
+
+
+class _Request:
+    """受信済みリクエスト（実行待ち）"""
+
+    def __init__(
+        self,
+        conn: _ClientConnection,
+        cmd_id: int,
+        seq: int,
+        request: Any,
+        compression: Optional[int] = None,
+        content_type: int = CONTENT_JSON,
+        deadline: Optional[float] = None
+    ):
+        self.conn = conn
+        self.cmd_id = cmd_id
+        self.seq = seq
+        # デコード済みリクエスト
+        self.request = request
+        # レスポンスに使う圧縮コーデック（Noneなら非圧縮）
+        self.compression = compression
+        # レスポンスのコンテントタイプ（リクエストと同じ形式、従来形式にはJSON）
+        self.content_type = content_type
+        # 実行期限（time.monotonic()基準、Noneなら期限なし）
+        self.deadline = deadline
+        # 実行状態（startedは実行スレッド、cancelledはI/OスレッドがCANCEL受信時に設定）
+        self.started = False
+        self.finished = False
+        self.cancelled = False
+        # 接続断後に完了したレスポンス（RESUMEで再接続した接続へ送信、I/Oスレッドのみ使用）
+        self.orphaned_response: Optional[_OutgoingResponse] = None
+
+
 class AIDXServer:
-    """AIDXプロトコルサーバー（分割送受信対応）"""
+    """
+    AIDXプロトコルサーバー（分割送受信対応）
 
-    def __init__(self, host: str = "127.0.0.1", port: int = 8109):
+    処理は3段構成です:
+    - 受信: I/Oスレッドのイベントループ（selectors）が全接続のフレームをノンブロッキングで読み取り、
+      再構築済みリクエストを実行キューへ積む
+    - 実行: CAD APIを呼ぶハンドラは専用スレッドで1件ずつ実行（thread_safeなハンドラはI/Oスレッドで即時実行）。
+      executorを指定した場合は、専用スレッドが実行待ちのリクエストをまとめてexecutor（メインスレッド等）へ渡す
+    - 送信: 完了したレスポンスをエンコードスレッドでエンコード・圧縮し、I/Oスレッドがリクエスト元の
+      接続へ完了順に送信する。分割送信中の複数レスポンスはチャンク単位で交互に送り、
+      小さなレスポンス（制御・エラー・Ping等）は優先レーンで大きな転送のチャンクより先に送る
+
+    複数のクライアントが同時に接続できます（MAX_CONNECTIONSまで）。待機中の接続はスレッドを持たず、
+    イベントループに登録されたソケットのみです。実行段は全接続で共有するため、
+    CAD APIの呼び出しは接続数によらず直列化されます。
+    """
+
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 8109,
+        socket_path: Optional[str] = None,
+        executor: Optional[Executor] = None
+    ):
         self.host = host
         self.port = port
+        # Unixドメインソケットのパス（指定時はTCPと併せて待ち受け）
+        self.socket_path = socket_path
         self.server_socket: Optional[socket.socket] = None
-        self.client_socket: Optional[socket.socket] = None
+        self.unix_socket: Optional[socket.socket] = None
         self.running = False
+        # I/Oスレッド（イベントループ）
         self.thread: Optional[threading.Thread] = None
+        self._selector: Optional[selectors.BaseSelector] = None
+        # イベントループの起床用ソケット対（他スレッドから1バイト書き込む）
+        self._wakeup_r: Optional[socket.socket] = None
+        self._wakeup_w: Optional[socket.socket] = None
+
+        # コマンドディスパッチャ（CommandID → Callable[[デコード済みリクエスト], レスポンス]）
+        self.command_handlers: dict[int, Callable[[Any], Any]] = {}
+
+        # CAD APIを使用しない（I/Oスレッドで即時実行できる）コマンド
+        self._thread_safe_commands: set[int] = set()
+
+        # ペイロードをデコードせず生バイナリ（bytearray）のまま受け取るコマンド
+        self._raw_payload_commands: set[int] = set()
+
+        # 制御コマンド（CommandID → Callable[[接続, デコード済みリクエスト], レスポンス]）
+        # 接続状態を操作するため、I/Oスレッドで即時実行する（Noneを返すコマンドには応答しない）
+        self._control_handlers: dict[int, Callable[[_ClientConnection, Any], Any]] = {
+            CMD_HELLO: self._handle_hello,
+            CMD_SHM_RELEASE: self._handle_shm_release,
+            CMD_CANCEL: self._handle_cancel,
+            CMD_CREDIT: self._handle_credit,
+            CMD_RESUME: self._handle_resume,
+        }
+
+        # 実行待ちリクエスト（_Request / 接続が閉じられた時の後処理、終了時はNone）
+        self._request_queue: queue.Queue = queue.Queue()
+        self._exec_thread: Optional[threading.Thread] = None
+        # CAD APIを呼ぶハンドラの実行先（Noneなら実行スレッドで直接実行）
+        # CAD APIがメインスレッドでのみ安全に呼べる場合は、メインスレッドで実行するExecutorを渡す
+        self._executor = executor
 
-        # コマンドディスパッチャ（CommandID → Callable[[bytes], bytes]）
-        self.command_handlers: dict[int, Callable[[bytes], bytes]] = {}
+        # エンコード待ちレスポンス（(接続, _OutgoingResponse)、終了時はNone）
+        self._encode_queue: queue.Queue = queue.Queue()
+        self._encoder_thread: Optional[threading.Thread] = None
+        # エンコード済みレスポンスがある接続（エンコードスレッド → I/Oスレッド）
+        self._flush_queue: deque[_ClientConnection] = deque()
 
-        # 分割受信バッファ（Sequence → {total_size, chunks, received_size}）
-        self._recv_buffers: dict[int, dict] = {}
+        # 切断された接続の転送途中の状態（(セッションID, Sequence) → (期限, 状態, 対象)、I/Oスレッドのみ使用）
+        # 状態: receiving（受信途中のバッファ） / sending（送信途中のレスポンス） / executing（実行中のリクエスト）
+        self._orphans: dict[tuple[str, int], tuple[float, str, Any]] = {}
+        # 切断された接続宛てに完了したレスポンス（エンコードスレッド → I/Oスレッド）
+        self._orphaned_responses: deque[_OutgoingResponse] = deque()
 
-    def register_command(self, cmd_id: int, handler: Callable[[bytes], bytes]):
-        """コマンドハンドラを登録"""
+        # 接続が閉じられた時の後処理（Callable[[接続], None]、実行段で呼ぶ）
+        self._close_handlers: list[Callable[[Any], None]] = []
+
+        # 接続中のクライアント（I/Oスレッドのみ変更）
+        self._connections: set[_ClientConnection] = set()
+        # 最後に接続したクライアント（send_response用）
+        self._conn: Optional[_ClientConnection] = None
+
+    def register_command(
+        self,
+        cmd_id: int,
+        handler: Callable[[Any], Any],
+        thread_safe: bool = False,
+        raw_payload: bool = False
+    ):
+        """
+        コマンドハンドラを登録
+
+        Args:
+            cmd_id: コマンドID
+            handler: ハンドラ（デコード済みリクエスト → レスポンスオブジェクトまたはbytes）
+            thread_safe: CAD APIを使用せず、実行スレッドを待たずに即時実行してよい場合True
+            raw_payload: ペイロードをデコードせずbytearrayのまま渡す場合True（ファイル転送等）
+        """
         self.command_handlers[cmd_id] = handler
+        if thread_safe:
+            self._thread_safe_commands.add(cmd_id)
+        else:
+            self._thread_safe_commands.discard(cmd_id)
+        if raw_payload:
+            self._raw_payload_commands.add(cmd_id)
+        else:
+            self._raw_payload_commands.discard(cmd_id)
+
+    def add_close_handler(self, handler: Callable[[Any], None]):
+        """
+        接続が閉じられた時の後処理を登録
+
+        接続ごとにCADの状態を変更するコマンド（再計算の保留等）が、クライアントの切断時に状態を戻すために使用します。
+        ハンドラはコマンドと同じ実行段（executor指定時はそのexecutor）で、閉じられた接続
+        （実行中に current_connection() が返した値）を引数に呼ばれます。
+        stop() では全ての接続について、stop() を呼び出したスレッドでNoneを引数に呼ばれます。
+
+        Args:
+            handler: 後処理（接続 → None）
+        """
+        self._close_handlers.append(handler)
+
+    def run_command(self, cmd_id: int, request: Any) -> Any:
+        """
+        登録済みのコマンドハンドラを呼び出す（BATCH等、実行中のコマンドから他のコマンドを実行）
+
+        呼び出し元のスレッドでそのまま実行します。生バイナリを受け取るコマンドは対象外です。
+
+        Args:
+            cmd_id: コマンドID
+            request: デコード済みのリクエスト
+
+        Returns:
+            ハンドラの戻り値
+
+        Raises:
+            AIDXProtocolError: 未登録のコマンド、または生バイナリを受け取るコマンドの場合
+        """
+        handler = self.command_handlers.get(cmd_id)
+        if handler is None:
+            raise AIDXProtocolError(ERR_INVALID_COMMAND, f"Unknown command: 0x{cmd_id:04X}", cmd_id)
+        if cmd_id in self._raw_payload_commands:
+            raise AIDXProtocolError(
+                ERR_INVALID_COMMAND,
+                f"Command 0x{cmd_id:04X} takes a raw payload and cannot be run from another command",
+                cmd_id
+            )
+        return handler(request)
 
     def start(self):
-        """TCPサーバーを起動（バックグラウンドスレッド）"""
+        """サーバーを起動（待ち受けソケットを開き、I/O・エンコード・実行スレッドを起動）"""
         if self.running:
             return
 
         _log(f"AIDXServer starting on {self.host}:{self.port}")
+        try:
+            self._open_listeners()
+        except Exception as e:
+            _log(f"FATAL: Failed to start server: {type(e).__name__}: {e}")
+            self._close_listeners()
+            return
+
         self.running = True
-        self.thread = threading.Thread(target=self._server_loop, daemon=False)
+        self._exec_thread = threading.Thread(target=self._execution_loop, daemon=True)
+        self._exec_thread.start()
+        self._encoder_thread = threading.Thread(target=self._encoder_loop, daemon=True)
+        self._encoder_thread.start()
+        self.thread = threading.Thread(target=self._io_loop, daemon=False)
         self.thread.start()
         _log("AIDXServer thread started")
 
-        # スレッドが実際に起動するまで待機
-        import time
-        time.sleep(0.1)
-        _log(f"Thread is alive: {self.thread.is_alive()}")
-
     def stop(self):
-        """TCPサーバーを停止"""
+        """
+        サーバーを停止（イベントループを起こして即座に終了させる）
+
+        実行中のコマンドの完了は待ちません（STOP_EXEC_TIMEOUT秒だけ待って戻ります）。
+        実行スレッドはデーモンスレッドのため、実行中のコマンドは裏で完了し、その結果は破棄されます。
+        """
+        if not self.running:
+            return
         self.running = False
-        if self.client_socket:
+        self._wake()
+        if self.thread:
+            self.thread.join(timeout=5)
+        if self._encoder_thread:
+            self._encode_queue.put(None)
+            self._encoder_thread.join(timeout=5)
+        if self._exec_thread:
+            # 実行待ちのリクエストを破棄して実行ループを終了させる（実行中のコマンドは待たない）
+            while True:
+                try:
+                    self._request_queue.get_nowait()
+                except queue.Empty:
+                    break
+            self._request_queue.put(None)
+            self._exec_thread.join(timeout=STOP_EXEC_TIMEOUT)
+        # 実行待ちの後処理は破棄したため、全ての接続についてまとめて呼ぶ
+        self._run_close_handlers(None)
+
+    def _open_listeners(self):
+        """待ち受けソケット（TCP / Unixドメインソケット）と起床用ソケット対を開き、セレクタへ登録"""
+        self._selector = selectors.DefaultSelector()
+
+        self._wakeup_r, self._wakeup_w = socket.socketpair()
+        self._wakeup_r.setblocking(False)
+        self._wakeup_w.setblocking(False)
+        self._selector.register(self._wakeup_r, selectors.EVENT_READ, _WAKEUP)
+
+        self.server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        _log(f"Attempting to bind to {self.host}:{self.port}...")
+        self.server_socket.bind((self.host, self.port))
+        _log("Bind successful")
+        self.server_socket.listen(MAX_CONNECTIONS)
+        self.server_socket.setblocking(False)
+        self._selector.register(self.server_socket, selectors.EVENT_READ, _LISTENER)
+        _log(f"Server listening on {self.host}:{self.port}")
+
+        if self.socket_path and hasattr(socket, "AF_UNIX"):
             try:
-                self.client_socket.close()
-            except:
-                pass
-        if self.server_socket:
+                self.unix_socket = self._bind_unix_socket(self.socket_path)
+                self._selector.register(self.unix_socket, selectors.EVENT_READ, _LISTENER)
+                _log(f"Server listening on {self.socket_path}")
+            except OSError as e:
+                # Unixドメインソケットが使えなくてもTCPで継続
+                _log(f"Failed to bind unix socket {self.socket_path}: {type(e).__name__}: {e}")
+                self.unix_socket = None
+
+    def _close_listeners(self):
+        """待ち受けソケット・起床用ソケット対・セレクタを閉じる"""
+        for sock in (self.server_socket, self.unix_socket, self._wakeup_r, self._wakeup_w):
+            if sock is not None:
+                try:
+                    sock.close()
+                except:
+                    pass
+        if self.unix_socket is not None:
             try:
-                self.server_socket.close()
+                os.unlink(self.socket_path)
             except:
                 pass
-        if self.thread:
-            self.thread.join(timeout=5)
+        if self._selector is not None:
+            self._selector.close()
+        self.server_socket = None
+        self.unix_socket = None
+        self._wakeup_r = None
+        self._wakeup_w = None
+        self._selector = None
+
+    def _bind_unix_socket(self, path: str) -> socket.socket:
+        """Unixドメインソケットで待ち受け（前回異常終了時に残ったソケットファイルは削除）"""
+        if os.path.exists(path):
+            os.unlink(path)
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.bind(path)
+        sock.listen(MAX_CONNECTIONS)
+        sock.setblocking(False)
+        return sock
+
+    def _response_ready(self, conn: _ClientConnection):
+        """エンコード済みレスポンスの送信をI/Oスレッドへ依頼（任意のスレッドから呼び出し可）"""
+        self._flush_queue.append(conn)
+        if threading.current_thread() is not self.thread:
+            # I/Oスレッドからの呼び出しは現在のイベント処理後に送信されるため起こさない
+            self._wake()
+
+    def _wake(self):
+        """イベントループを起こす（任意のスレッドから呼び出し可）"""
+        try:
+            self._wakeup_w.send(b"\0")
+        except (AttributeError, OSError):
+            # 起床済み（送信バッファが一杯）、または停止済み
+            pass
+
+    def _io_loop(self):
+        """
+        イベントループ（I/Oスレッドで実行）
 
-    def _server_loop(self):
-        """サーバーループ（バックグラウンドスレッドで実行）"""
-        _log("_server_loop started")
+        タイムアウトなしでイベントを待ち、接続受付・受信・送信を処理します。
+        停止時やエンコード済みレスポンスの到着時は起床用ソケットで即座に起こされます。
+        """
+        _log("_io_loop started")
         try:
-            self.server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            self.server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-            _log(f"Attempting to bind to {self.host}:{self.port}...")
-            self.server_socket.bind((self.host, self.port))
-            _log("Bind successful")
-            self.server_socket.listen(1)
-            self.server_socket.settimeout(1.0)  # accept()のタイムアウト
-            _log(f"Server listening on {self.host}:{self.port}")
+            while self.running:
+                for key, events in self._selector.select():
+                    if key.data is _WAKEUP:
+                        self._drain_wakeup()
+                    elif key.data is _LISTENER:
+                        self._accept_connection(key.fileobj)
+                    else:
+                        conn = key.data
+                        if events & selectors.EVENT_READ:
+                            self._on_readable(conn)
+                        if events & selectors.EVENT_WRITE and not conn.closed:
+                            self._flush(conn)
+
+                # 切断された接続宛てのレスポンスを再接続先へ引き継ぐか保持
+                while self._orphaned_responses:
+                    self._adopt_orphaned_response(self._orphaned_responses.popleft())
+
+                # エンコード済みレスポンスの送信
+                while self._flush_queue:
+                    conn = self._flush_queue.popleft()
+                    if not conn.closed:
+                        self._flush(conn)
+                    elif conn.session is not None:
+                        # 切断と入れ違いにエンコードが完了したレスポンス
+                        while conn.ready:
+                            self._adopt_orphaned_response(conn.ready.popleft())
         except Exception as e:
-            _log(f"FATAL: Failed to start server: {type(e).__name__}: {e}")
+            _log(f"Unexpected error in event loop: {type(e).__name__}: {e}")
+            import traceback
+            _log(traceback.format_exc())
+        finally:
+            for conn in list(self._connections):
+                self._close_connection(conn)
+            self._close_listeners()
+            self.running = False
+        _log("Event loop exited")
+
+    def _drain_wakeup(self):
+        """起床用ソケットに溜まったバイトを読み捨てる"""
+        try:
+            while self._wakeup_r.recv(4096):
+                pass
+        except (BlockingIOError, InterruptedError):
+            pass
+
+    def _accept_connection(self, listener: socket.socket):
+        """接続を受け付け、イベントループへ登録"""
+        try:
+            client_socket, addr = listener.accept()
+        except (BlockingIOError, InterruptedError):
+            return
+        except OSError as e:
+            _log(f"Accept error: {type(e).__name__}: {e}")
+            return
+
+        addr = addr or self.socket_path
+        if len(self._connections) >= MAX_CONNECTIONS:
+            _log(f"Rejecting client from {addr}: {MAX_CONNECTIONS} connections already open")
+            client_socket.close()
             return
 
-        while self.running:
+        try:
+            client_socket.setblocking(False)
+            if client_socket.family != getattr(socket, "AF_UNIX", None):
+                # ヘッダとチャンクを別バッファで送るため、Nagleによる遅延を無効化
+                client_socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            conn = _ClientConnection(client_socket, addr, self._encode_queue, self._response_ready)
+            self._selector.register(client_socket, selectors.EVENT_READ, conn)
+        except Exception as e:
+            _log(f"Connection error: {type(e).__name__}: {e}")
+            client_socket.close()
+            return
+
+        _log(f"Client connected from {addr}")
+        self._expect_header(conn)
+        self._connections.add(conn)
+        self._conn = conn
+
+    def _close_connection(self, conn: _ClientConnection):
+        """接続をイベントループから外して閉じる（I/Oスレッドで実行）"""
+        if conn.closed:
+            return
+        try:
+            self._selector.unregister(conn.sock)
+        except (KeyError, ValueError):
+            pass
+        if conn.session is not None:
+            self._orphan_transfers(conn)
+        conn.close()
+        self._connections.discard(conn)
+        if self._close_handlers and self.running:
+            # 後処理はCAD APIを呼ぶことがあるため実行段で実行（実行待ちのリクエストの後）
+            self._request_queue.put(lambda: self._run_close_handlers(conn))
+        if self._conn is conn:
+            self._conn = None
+
+    def _orphan_transfers(self, conn: _ClientConnection):
+        """
+        切断された接続の転送途中の状態をRESUME待ちとして保持（I/Oスレッドで実行）
+
+        受信途中の分割リクエスト、送信途中のレスポンス、実行待ち・実行中のリクエストを
+        (セッションID, Sequence) で保持し、TRANSFER_TTL秒以内に同じセッションで再接続した
+        クライアントのRESUMEで引き継ぎます。共有メモリ経由のレスポンスは切断時に解放されるため保持しません。
+        """
+        self._expire_orphans()
+        expires = time.monotonic() + TRANSFER_TTL
+        orphans: dict[int, tuple[str, Any]] = {}
+
+        for seq, buf in conn.recv_buffers.items():
+            orphans[seq] = ("receiving", buf)
+
+        for response in (*conn.batch, *conn.ready, *conn.priority, *conn.active, *conn.blocked.values()):
+            if response.request is None or response.cancelled or response.seq in orphans:
+                continue
+            if response.shm_name is not None:
+                orphans[response.seq] = ("lost", None)
+                continue
+            orphans[response.seq] = ("sending", response)
+
+        for seq, request in conn.requests.items():
+            if seq not in orphans and not request.cancelled:
+                orphans[seq] = ("executing", request)
+
+        for seq, (state, obj) in orphans.items():
+            if state != "lost":
+                self._orphans[(conn.session, seq)] = (expires, state, obj)
+        if orphans:
+            _log(f"Keeping {len(orphans)} transfer(s) for session {conn.session} for {TRANSFER_TTL}s")
+
+    def _expire_orphans(self):
+        """保持期限を過ぎた転送途中の状態を破棄（実行待ち・実行中のリクエストは結果を破棄）"""
+        now = time.monotonic()
+        for key, (expires, state, obj) in list(self._orphans.items()):
+            if expires > now:
+                continue
+            del self._orphans[key]
+            if state == "executing":
+                obj.cancelled = True
+            _log(f"Discarding {state} transfer: session={key[0]}, Seq={key[1]}")
+
+    def _on_readable(self, conn: _ClientConnection):
+        """
+        受信（I/Oスレッド）
+
+        受信中のフレームのバッファへ直接読み込み（recv_into、コピーなし）、バッファが埋まるたびに
+        次の処理へ進めます。1回のイベントで読み込む回数は制限し、他の接続を待たせないようにします。
+        """
+        for _ in range(RECV_BATCH):
             try:
-                # クライアント接続待機（ブロッキング、1秒タイムアウト）
-                self.client_socket, addr = self.server_socket.accept()
-                _log(f"Client connected from {addr}")
-                self.client_socket.settimeout(RECV_TIMEOUT)
-
-                # リクエスト処理ループ
-                _log("Entering request processing loop")
-                while self.running:
-                    try:
-                        self._handle_request()
-                    except socket.timeout:
-                        # タイムアウトは継続（接続維持）
-                        _log("Request timeout (waiting for data), continuing...")
-                        continue
-                    except AIDXProtocolError as e:
-                        # プロトコルエラーはエラーレスポンス送信
-                        _log(f"Protocol error: {e.code} - {e.message}")
-                        self._send_error_response(e)
-                        # エラーレスポンス送信後は接続を維持
-                        continue
-                    except (ConnectionResetError, ConnectionAbortedError, BrokenPipeError):
-                        # クライアントが接続を閉じた（正常終了）
-                        _log("Client disconnected")
-                        break
-                    except Exception as e:
-                        # 予期しないエラーは接続切断
-                        _log(f"Unexpected error in request loop: {type(e).__name__}: {e}")
-                        import traceback
-                        _log(traceback.format_exc())
-                        break
-
-            except socket.timeout:
-                # accept()タイムアウトは正常動作（次のループで再度待機）
+                n = conn.sock.recv_into(conn.recv_view[conn.recv_filled:])
+            except (BlockingIOError, InterruptedError):
+                return
+            except OSError as e:
+                _log(f"Client {conn.addr} disconnected: {type(e).__name__}: {e}")
+                self._close_connection(conn)
+                return
+            if n == 0:
+                # クライアントが接続を閉じた（正常終了）
+                _log(f"Client {conn.addr} disconnected")
+                self._close_connection(conn)
+                return
+
+            conn.recv_filled += n
+            if conn.recv_filled < len(conn.recv_view):
                 continue
+
+            try:
+                conn.on_received(conn)
+            except AIDXProtocolError as e:
+                # プロトコルエラーはエラーレスポンス送信（接続は維持）
+                _log(f"Protocol error: {e.code} - {e.message}")
+                self._send_error_response(conn, e)
             except Exception as e:
-                # 接続エラーは継続（再接続待機）
-                _log(f"Connection error: {type(e).__name__}: {e}")
-                if self.client_socket:
-                    try:
-                        self.client_socket.close()
-                    except:
-                        pass
-                    self.client_socket = None
-
-        _log("Server loop exited")
-
-    def _handle_request(self):
-        """1リクエストの処理"""
-        # ヘッダ受信（20バイト: IHHHHII = 4+2+2+2+2+4+4）
-        header_data = self._recv_exact(20)
-
-        # ヘッダ解析
-        magic, cmd_id, flags, seq, reserved, payload_size, total_size = struct.unpack(
-            "<IHHHHII", header_data
+                _log(f"Unexpected error in request handling: {type(e).__name__}: {e}")
+                import traceback
+                _log(traceback.format_exc())
+                self._close_connection(conn)
+                return
+
+    def _expect(
+        self,
+        conn: _ClientConnection,
+        view: memoryview,
+        on_received: Callable[[_ClientConnection], None]
+    ):
+        """次の受信先バッファと、バッファが埋まった時の処理を設定（空のバッファは即座に処理）"""
+        conn.recv_view = view
+        conn.recv_filled = 0
+        conn.on_received = on_received
+        if len(view) == 0:
+            on_received(conn)
+
+    def _expect_header(self, conn: _ClientConnection):
+        """次のフレームのヘッダ（v1の20バイト: IHHHHII = 4+2+2+2+2+4+4）を待つ"""
+        self._expect(conn, memoryview(conn.header_buf)[:HEADER_SIZE], self._on_header)
+
+    def _on_header(self, conn: _ClientConnection):
+        """
+        ヘッダ受信完了: ペイロードの受信先を決める
+
+        v2のMagicの場合は、残りの8バイト（IHHIIIQ = 4+2+2+4+4+4+8）を受信してから処理します。
+        """
+        if struct.unpack_from("<I", conn.header_buf)[0] == AIDX_MAGIC_V2:
+            if len(conn.recv_view) == HEADER_SIZE:
+                self._expect(conn, memoryview(conn.header_buf)[HEADER_SIZE:HEADER_SIZE_V2], self._on_header)
+                return
+            header_format = HEADER_FORMAT_V2
+        else:
+            header_format = HEADER_FORMAT
+        magic, cmd_id, flags, seq, reserved, payload_size, total_size = struct.unpack_from(
+            header_format, conn.header_buf
         )
 
         # デバッグ: 受信ヘッダをログ出力
         _log(f"Recv: Magic=0x{magic:08X}, CMD=0x{cmd_id:04X}, Seq={seq}, PayloadSize={payload_size}")
 
         # Magic確認
-        if magic != AIDX_MAGIC:
+        if magic not in (AIDX_MAGIC, AIDX_MAGIC_V2):
+            self._expect_header(conn)
             raise AIDXProtocolError(
                 ERR_PARSE_ERROR,
                 f"Invalid magic: expected 0x{AIDX_MAGIC:08X}, got 0x{magic:08X}",
@@ -203,191 +1191,795 @@ class AIDXServer:
                 seq
             )
 
-        # ペイロード受信
-        payload = self._recv_exact(payload_size) if payload_size > 0 else b""
+        # 期限（Reserved: 受信時点からの相対時間、DEADLINE_UNIT単位）
+        deadline = time.monotonic() + reserved * DEADLINE_UNIT if reserved else None
 
         # ChunkState取得（Flags bit 0-1）
         chunk_state = flags & 0x0003
 
-        # 分割受信処理
         if chunk_state == FLAG_SINGLE:
-            # 単一パケット
-            full_payload = payload
-        else:
-            # 分割パケット
-            full_payload = self._handle_chunked_receive(
-                seq, chunk_state, payload, total_size
-            )
-            if full_payload is None:
-                # まだ全チャンク受信していない
-                return
+            # 単一パケット: ペイロードサイズ分のバッファへ直接受信
+            payload = bytearray(payload_size)
 
-        # コマンド実行
-        try:
-            if cmd_id not in self.command_handlers:
-                _log(f"ERROR: Unknown command 0x{cmd_id:04X}")
-                _log(f"Registered commands: {[f'0x{cid:04X}' for cid in self.command_handlers.keys()]}")
-                raise AIDXProtocolError(
-                    ERR_INVALID_COMMAND,
-                    f"Unknown command: 0x{cmd_id:04X}",
-                    cmd_id,
-                    seq
-                )
+            def on_payload(conn: _ClientConnection):
+                self._expect_header(conn)
+                self._dispatch_request(conn, cmd_id, flags, seq, payload, deadline)
 
-            _log(f"Executing command 0x{cmd_id:04X}...")
-            handler = self.command_handlers[cmd_id]
-            response_payload = handler(full_payload)
-            _log(f"Command 0x{cmd_id:04X} completed, response size={len(response_payload)}")
+            self._expect(conn, memoryview(payload), on_payload)
+        else:
+            # 分割パケット: 再構築バッファへ直接受信
+            self._begin_chunk(
+                conn, cmd_id, flags, seq, chunk_state, payload_size, total_size, deadline
+            )
 
-            # レスポンス送信（分割送信対応）
-            self.send_response(cmd_id, seq, response_payload)
+    def _recv_memory_in_use(self, conn: _ClientConnection, seq: int) -> int:
+        """
+        全接続（RESUME待ちを含む）の分割受信バッファの合計バイト数
 
-        except AIDXProtocolError:
-            raise
-        except Exception as e:
-            raise AIDXProtocolError(
-                ERR_EXECUTION_ERROR,
-                str(e),
-                cmd_id,
-                seq
-            )
+        開始チャンクを受信したSequence（conn上で置き換えられるバッファ）は除きます。
+        """
+        in_use = sum(
+            buf["total_size"]
+            for c in self._connections
+            for s, buf in c.recv_buffers.items()
+            if c is not conn or s != seq
+        )
+        in_use += sum(
+            buf["total_size"] for _, state, buf in self._orphans.values() if state == "receiving"
+        )
+        return in_use
 
-    def _handle_chunked_receive(
-        self, seq: int, chunk_state: int, payload: bytes, total_size: int
-    ) -> Optional[bytes]:
+    def _begin_chunk(
+        self,
+        conn: _ClientConnection,
+        cmd_id: int,
+        flags: int,
+        seq: int,
+        chunk_state: int,
+        payload_size: int,
+        total_size: int,
+        deadline: Optional[float] = None
+    ):
         """
         分割受信処理
 
-        Returns:
-            完全なペイロード（全チャンク受信完了時）、またはNone（受信中）
+        再構築バッファはチャンクの到着ごとにそのチャンク分だけ拡張し、ソケットから
+        バッファの該当位置へ直接受信します（中間コピー・結合なし）。宣言されたTotalSize分を開始時に
+        確保しないため、メモリはクレジットで送られてきた分だけ使用します。
+        全接続の受信バッファのTotalSizeの合計がMAX_RECV_MEMORYを超える開始チャンクはERR_RESOURCE_BUSYで拒否します。
+        検証エラー時もペイロードは読み捨て、ストリームのフレーム境界を維持します。
+        期限は開始チャンクのものを使用します（転送時間も期限に含める）。
         """
         if chunk_state == FLAG_START:
-            # 開始: バッファ初期化
-            self._recv_buffers[seq] = {
+            if total_size > MAX_REQUEST_SIZE:
+                self._discard(conn, payload_size)
+                raise AIDXProtocolError(
+                    ERR_INVALID_PAYLOAD,
+                    f"Request too large: {total_size} > {MAX_REQUEST_SIZE} bytes",
+                    cmd_id,
+                    seq
+                )
+
+            # 全接続の受信バッファの合計が上限を超える場合は確保しない
+            in_use = self._recv_memory_in_use(conn, seq)
+            if in_use + total_size > MAX_RECV_MEMORY:
+                self._discard(conn, payload_size)
+                raise AIDXProtocolError(
+                    ERR_RESOURCE_BUSY,
+                    f"Receive memory exhausted: {in_use} + {total_size} > {MAX_RECV_MEMORY} bytes",
+                    cmd_id,
+                    seq
+                )
+
+            # 開始: バッファ登録（領域はチャンクの到着ごとに拡張）
+            buf = {
                 "total_size": total_size,
-                "chunks": [payload],
-                "received_size": len(payload)
+                "buffer": bytearray(),
+                "received_size": 0,
+                "deadline": deadline,
+                # 受信済みでクライアントへまだCREDITを返していないバイト数
+                "unacked": 0
             }
-            return None
+            conn.recv_buffers[seq] = buf
 
-        elif chunk_state == FLAG_MIDDLE or chunk_state == FLAG_END:
-            # 中間/終了: バッファに追加
-            if seq not in self._recv_buffers:
+        else:
+            # 中間/終了: 既存バッファへ追記
+            if seq not in conn.recv_buffers:
+                self._discard(conn, payload_size)
                 raise AIDXProtocolError(
                     ERR_INVALID_SEQUENCE,
                     f"Missing start chunk for sequence {seq}",
-                    0,
+                    cmd_id,
                     seq
                 )
 
-            buf = self._recv_buffers[seq]
+            buf = conn.recv_buffers[seq]
 
             # TotalSize確認
             if buf["total_size"] != total_size:
+                self._discard(conn, payload_size)
+                del conn.recv_buffers[seq]
                 raise AIDXProtocolError(
                     ERR_INVALID_SEQUENCE,
                     f"TotalSize mismatch: expected {buf['total_size']}, got {total_size}",
-                    0,
+                    cmd_id,
                     seq
                 )
 
-            buf["chunks"].append(payload)
-            buf["received_size"] += len(payload)
-
-            if chunk_state == FLAG_END:
-                # 終了: 全チャンク結合
-                full_payload = b"".join(buf["chunks"])
+        # 溢れ確認（TotalSizeを超えるチャンクは受け付けない）
+        offset = buf["received_size"]
+        if offset + payload_size > total_size:
+            self._discard(conn, payload_size)
+            del conn.recv_buffers[seq]
+            raise AIDXProtocolError(
+                ERR_INVALID_SEQUENCE,
+                f"Chunk overflows total size: {offset + payload_size} > {total_size}",
+                cmd_id,
+                seq
+            )
 
-                # サイズ確認
-                if len(full_payload) != total_size:
-                    raise AIDXProtocolError(
-                        ERR_INVALID_SEQUENCE,
-                        f"Total size mismatch: expected {total_size}, got {len(full_payload)}",
-                        0,
-                        seq
+        def on_chunk(conn: _ClientConnection):
+            buf["received_size"] = offset + payload_size
+            self._expect_header(conn)
+            if chunk_state != FLAG_END:
+                # 開始/中間: まだ受信中（ウィンドウの半分を受信するごとにCREDITを返す）
+                buf["unacked"] += payload_size
+                if conn.flow_control and buf["unacked"] >= RECV_WINDOW // 2:
+                    conn.enqueue_response(
+                        CMD_CREDIT, seq, {"seq": seq, "credit": buf["unacked"]}, inline=True
                     )
+                    buf["unacked"] = 0
+                return
 
-                # バッファクリア
-                del self._recv_buffers[seq]
+            # 終了: バッファクリア
+            if conn.recv_buffers.get(seq) is buf:
+                del conn.recv_buffers[seq]
 
-                return full_payload
-            else:
-                # 中間: まだ受信中
-                return None
+            # サイズ確認
+            if buf["received_size"] != total_size:
+                raise AIDXProtocolError(
+                    ERR_INVALID_SEQUENCE,
+                    f"Total size mismatch: expected {total_size}, got {buf['received_size']}",
+                    cmd_id,
+                    seq
+                )
 
-        else:
+            self._dispatch_request(conn, cmd_id, flags, seq, buf["buffer"], buf["deadline"])
+
+        # このチャンクの分だけバッファを拡張し、該当位置へ直接受信
+        buffer = buf["buffer"]
+        if len(buffer) < offset + payload_size:
+            buffer.extend(bytes(offset + payload_size - len(buffer)))
+        self._expect(conn, memoryview(buffer)[offset:offset + payload_size], on_chunk)
+
+    def _discard(self, conn: _ClientConnection, size: int):
+        """不正なフレームのペイロードを読み捨て（フレーム境界の維持）"""
+        if size <= 0:
+            self._expect_header(conn)
+            return
+        n = min(size, len(conn.discard_buf))
+        self._expect(
+            conn, memoryview(conn.discard_buf)[:n], lambda conn: self._discard(conn, size - n)
+        )
+
+    def _dispatch_request(
+        self,
+        conn: _ClientConnection,
+        cmd_id: int,
+        flags: int,
+        seq: int,
+        full_payload: bytearray,
+        deadline: Optional[float] = None
+    ):
+        """再構築済みリクエストのデコードと振り分け（制御コマンド / 即時実行 / 実行段へ）"""
+        if cmd_id not in self.command_handlers and cmd_id not in self._control_handlers:
+            _log(f"ERROR: Unknown command 0x{cmd_id:04X}")
+            _log(f"Registered commands: {[f'0x{cid:04X}' for cid in self.command_handlers.keys()]}")
             raise AIDXProtocolError(
-                ERR_PARSE_ERROR,
-                f"Invalid chunk state: {chunk_state}",
-                0,
+                ERR_INVALID_COMMAND,
+                f"Unknown command: 0x{cmd_id:04X}",
+                cmd_id,
                 seq
             )
 
-    def send_response(self, cmd_id: int, seq: int, payload: bytes):
-        """レスポンス送信（64KB超過時は自動分割）"""
-        total_size = len(payload)
+        # 圧縮ペイロードの展開
+        full_payload = decompress_payload(full_payload, flags, cmd_id, seq)
 
-        if total_size <= CHUNK_SIZE:
-            # 単一パケット
-            self._send_packet(cmd_id, seq, FLAG_SINGLE, payload, total_size)
+        # レスポンス圧縮: 圧縮リクエストには同じコーデックで、受入フラグのみならzlibで応答
+        if flags & FLAG_COMPRESSED:
+            compression = (flags & COMPRESSION_MASK) >> COMPRESSION_SHIFT
+        elif flags & FLAG_ACCEPT_COMPRESSION:
+            compression = COMPRESSION_ZLIB
         else:
-            # 分割送信
-            offset = 0
-            while offset < total_size:
-                chunk_size = min(CHUNK_SIZE, total_size - offset)
-                chunk = payload[offset:offset + chunk_size]
-
-                # Flags算出
-                if offset == 0:
-                    flags = FLAG_START
-                elif offset + chunk_size >= total_size:
-                    flags = FLAG_END
+            compression = None
+
+        # コンテントタイプに従ってデコード（レスポンスも同じ形式で返す）
+        content_type = (flags & CONTENT_TYPE_MASK) >> CONTENT_TYPE_SHIFT
+        if content_type == CONTENT_RAW:
+            content_type = CONTENT_JSON
+        if cmd_id in self._raw_payload_commands:
+            decoded = full_payload
+        else:
+            decoded = decode_request(full_payload, flags, cmd_id, seq)
+
+        if cmd_id in self._control_handlers:
+            result = self._control_handlers[cmd_id](conn, decoded)
+            if result is not None:
+                conn.enqueue_response(cmd_id, seq, result, compression, content_type, inline=True)
+            return
+
+        request = _Request(conn, cmd_id, seq, decoded, compression, content_type, deadline)
+        conn.requests[seq] = request
+
+        if cmd_id in self._thread_safe_commands:
+            # CAD APIを使用しないコマンドは実行待ちを経由せず即時実行
+            self._execute_request(request)
+        else:
+            # 実行段へ
+            self._request_queue.put(request)
+
+    def _handle_hello(self, conn: _ClientConnection, request: Any) -> dict:
+        """
+        HELLOハンドシェイク（制御コマンド）
+
+        プロトコルバージョン・チャンクサイズ・対応形式・同時実行数を交換し、
+        双方が対応する値で応答します。ネゴシエーションしたチャンクサイズとヘッダのバージョン
+        （version 2ならv2ヘッダ）はこのレスポンス以降の送信に適用されます。クライアントがrecv_windowを指定した場合は
+        分割転送のフロー制御（CREDIT）を有効にし、アドイン側の受信ウィンドウを返します。
+        sessionを指定した接続は、切断後に同じsessionで再接続するとRESUMEで転送を再開できます。
+
+        Args:
+            conn: 接続
+            request: {"version", "max_chunk_size", "codecs", "compression", "max_in_flight",
+                "shared_memory", "platform", "recv_window", "session"}
+
+        Returns:
+            ネゴシエーション結果と登録済みコマンドIDの一覧
+        """
+        if not isinstance(request, dict):
+            raise AIDXProtocolError(
+                ERR_INVALID_PAYLOAD, "HELLO payload must be an object", CMD_HELLO
+            )
+
+        try:
+            version = min(int(request.get("version", 1)), PROTOCOL_VERSION)
+            chunk_size = int(request.get("max_chunk_size", CHUNK_SIZE))
+            max_in_flight = min(int(request.get("max_in_flight", MAX_IN_FLIGHT)), MAX_IN_FLIGHT)
+            # クライアントの受信ウィンドウ（指定された場合のみフロー制御を有効化）
+            send_window = request.get("recv_window")
+            send_window = int(send_window) if send_window is not None else None
+        except (TypeError, ValueError) as e:
+            raise AIDXProtocolError(
+                ERR_INVALID_PAYLOAD, f"Invalid HELLO parameter: {e}", CMD_HELLO
+            )
+        chunk_size = max(MIN_CHUNK_SIZE, min(chunk_size, MAX_CHUNK_SIZE))
+
+        peer_codecs = request.get("codecs", ["json"])
+        peer_compression = request.get("compression", ["zlib"])
+        codecs = [
+            name for content_type, name in CONTENT_NAMES.items()
+            if content_type in CONTENT_CODECS and name in peer_codecs
+        ]
+        compression = [
+            name for codec, name in COMPRESSION_NAMES.items()
+            if codec in COMPRESSORS and name in peer_compression
+        ]
+
+        # 共有メモリは同一OS上のクライアントが要求した場合のみ（WSL等からの接続は不可）
+        use_shared_memory = (
+            shared_memory is not None
+            and bool(request.get("shared_memory", False))
+            and request.get("platform") == sys.platform
+        )
+
+        conn.chunk_size = chunk_size
+        conn.header_version = 2 if version >= 2 else 1
+        conn.shared_memory = use_shared_memory
+        session = request.get("session")
+        conn.session = session if isinstance(session, str) else None
+        # ウィンドウは1チャンク以上（1チャンクも送れないと転送が止まる）
+        conn.flow_control = send_window is not None
+        conn.send_window = max(send_window, chunk_size) if send_window is not None else 0
+        _log(f"HELLO from {conn.addr}: version={version}, chunk_size={chunk_size}, "
+             f"codecs={codecs}, compression={compression}, max_in_flight={max_in_flight}, "
+             f"shared_memory={use_shared_memory}, send_window={conn.send_window or None}")
+
+        return {
+            "version": version,
+            "max_chunk_size": chunk_size,
+            "codecs": codecs,
+            "compression": compression,
+            "max_in_flight": max_in_flight,
+            "shared_memory": use_shared_memory,
+            "recv_window": max(RECV_WINDOW, chunk_size) if conn.flow_control else None,
+            "commands": sorted(self.command_handlers.keys()),
+            "control_commands": sorted(self._control_handlers.keys()),
+        }
+
+    def _handle_shm_release(self, conn: _ClientConnection, request: Any) -> dict:
+        """
+        共有メモリの解放（制御コマンド）
+
+        クライアントが共有メモリをマップした後に送信します。
+
+        Args:
+            conn: 接続
+            request: {"name": 共有メモリ名}
+        """
+        if not isinstance(request, dict) or not isinstance(request.get("name"), str):
+            raise AIDXProtocolError(
+                ERR_INVALID_PAYLOAD, "SHM_RELEASE payload must be {\"name\": str}", CMD_SHM_RELEASE
+            )
+        return {"released": conn.release_shared_memory(request["name"])}
+
+    def _handle_cancel(self, conn: _ClientConnection, request: Any) -> dict:
+        """
+        リクエストの取り消し（制御コマンド）
+
+        実行待ちのリクエストは実行せずに破棄し、実行中のリクエストは結果を破棄します
+        （CAD APIの呼び出し自体は中断できないため完了まで実行されます）。
+        送信待ち・送信中のレスポンスは以降のフレームを送信しません。受信途中の分割リクエストは
+        バッファを破棄します。このレスポンスの送信後、取り消したSequenceのフレームは送信されないため、
+        クライアントはこのレスポンスを受け取った時点でSequenceを再利用できます。
+
+        Args:
+            conn: 接続
+            request: {"seq": 取り消すSequence番号}
+
+        Returns:
+            {"seq", "cancelled", "state"}（state: queued / running / completed / receiving / unknown）
+        """
+        if not isinstance(request, dict) or not isinstance(request.get("seq"), int):
+            raise AIDXProtocolError(
+                ERR_INVALID_PAYLOAD, "CANCEL payload must be {\"seq\": int}", CMD_CANCEL
+            )
+        seq = request["seq"]
+
+        target = conn.requests.pop(seq, None)
+        blocked = conn.blocked.pop(seq, None)
+        if blocked is not None:
+            self._drop_response(conn, blocked)
+        if target is not None:
+            target.cancelled = True
+            if target.finished:
+                state = "completed"
+            elif target.started:
+                state = "running"
+            else:
+                state = "queued"
+        elif conn.recv_buffers.pop(seq, None) is not None:
+            state = "receiving"
+        else:
+            # 送信済み、または受信していないSequence
+            state = "unknown"
+
+        _log(f"CANCEL from {conn.addr}: Seq={seq}, state={state}")
+        return {"seq": seq, "cancelled": state != "unknown", "state": state}
+
+    def _handle_credit(self, conn: _ClientConnection, request: Any) -> None:
+        """
+        送信クレジットの追加（制御コマンド、応答なし）
+
+        クライアントは分割レスポンスのチャンクを消費した分だけクレジットを返します。
+        クレジット切れで止めていたレスポンスは送信を再開します。
+
+        Args:
+            conn: 接続
+            request: {"seq": Sequence番号, "credit": 追加するバイト数}
+        """
+        if (not isinstance(request, dict) or not isinstance(request.get("seq"), int)
+                or not isinstance(request.get("credit"), int)):
+            raise AIDXProtocolError(
+                ERR_INVALID_PAYLOAD, "CREDIT payload must be {\"seq\": int, \"credit\": int}", CMD_CREDIT
+            )
+        seq = request["seq"]
+
+        response = conn.blocked.pop(seq, None)
+        if response is not None:
+            response.credit += request["credit"]
+            conn.active.append(response)
+            self._flush_queue.append(conn)
+            return
+
+        # 送信中（クレジットが残っている）のレスポンス
+        for response in (*conn.priority, *conn.active):
+            if response.seq == seq and response.credit is not None:
+                response.credit += request["credit"]
+                break
+
+    def _handle_resume(self, conn: _ClientConnection, request: Any) -> dict:
+        """
+        転送の再開（制御コマンド）
+
+        同じセッションで再接続したクライアントが、切断前のSequenceの転送を引き継ぎます。
+        受信途中のリクエストは受信済みのバイト数を返し、クライアントはそこから続きのチャンクを送ります。
+        送信途中のレスポンスはクライアントが受信済みのオフセットから続きのチャンクを送信し、
+        実行待ち・実行中のリクエストは完了後にこの接続へ応答します。
+
+        Args:
+            conn: 接続（HELLOでsessionを通知済み）
+            request: {"seq": Sequence番号, "received": クライアントが受信済みのバイト数}
+
+        Returns:
+            {"seq", "state", "offset"}（state: receiving / sending / executing / unknown、
+            offset: receivingならアドインが受信済みのバイト数）
+        """
+        if (not isinstance(request, dict) or not isinstance(request.get("seq"), int)
+                or not isinstance(request.get("received", 0), int)):
+            raise AIDXProtocolError(
+                ERR_INVALID_PAYLOAD, "RESUME payload must be {\"seq\": int, \"received\": int}", CMD_RESUME
+            )
+        seq = request["seq"]
+        received = request.get("received", 0)
+
+        self._expire_orphans()
+        orphan = self._orphans.pop((conn.session, seq), None) if conn.session is not None else None
+        state, obj = orphan[1:] if orphan is not None else ("unknown", None)
+        offset = 0
+
+        if state == "receiving":
+            obj["unacked"] = 0
+            conn.recv_buffers[seq] = obj
+            offset = obj["received_size"]
+        elif state == "sending":
+            obj.request.conn = conn
+            conn.requests[seq] = obj.request
+            self._resend_response(conn, obj, received)
+            offset = received
+        elif state == "executing":
+            obj.conn = conn
+            conn.requests[seq] = obj
+            if obj.orphaned_response is not None:
+                self._resend_response(conn, obj.orphaned_response, 0)
+                obj.orphaned_response = None
+
+        _log(f"RESUME from {conn.addr}: Seq={seq}, state={state}, offset={offset}")
+        return {"seq": seq, "state": state, "offset": offset}
+
+    def _execution_loop(self):
+        """
+        実行ループ（CAD APIを呼ぶハンドラを1件ずつ実行）
+
+        executorを指定した場合は、実行待ちのリクエストをまとめて（最大EXECUTOR_BATCH件）executorへ渡し、
+        全て完了するのを待ってから次のリクエストを取り出します。
+        """
+        _log("_execution_loop started")
+        while True:
+            request = self._request_queue.get()
+            if request is None:
+                break
+            if self._executor is None:
+                self._run_queued_request(request)
+                continue
+
+            # 実行待ちのリクエストをまとめてexecutorへ渡す（1回のメインスレッドの処理で実行される）
+            requests = [request]
+            stopping = False
+            while len(requests) < EXECUTOR_BATCH:
+                try:
+                    request = self._request_queue.get_nowait()
+                except queue.Empty:
+                    break
+                if request is None:
+                    stopping = True
+                    break
+                requests.append(request)
+            futures = [self._executor.submit(self._run_queued_request, r) for r in requests]
+            self._wait_executed(futures)
+            if stopping:
+                break
+        _log("Execution loop exited")
+
+    def _wait_executed(self, futures: list[Future]):
+        """executorへ渡したリクエストの完了を待つ（サーバー停止時は待たない）"""
+        pending = set(futures)
+        while pending and self.running:
+            _, pending = wait_futures(pending, timeout=0.1)
+        for future in futures:
+            if future.done() and not future.cancelled() and future.exception() is not None:
+                e = future.exception()
+                _log(f"Executor error: {type(e).__name__}: {e}")
+
+    def _run_close_handlers(self, conn: Optional[_ClientConnection]):
+        """接続が閉じられた時の後処理を実行（失敗はログ出力のみ）"""
+        for handler in self._close_handlers:
+            try:
+                handler(conn)
+            except Exception as e:
+                _log(f"Close handler error: {type(e).__name__}: {e}")
+
+    def _run_queued_request(self, request: _Request):
+        """実行待ちだったリクエスト（または接続が閉じられた時の後処理）を実行（切断・キャンセル済みならスキップ）"""
+        if callable(request):
+            request()
+            return
+        if request.conn.closed and request.conn.session is None:
+            # セッションのある接続のリクエストは切断後も実行し、結果をRESUMEまで保持する
+            _log(f"Skipping request from closed connection: CMD=0x{request.cmd_id:04X}, Seq={request.seq}")
+            return
+        if request.cancelled:
+            _log(f"Skipping cancelled request: CMD=0x{request.cmd_id:04X}, Seq={request.seq}")
+            return
+        self._execute_request(request)
+
+    def _execute_request(self, request: _Request):
+        """コマンド実行（実行段）、結果は送信キューへ"""
+        cmd_id = request.cmd_id
+        seq = request.seq
+
+        # 期限切れのリクエストは実行しない（待っているクライアントはもういない）
+        if request.deadline is not None and time.monotonic() >= request.deadline:
+            _log(f"Deadline expired before execution: CMD=0x{cmd_id:04X}, Seq={seq}")
+            request.finished = True
+            self._send_error_response(
+                request.conn,
+                AIDXProtocolError(ERR_TIMEOUT, "Deadline expired before execution", cmd_id, seq),
+                request
+            )
+            return
+
+        request.started = True
+        _execution_context.deadline = request.deadline
+        _execution_context.connection = request.conn
+        try:
+            _log(f"Executing command 0x{cmd_id:04X} (Seq={seq})...")
+            handler = self.command_handlers[cmd_id]
+            result = handler(request.request)
+            _log(f"Command 0x{cmd_id:04X} completed")
+            request.finished = True
+
+            if request.cancelled:
+                _log(f"Discarding result of cancelled command 0x{cmd_id:04X} (Seq={seq})")
+                return
+
+            # レスポンス送信（送信段でエンコード・分割送信）
+            # I/Oスレッドで実行したコマンドの軽いレスポンスはその場でエンコード
+            request.conn.enqueue_response(
+                cmd_id, seq, result, request.compression, request.content_type, request,
+                inline=cmd_id in self._thread_safe_commands
+            )
+
+        except Exception as e:
+            _log(f"Execution error in 0x{cmd_id:04X}: {type(e).__name__}: {e}")
+            request.finished = True
+            if request.cancelled:
+                return
+            self._send_error_response(
+                request.conn,
+                AIDXProtocolError(ERR_EXECUTION_ERROR, str(e), cmd_id, seq),
+                request
+            )
+        finally:
+            _execution_context.deadline = None
+            _execution_context.connection = None
+
+    def _encoder_loop(self):
+        """
+        エンコードループ（送信段の前半、全接続で共有するスレッドで実行）
+
+        レスポンスのエンコード・圧縮・共有メモリへの書き込みをI/Oスレッドの外で行い、
+        完了したものを接続の送信待ちへ渡してイベントループを起こします。
+        """
+        _log("_encoder_loop started")
+        while True:
+            item = self._encode_queue.get()
+            if item is None:
+                break
+            conn, response = item
+            if response.cancelled:
+                continue
+            if conn.closed:
+                if response.request is not None and conn.session is not None:
+                    # 再接続したクライアントへ送れるよう、I/Oスレッドで引き継ぐか保持する
+                    self._orphaned_responses.append(response)
+                    self._wake()
+                continue
+            response.prepare()
+            conn.ready.append(response)
+            self._response_ready(conn)
+        _log("Encoder loop exited")
+
+    def _flush(self, conn: _ClientConnection):
+        """
+        送信（送信段の後半、I/Oスレッド）
+
+        完了したレスポンスを完了順に送信します。PRIORITY_MAX_SIZE以下のレスポンスは優先レーンに入れ、
+        大きな転送の次のチャンクより先に送信します。分割送信中のレスポンスが複数ある場合は
+        1チャンクずつ交互に送信し、1回に送るバッファ列はSEND_BATCH_BYTESまでに抑えるため、
+        後から完了したレスポンスが待たされるのは送信中のフレームの分だけです。
+        送信バッファが一杯になったら残りを保持し、書き込み可能イベントで再開します。
+        """
+        while not conn.closed:
+            if not conn.send_views:
+                while conn.ready:
+                    response = conn.ready.popleft()
+                    if response.cancelled:
+                        self._drop_response(conn, response)
+                    elif response.total_size <= PRIORITY_MAX_SIZE:
+                        conn.priority.append(response)
+                    else:
+                        conn.active.append(response)
+                if not conn.priority and not conn.active:
+                    break
+                self._fill_send_views(conn)
+                if not conn.send_views:
+                    continue
+
+            try:
+                if hasattr(conn.sock, "sendmsg"):
+                    # ヘッダとチャンクを結合せずに1回のシステムコールで送信（scatter-gather）
+                    sent = conn.sock.sendmsg(conn.send_views)
+                else:
+                    # sendmsgがない環境（Windows）: 小さなバッファを結合して1回のsendで送信
+                    sent = conn.sock.send(self._coalesce_send_views(conn))
+            except (BlockingIOError, InterruptedError):
+                break
+            except OSError as e:
+                _log(f"Send error to {conn.addr}: {type(e).__name__}: {e}")
+                self._close_connection(conn)
+                return
+
+            # 送信済み分を先頭から取り除く（部分送信の場合は残りをスライス）
+            while sent > 0:
+                head = conn.send_views[0]
+                if sent >= len(head):
+                    sent -= len(head)
+                    conn.send_views.popleft()
                 else:
-                    flags = FLAG_MIDDLE
+                    conn.send_views[0] = head[sent:]
+                    sent = 0
+            if not conn.send_views:
+                # 積んだフレームは全て送信済み（切断されても再開の対象外）
+                conn.batch.clear()
 
-                self._send_packet(cmd_id, seq, flags, chunk, total_size)
-                offset += chunk_size
+        if not conn.closed:
+            self._set_write_interest(conn, bool(conn.send_views))
+
+    def _coalesce_send_views(self, conn: _ClientConnection):
+        """
+        送信バッファ列の先頭からSEND_BATCH_BYTESまでを1つのバッファに結合（sendmsgがない環境用）
+
+        ヘッダとチャンクを別々のsendで送ると、TCP_NODELAYによりヘッダだけの小さなセグメントが出るため、
+        先頭のフレーム群をまとめてコピーします（SEND_BATCH_BYTESを超えるバッファは途中まで）。
+        先頭のバッファだけでSEND_BATCH_BYTES以上ある場合はコピーせずそのまま返します。
+        """
+        head = conn.send_views[0]
+        if len(head) >= SEND_BATCH_BYTES or len(conn.send_views) == 1:
+            return head
+
+        parts = []
+        size = 0
+        for view in conn.send_views:
+            if size + len(view) > SEND_BATCH_BYTES:
+                parts.append(view[:SEND_BATCH_BYTES - size])
+                break
+            parts.append(view)
+            size += len(view)
+        return b"".join(parts)
+
+    def _fill_send_views(self, conn: _ClientConnection):
+        """
+        送信中のレスポンスから1フレームずつ順に切り出し（未完了なら末尾へ回す）、送信バッファ列に積む
 
-    def _send_packet(self, cmd_id: int, seq: int, flags: int, payload: bytes, total_size: int):
-        """単一パケット送信"""
-        header = struct.pack(
-            "<IHHHHII",
+        優先レーンを先に空にし、残りの枠で大きなレスポンスのチャンクを積みます。
+        クレジットが足りないレスポンスは送信を止め、CREDITの受信で再開します。
+        """
+        frames = 0
+        size = 0
+        conn.batch.clear()
+        while frames < SEND_BATCH_FRAMES and (frames == 0 or size < SEND_BATCH_BYTES):
+            lane = conn.priority if conn.priority else conn.active
+            if not lane:
+                break
+            response = lane.popleft()
+            if response.cancelled:
+                # CANCEL済み: 送信途中でも以降のフレームは送信しない
+                self._drop_response(conn, response)
+                continue
+            if not response.has_credit():
+                # クレジット切れ: クライアントのCREDITまで他のレスポンスを先に送信
+                conn.blocked[response.seq] = response
+                continue
+            flags, chunk = response.next_frame()
+            header = self._pack_header(
+                response.cmd_id, response.seq, flags, len(chunk), response.total_size, conn.header_version
+            )
+            conn.send_views.append(memoryview(header))
+            conn.send_views.append(chunk)
+            conn.batch.append(response)
+            frames += 1
+            size += len(header) + len(chunk)
+            if not response.done:
+                lane.append(response)
+            elif response.request is not None and conn.requests.get(response.seq) is response.request:
+                del conn.requests[response.seq]
+        _log(f"Send: {frames} frame(s), {size} bytes")
+
+    def _drop_response(self, conn: _ClientConnection, response: _OutgoingResponse):
+        """CANCEL済みのレスポンスを破棄（共有メモリに書き込み済みなら解放）"""
+        _log(f"Dropping cancelled response: CMD=0x{response.cmd_id:04X}, Seq={response.seq}")
+        if response.shm_name is not None:
+            conn.release_shared_memory(response.shm_name)
+
+    def _adopt_orphaned_response(self, response: _OutgoingResponse):
+        """切断された接続宛てのレスポンスを、RESUME済みなら再接続先へ送信し、未再開なら保持（I/Oスレッド）"""
+        request = response.request
+        if request.cancelled:
+            return
+        if request.conn.closed:
+            request.orphaned_response = response
+            return
+        self._resend_response(request.conn, response, 0)
+
+    def _resend_response(self, conn: _ClientConnection, response: _OutgoingResponse, offset: int):
+        """
+        レスポンスを別の接続から指定オフセット以降を送信し直す（I/Oスレッド）
+
+        再接続先のフロー制御に合わせてクレジットを初期化します。チャンクサイズは途中から再開する場合のみ維持します。
+        """
+        response.credit = conn.send_window if conn.flow_control else None
+        if response.view is None:
+            # 未エンコード: 再接続先の設定でエンコード
+            response.chunk_size = conn.chunk_size
+            response.shm_conn = conn if conn.shared_memory else None
+            conn.encode_queue.put((conn, response))
+            return
+        if not 0 < offset < response.total_size or response.total_size <= response.chunk_size:
+            offset = 0
+            response.chunk_size = conn.chunk_size
+        response.offset = offset
+        response.done = False
+        conn.ready.append(response)
+        self._flush_queue.append(conn)
+
+    def _set_write_interest(self, conn: _ClientConnection, want_write: bool):
+        """書き込み可能イベントの待機を切り替え（送信バッファが一杯の間のみ待機）"""
+        if conn.want_write == want_write:
+            return
+        events = selectors.EVENT_READ | (selectors.EVENT_WRITE if want_write else 0)
+        self._selector.modify(conn.sock, events, conn)
+        conn.want_write = want_write
+
+    def send_response(self, cmd_id: int, seq: int, payload: Any):
+        """レスポンス送信（最後に接続したクライアントの送信待ちへ追加、チャンクサイズ超過時は自動分割）"""
+        if self._conn is None:
+            raise ConnectionError("No client connected")
+        self._conn.enqueue_response(cmd_id, seq, payload)
+
+    def _pack_header(
+        self, cmd_id: int, seq: int, flags: int, payload_size: int, total_size: int, version: int = 1
+    ) -> bytes:
+        """ヘッダ構築（version 2ならv2ヘッダ）"""
+        if version >= 2:
+            return struct.pack(
+                HEADER_FORMAT_V2, AIDX_MAGIC_V2, cmd_id, flags, seq, 0, payload_size, total_size
+            )
+        return struct.pack(
+            HEADER_FORMAT,
             AIDX_MAGIC,
             cmd_id,
             flags,
             seq,
             0x0000,  # Reserved
-            len(payload),
+            payload_size,
             total_size
         )
 
-        _log(f"Send: CMD=0x{cmd_id:04X}, Seq={seq}, Flags=0x{flags:04X}, PayloadSize={len(payload)}")
-        self.client_socket.sendall(header + payload)
-
-    def _send_error_response(self, error: AIDXProtocolError):
+    def _send_error_response(
+        self,
+        conn: _ClientConnection,
+        error: AIDXProtocolError,
+        request: Optional[_Request] = None
+    ):
         """エラーレスポンス送信"""
-        error_payload = json.dumps({
+        error_payload = {
             "ErrorCode": error.code,
             "Message": error.message,
             "OriginalCommandID": error.cmd_id,
             "OriginalSequence": error.seq
-        }).encode("utf-8")
+        }
 
-        try:
-            self.send_response(CMD_ERROR, error.seq, error_payload)
-        except:
-            # エラーレスポンス送信失敗は無視（接続切断）
-            pass
-
-    def _recv_exact(self, size: int) -> bytes:
-        """指定バイト数を正確に受信"""
-        data = b""
-        while len(data) < size:
-            chunk = self.client_socket.recv(size - len(data))
-            if not chunk:
-                raise AIDXProtocolError(
-                    ERR_PARSE_ERROR,
-                    f"Connection closed while receiving {size} bytes (got {len(data)} bytes)"
-                )
-            data += chunk
-        return data
+        # エラーレスポンスは常にJSON（小さいため呼び出し元のスレッドでエンコード）
+        conn.enqueue_response(
+            CMD_ERROR, error.seq, error_payload, content_type=CONTENT_JSON, request=request, inline=True
+        )
@@ -0,0 +1,112 @@
+"""AIDX Batch コマンドテスト"""
+import asyncio
+import sys
+import os
+import time
+from pathlib import Path
+
+# Windowsコンソールでの文字化け防止
+if sys.platform == "win32":
+    os.system("chcp 65001 >nul")
+    sys.stdout.reconfigure(encoding='utf-8')
+    sys.stderr.reconfigure(encoding='utf-8')
+
+# モジュールパス追加
+repo_root = Path(__file__).parent.parent.parent.parent
+sys.path.insert(0, str(repo_root / "client" / "mcp-server" / "src"))
+
+from protocol import AIDXClient, AIDXProtocolError
+from config import CMD_BATCH, CMD_CREATE_OBJECT, CMD_COMBINE, CMD_DELETE_OBJECT
+
+
+async def test_batch():
+    """Batchテスト（作成・結合・削除を1回の往復で実行）"""
+    client = AIDXClient(host="127.0.0.1", port=8109)
+
+    try:
+        print("=" * 60)
+        print("Batch テスト")
+        print("=" * 60)
+
+        print("\nFusion360に接続中...")
+        await client.connect()
+        print("✓ 接続成功\n")
+
+        # テストケース1: ボックス2つを作成して結合し、結果を削除
+        print("=" * 60)
+        print("[1] 作成 → 結合 → 削除（前のステップの結果を参照）")
+        print("=" * 60)
+
+        request = {
+            "steps": [
+                {
+                    "command_id": CMD_CREATE_OBJECT,
+                    "request": {"type": "box", "params": {"width": 100, "height": 100, "length": 100}}
+                },
+                {
+                    "command_id": CMD_CREATE_OBJECT,
+                    "request": {"type": "box", "params": {"width": 60, "height": 60, "length": 60}, "position": [70, 0, 0]}
+                },
+                {
+                    "command_id": CMD_COMBINE,
+                    "request": {"target_body_id": "$0.id", "tool_body_ids": ["$1.id"], "operation": "join"}
+                },
+                {
+                    "command_id": CMD_DELETE_OBJECT,
+                    "request": {"id": "$2.result_body_id"}
+                }
+            ]
+        }
+
+        start_time = time.time()
+        result = await client.call(CMD_BATCH, request)
+        elapsed = time.time() - start_time
+
+        if result.get("success"):
+            print(f"✓ 成功 ({elapsed:.3f}秒, {result['completed']}ステップ)")
+        else:
+            print(f"✗ 失敗: Step {result.get('failed_step')}: {result.get('error')}")
+            await client.close()
+            sys.exit(1)
+
+        # テストケース2: 存在しないステップの参照は失敗し、以降のステップは実行されない
+        print(f"\n{'=' * 60}")
+        print("[2] 未実行のステップへの参照（エラー期待）")
+        print("=" * 60)
+
+        request = {
+            "steps": [
+                {"command_id": CMD_DELETE_OBJECT, "request": {"id": "$5.id"}},
+                {"command_id": CMD_CREATE_OBJECT, "request": {"type": "box", "params": {"width": 10, "height": 10, "length": 10}}}
+            ]
+        }
+
+        result = await client.call(CMD_BATCH, request)
+        if not result.get("success") and result.get("failed_step") == 0 and result.get("completed") == 1:
+            print(f"✓ 期待通りのエラー: {result.get('error')}")
+        else:
+            print(f"✗ 予期しないレスポンス: {result}")
+            await client.close()
+            sys.exit(1)
+
+        await client.close()
+        print(f"\n{'=' * 60}")
+        print("テスト完了")
+        print("=" * 60)
+
+    except AIDXProtocolError as e:
+        print(f"\n✗ プロトコルエラー:")
+        print(f"  ErrorCode: 0x{e.code:04X}")
+        print(f"  Message: {e}")
+        await client.close()
+        sys.exit(1)
+    except Exception as e:
+        print(f"\n✗ エラー: {type(e).__name__}: {e}")
+        import traceback
+        traceback.print_exc()
+        await client.close()
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    asyncio.run(test_batch())
@@ -0,0 +1,111 @@
+"""AIDX 接続断・再接続テスト（Fusion360不要、アドインのサーバーをこのプロセス内で起動）"""
+import asyncio
+import importlib.util
+import sys
+import os
+import time
+from pathlib import Path
+
+# Windowsコンソールでの文字化け防止
+if sys.platform == "win32":
+    os.system("chcp 65001 >nul")
+    sys.stdout.reconfigure(encoding='utf-8')
+    sys.stderr.reconfigure(encoding='utf-8')
+
+# モジュールパス追加
+repo_root = Path(__file__).parent.parent.parent.parent
+sys.path.insert(0, str(repo_root / "client" / "mcp-server" / "src"))
+
+from protocol import AIDXClient, AIDXConnectionLost
+from config import CMD_GET_OBJECTS, CMD_CREATE_OBJECT
+
+# アドインのprotocol.pyはクライアントと同名のため別名で読み込む
+_spec = importlib.util.spec_from_file_location(
+    "aidx_addin_protocol", repo_root / "addins" / "fusion360" / "AIDX" / "protocol.py"
+)
+addin_protocol = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(addin_protocol)
+
+PORT = 18209
+HANDLER_DELAY = 0.5  # コマンドの実行時間（実行中に接続を切断する）
+
+
+def _slow_handler(request: dict) -> dict:
+    time.sleep(HANDLER_DELAY)
+    return {"success": True}
+
+
+async def _drop_while_executing(client: AIDXClient, cmd_id: int):
+    """コマンドの実行中に接続を切断し、(結果 または 例外, 経過時間) を返す"""
+    task = asyncio.create_task(client.call(cmd_id, {}))
+    await asyncio.sleep(HANDLER_DELAY / 5)
+    start_time = time.time()
+    client.writer.transport.abort()
+    try:
+        result = await task
+    except Exception as e:
+        result = e
+    return result, time.time() - start_time
+
+
+async def test_reconnect():
+    """接続断のテスト（変更系コマンドは即座に失敗、読み取り専用コマンドは再接続後にRESUMEで再開）"""
+    server = addin_protocol.AIDXServer(port=PORT)
+    server.register_command(CMD_GET_OBJECTS, _slow_handler)
+    server.register_command(CMD_CREATE_OBJECT, _slow_handler)
+    server.start()
+    client = AIDXClient(host="127.0.0.1", port=PORT)
+    failed = False
+
+    try:
+        print("=" * 60)
+        print("Reconnect テスト")
+        print("=" * 60)
+
+        await client.connect()
+        print("✓ 接続成功\n")
+
+        # テストケース1: 変更系コマンドは再接続を待たずにAIDXConnectionLostで失敗
+        print("[1] 変更系コマンドの実行中に切断（即座にAIDXConnectionLost期待）")
+        result, elapsed = await _drop_while_executing(client, CMD_CREATE_OBJECT)
+        if isinstance(result, AIDXConnectionLost) and elapsed < 1.0:
+            print(f"✓ 期待通りのエラー ({elapsed:.3f}秒): {result}")
+        else:
+            print(f"✗ 予期しない結果 ({elapsed:.3f}秒): {result!r}")
+            failed = True
+
+        # テストケース2: 読み取り専用コマンドは再接続を待ち、RESUMEで実行結果を受け取る
+        print("\n[2] 読み取り専用コマンドの実行中に切断（再接続後にRESUMEで結果受信期待）")
+        result, elapsed = await _drop_while_executing(client, CMD_GET_OBJECTS)
+        if isinstance(result, dict) and result.get("success"):
+            print(f"✓ 再開成功 ({elapsed:.3f}秒)")
+        else:
+            print(f"✗ 予期しない結果 ({elapsed:.3f}秒): {result!r}")
+            failed = True
+
+        # テストケース3: 再接続後は変更系コマンドも通常どおり実行できる
+        print("\n[3] 再接続後の変更系コマンド")
+        result = await client.call(CMD_CREATE_OBJECT, {})
+        if result.get("success"):
+            print("✓ 成功")
+        else:
+            print(f"✗ 予期しない結果: {result!r}")
+            failed = True
+
+    except Exception as e:
+        print(f"\n✗ エラー: {type(e).__name__}: {e}")
+        import traceback
+        traceback.print_exc()
+        failed = True
+    finally:
+        await client.close()
+        server.stop()
+
+    print(f"\n{'=' * 60}")
+    print("テスト失敗" if failed else "テスト完了")
+    print("=" * 60)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(test_reconnect()))
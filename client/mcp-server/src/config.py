@@ -12,23 +12,104 @@ CAD_PORTS = {
 AIDX_HOST = "127.0.0.1"
 AIDX_PORT = int(os.getenv("AIDX_PORT", CAD_PORTS.get(CAD_TYPE, 8109)))
 
+# トランスポート（tcp / unix）
+# unix: 同一マシン上のアドインへUnixドメインソケットで接続（AF_UNIX非対応環境ではtcp）
+AIDX_TRANSPORT = os.getenv("AIDX_TRANSPORT", "tcp")
+AIDX_SOCKET_PATH = os.getenv(
+    "AIDX_SOCKET_PATH",
+    str(Path(os.environ.get("TEMP", "/tmp")) / f"aidx_{CAD_TYPE}.sock")
+)
+
 # タイムアウト設定（秒）
 CONNECT_TIMEOUT = 10
-RECV_TIMEOUT = 30
-COMMAND_TIMEOUT = 300
+RECV_TIMEOUT = 30  # 期限をアドインへ通知していないリクエストで受信が進まない場合に待つ時間
+COMMAND_TIMEOUT = 300  # リクエストの既定の期限（ヘッダのReservedでアドインへ通知）
+
+# 期限の単位（ヘッダのReservedに送信時点からの残り時間をこの単位で格納、0は期限なし）
+DEADLINE_UNIT = 0.01
+DEADLINE_MAX = 0xFFFF  # 約655秒、これを超える期限はアドインへ通知しない（v1ヘッダ）
+DEADLINE_MAX_V2 = 0xFFFFFFFF  # v2ヘッダのReservedは32bit
 
-# 接続リトライ設定
-CONNECT_RETRY_MAX = 10      # 最大リトライ回数
-CONNECT_RETRY_INTERVAL = 3  # リトライ間隔（秒）
+# 接続プール（書き込み用の1接続を含む接続数、アドイン側の上限は8接続）
+# 読み取り専用コマンドは書き込み用以外の接続に振り分ける
+POOL_SIZE = int(os.getenv("AIDX_POOL_SIZE", 3))
+POOL_REFILL_MAX_DELAY = 30.0  # 不足した読み取り用接続を再試行する間隔の上限（秒）
+
+# 自動再接続設定（接続断の検出後、ジッター付き指数バックオフでclose()まで再接続を試行）
+RECONNECT_BASE_DELAY = 0.05  # 初回の最大待機時間（秒）
+RECONNECT_MAX_DELAY = 2.0    # 待機時間の上限（秒）
+RECONNECT_WAIT = 10          # 再接続中に発行されたリクエストが再接続を待つ時間（秒）
+RESEND_MAX = 2               # 読み取り専用コマンドを再接続後に再送する最大回数
+RESUME_MAX = 3               # 分割転送を再接続後にRESUMEで再開する最大回数（アドイン側は切断から300秒保持）
 
 # プロトコル定数
 AIDX_MAGIC = 0x41494458
-CHUNK_SIZE = 64 * 1024  # 64KB
+AIDX_MAGIC_V2 = 0x41494432  # v2ヘッダ（HELLOでversion 2をネゴシエーションした後に使用）
+PROTOCOL_VERSION = 2
+# ヘッダ形式（受信はMagicで判別）
+# v1: Magic, CommandID, Flags, Sequence(16bit), Reserved(16bit), PayloadSize(32bit), TotalSize(32bit)
+# v2: Magic, CommandID, Flags, Sequence(32bit), Reserved(32bit), PayloadSize(32bit), TotalSize(64bit)
+HEADER_FORMAT = "<IHHHHII"
+HEADER_FORMAT_V2 = "<IHHIIIQ"
+HEADER_SIZE = 20
+HEADER_SIZE_V2 = 28
+CHUNK_SIZE = 64 * 1024  # 64KB（HELLOでネゴシエーションするまでの既定値 / 旧アドイン）
+# HELLOで要求するチャンクサイズ（アドイン側の上限は4MB）
+MAX_CHUNK_SIZE = int(os.getenv("AIDX_MAX_CHUNK_SIZE", 1024 * 1024))
+MAX_IN_FLIGHT = 32  # 同時に応答待ちにするリクエスト数の上限（HELLOでアドイン側の上限に合わせる）
+SEND_HIGH_WATER = 1024 * 1024  # 送信バッファがこのサイズを超えた場合のみdrainで待機
+STREAM_MAX_BUFFERED = 16  # ストリーミング受信で未消費のまま保持するチャンク数の上限（旧アドイン）
+# 分割受信のSequenceごとのウィンドウ（CREDITで返すまでアドインが送れるバイト数、HELLOで通知）
+RECV_WINDOW = 8 * 1024 * 1024
+
+# Flags (圧縮: bit 2 = 圧縮済み, bit 3-4 = 圧縮コーデック, bit 7 = 圧縮レスポンス受入可)
+FLAG_COMPRESSED = 0x0004
+COMPRESSION_MASK = 0x0018
+COMPRESSION_SHIFT = 3
+FLAG_ACCEPT_COMPRESSION = 0x0080
+
+# Flags (bit 8: ペイロードは共有メモリの記述子 {"name", "offset", "size"})
+FLAG_SHARED_MEMORY = 0x0100
+
+# 圧縮コーデック
+COMPRESSION_CODECS = {
+    "zlib": 0,
+    "zstd": 1,
+    "lz4": 2,
+}
+
+# Flags (コンテントタイプ: bit 5-6)
+CONTENT_TYPE_MASK = 0x0060
+CONTENT_TYPE_SHIFT = 5
+
+# コンテントタイプ（raw = 生バイナリ / 従来形式）
+CONTENT_TYPES = {
+    "raw": 0,
+    "json": 1,
+    "msgpack": 2,
+    "cbor": 3,
+}
+
+# コマンドのワイヤ形式（json / msgpack / cbor）
+# msgpack / cbor はアドイン側にもライブラリが必要
+CODEC = os.getenv("AIDX_CODEC", "json")
+
+# ペイロード圧縮（zlib / zstd / lz4 / none）
+# zstd / lz4 はアドイン側にもライブラリが必要
+COMPRESSION = os.getenv("AIDX_COMPRESSION", "zlib")
+COMPRESS_MIN_SIZE = 1024  # これ未満のペイロードは圧縮しない
+COMPRESS_SAMPLE_SIZE = 16 * 1024  # 圧縮効果の事前判定に使う先頭サンプルのサイズ
+COMPRESS_MIN_RATIO = 0.9  # 圧縮後サイズがこの比率以上なら非圧縮で送信
+
+# 共有メモリによるバルク転送（同一マシン上のアドインのみ、1で有効）
+# 大きなレスポンス（スクリーンショット等）をTCPフレームに分割せず共有メモリ経由で受け取る
+SHARED_MEMORY = os.getenv("AIDX_SHARED_MEMORY", "0") == "1"
 
 # コマンドID
 CMD_PING = 0x0001
 CMD_SCREENSHOT = 0x0100
 CMD_IMPORT_FILE = 0x0200
+CMD_UPLOAD_FILE = 0x0201
 CMD_GET_OBJECTS = 0x0300
 CMD_MODIFY = 0x0400
 CMD_CREATE_OBJECT = 0x0500
@@ -37,8 +118,21 @@ CMD_FILLET = 0x0700
 CMD_CHAMFER = 0x0701
 CMD_EXTRUDE = 0x0702
 CMD_COMBINE = 0x0703
+CMD_BATCH = 0x0800
+CMD_DEFER_COMPUTE = 0x0801
+CMD_HELLO = 0xFF00  # 0xFF00以降は制御コマンド
+CMD_SHM_RELEASE = 0xFF01
+CMD_CANCEL = 0xFF02
+CMD_CREDIT = 0xFF03
+CMD_RESUME = 0xFF04
 CMD_ERROR = 0xFFFF
 
+# 読み取り専用コマンド（接続プールの読み取りレーンで送信、CADの状態を変更しない）
+READ_ONLY_COMMANDS = {CMD_PING, CMD_SCREENSHOT, CMD_GET_OBJECTS}
+
+# 生バイナリで応答するコマンド（HELLO非対応の旧アドインでもJSONとしてデコードしない）
+BINARY_COMMANDS = {CMD_SCREENSHOT}
+
 # エラーコード
 ERR_PARSE_ERROR = 0x1000
 ERR_INVALID_COMMAND = 0x1001
@@ -8,11 +8,13 @@ from logging.handlers import RotatingFileHandler
 from mcp.server import Server
 from mcp.server.stdio import stdio_server
 from mcp.types import Tool
-from protocol import AIDXClient, AIDXProtocolError
+from protocol import AIDXProtocolError, AIDXConnectionLost
+from pool import AIDXConnectionPool
 from config import (
     CMD_PING,
     CMD_SCREENSHOT,
     CMD_IMPORT_FILE,
+    CMD_UPLOAD_FILE,
     CMD_GET_OBJECTS,
     CMD_MODIFY,
     CMD_CREATE_OBJECT,
@@ -21,10 +23,11 @@ from config import (
     CMD_CHAMFER,
     CMD_EXTRUDE,
     CMD_COMBINE,
-    CONNECT_RETRY_MAX,
-    CONNECT_RETRY_INTERVAL,
+    CMD_BATCH,
+    CMD_DEFER_COMPUTE,
     AIDX_HOST,
     AIDX_PORT,
+    AIDX_TRANSPORT,
     CAD_TYPE,
     LOG_DIR,
     LOG_FILE,
@@ -62,8 +65,11 @@ logger.addHandler(file_handler)
 # MCPサーバーインスタンス
 app = Server("aidx-mcp")
 
-# AIDXクライアント（グローバル）
-aidx_client: AIDXClient | None = None
+# AIDX接続プール（グローバル、読み取り専用コマンドは書き込み用とは別の接続で送信）
+aidx_pool: AIDXConnectionPool | None = None
+
+# 接続確立の排他（並列ツール呼び出し時の二重接続防止）
+_connect_lock = asyncio.Lock()
 
 
 @app.list_tools()
@@ -109,6 +115,12 @@ async def list_tools() -> list[Tool]:
                         "minItems": 3,
                         "maxItems": 3,
                         "description": "回転角度 [x, y, z] (度数法)"
+                    },
+                    "upload": {
+                        "type": "boolean",
+                        "description": "trueの場合はMCPサーバー側のファイルをCADへ転送してインポート"
+                                       "（CADが別のマシン・コンテナで動作している場合、batchでは使用不可）",
+                        "default": False
                     }
                 },
                 "required": ["path"]
@@ -308,6 +320,59 @@ async def list_tools() -> list[Tool]:
                 },
                 "required": ["profile_ids", "distance", "operation"]
             }
+        ),
+        Tool(
+            name="batch",
+            description="複数のツールを1回の往復で順に実行。argsの文字列 \"$N.キー\" はN番目（0始まり）のステップの結果で置き換えられる（例: \"$0.id\"）",
+            inputSchema={
+                "type": "object",
+                "properties": {
+                    "steps": {
+                        "type": "array",
+                        "items": {
+                            "type": "object",
+                            "properties": {
+                                "tool": {
+                                    "type": "string",
+                                    "enum": list(BATCH_TOOLS),
+                                    "description": "ツール名"
+                                },
+                                "args": {
+                                    "type": "object",
+                                    "description": "ツールの引数（各ツールと同じ形式）"
+                                }
+                            },
+                            "required": ["tool"]
+                        },
+                        "description": "実行するステップ（順に実行）"
+                    },
+                    "stop_on_error": {
+                        "type": "boolean",
+                        "description": "失敗したステップで中断するか",
+                        "default": True
+                    },
+                    "defer_compute": {
+                        "type": "boolean",
+                        "description": "全ステップの実行中はタイムラインの再計算を保留し、最後に1回だけ再計算する",
+                        "default": False
+                    }
+                },
+                "required": ["steps"]
+            }
+        ),
+        Tool(
+            name="defer_compute",
+            description="タイムラインの再計算を保留/再開。保留中のフィーチャー操作は再計算されず、保留を解除した時点でまとめて1回だけ再計算される",
+            inputSchema={
+                "type": "object",
+                "properties": {
+                    "deferred": {
+                        "type": "boolean",
+                        "description": "true=保留開始, false=保留解除（再計算）"
+                    }
+                },
+                "required": ["deferred"]
+            }
         )
     ]
     logging.debug(f"Returning {len(tools)} tools")
@@ -316,8 +381,7 @@ async def list_tools() -> list[Tool]:
 
 async def _ping() -> dict:
     """Ping実行"""
-    response = await aidx_client.send_command(CMD_PING)
-    result = json.loads(response.decode("utf-8"))
+    result = await aidx_pool.call(CMD_PING)
     return {"content": [{"type": "text", "text": json.dumps(result, indent=2, ensure_ascii=False)}]}
 
 
@@ -326,28 +390,29 @@ async def _ensure_connection():
     CAD接続を確保（未接続の場合は接続試行）
 
     Returns:
-        接続済みのAIDXClient
+        接続済みのAIDXConnectionPool
 
     Raises:
         RuntimeError: 接続に失敗した場合
     """
-    global aidx_client
-
-    if aidx_client is None:
-        # 初回接続試行（リトライなし、即座に失敗）
-        client = AIDXClient()
-        try:
-            logging.info(f"Connecting to {CAD_TYPE} at {AIDX_HOST}:{AIDX_PORT}...")
-            await client.connect()
-            logging.info(f"Successfully connected to {CAD_TYPE}!")
-            aidx_client = client
-        except (ConnectionRefusedError, OSError) as e:
-            raise RuntimeError(
-                f"Failed to connect to {CAD_TYPE} at {AIDX_HOST}:{AIDX_PORT}. "
-                f"Please ensure the CAD addin is running. Details: {e}"
-            )
+    global aidx_pool
+
+    async with _connect_lock:
+        if aidx_pool is None:
+            # 初回接続試行（リトライなし、即座に失敗）
+            pool = AIDXConnectionPool()
+            try:
+                logging.info(f"Connecting to {CAD_TYPE} at {pool.address}...")
+                await pool.connect()
+                logging.info(f"Successfully connected to {CAD_TYPE}! ({1 + len(pool.readers)} connection(s))")
+                aidx_pool = pool
+            except (ConnectionRefusedError, OSError, AIDXProtocolError) as e:
+                raise RuntimeError(
+                    f"Failed to connect to {CAD_TYPE} at {pool.address}. "
+                    f"Please ensure the CAD addin is running. Details: {e}"
+                )
 
-    return aidx_client
+    return aidx_pool
 
 
 @app.call_tool()
@@ -394,6 +459,10 @@ async def call_tool(name: str, arguments: dict):
             result = await _chamfer(arguments)
         elif name == "extrude":
             result = await _extrude(arguments)
+        elif name == "batch":
+            result = await _batch(arguments)
+        elif name == "defer_compute":
+            result = await _defer_compute(arguments)
         else:
             logging.warning(f"Unknown tool requested: {name}")
             return {
@@ -423,6 +492,18 @@ async def call_tool(name: str, arguments: dict):
             "isError": True
         }
 
+    except AIDXConnectionLost as e:
+        # 応答待ちのまま接続が切断された（アドインの再起動等、自動で再接続する）
+        return {
+            "content": [{
+                "type": "text",
+                "text": f"Connection to CAD was lost (retryable): {e.message}\n"
+                        f"The connection is being re-established automatically. "
+                        f"Check the CAD state before retrying this tool."
+            }],
+            "isError": True
+        }
+
     except Exception as e:
         # 予期しないエラー
         return {
@@ -436,7 +517,7 @@ async def call_tool(name: str, arguments: dict):
 
 async def _screenshot() -> dict:
     """スクリーンショット取得"""
-    image_data = await aidx_client.send_command(CMD_SCREENSHOT)
+    image_data = await aidx_pool.call(CMD_SCREENSHOT)
     return {
         "content": [
             {
@@ -448,102 +529,124 @@ async def _screenshot() -> dict:
     }
 
 
-async def _import_file(args: dict) -> dict:
-    """ファイルインポート"""
-    payload = json.dumps({
+def _import_file_request(args: dict) -> dict:
+    """ファイルインポートのリクエスト構築"""
+    if args.get("upload"):
+        raise ValueError("upload cannot be used in batch (upload the file with import_file first)")
+    return {
         "path": args["path"],
         "pos": args.get("pos", [0, 0, 0]),
         "rot": args.get("rot", [0, 0, 0])
-    }).encode("utf-8")
+    }
 
-    response = await aidx_client.send_command(CMD_IMPORT_FILE, payload)
-    result = json.loads(response.decode("utf-8"))
+
+async def _import_file(args: dict) -> dict:
+    """ファイルインポート（uploadの場合はファイルの内容を分割送信し、CAD側に保存されたパスをインポート）"""
+    if args.get("upload"):
+        # ファイルは全体をメモリに読み込まずチャンク単位で送信
+        uploaded = json.loads(await aidx_pool.send_command(CMD_UPLOAD_FILE, args["path"]))
+        if not uploaded.get("success"):
+            return {"content": [{"type": "text", "text": json.dumps(uploaded, indent=2)}]}
+        args = {**args, "path": uploaded["path"], "upload": False}
+
+    result = await aidx_pool.call(CMD_IMPORT_FILE, _import_file_request(args))
 
     return {"content": [{"type": "text", "text": json.dumps(result, indent=2)}]}
 
 
+def _get_objects_request(args: dict) -> dict:
+    """オブジェクト情報取得のリクエスト構築"""
+    return args.get("filter", {})
+
+
 async def _get_objects(args: dict) -> dict:
     """オブジェクト情報取得"""
-    filter_data = args.get("filter", {})
-    payload = json.dumps(filter_data).encode("utf-8")
-
-    response = await aidx_client.send_command(CMD_GET_OBJECTS, payload)
-    result = json.loads(response.decode("utf-8"))
+    result = await aidx_pool.call(CMD_GET_OBJECTS, _get_objects_request(args))
 
     return {"content": [{"type": "text", "text": json.dumps(result, indent=2)}]}
 
 
-async def _modify(args: dict) -> dict:
-    """オブジェクト変形"""
-    payload = json.dumps({
+def _modify_request(args: dict) -> dict:
+    """オブジェクト変形のリクエスト構築"""
+    return {
         "id": args["id"],
         "matrix": args["matrix"]
-    }).encode("utf-8")
+    }
 
-    response = await aidx_client.send_command(CMD_MODIFY, payload)
-    result = json.loads(response.decode("utf-8"))
+
+async def _modify(args: dict) -> dict:
+    """オブジェクト変形"""
+    result = await aidx_pool.call(CMD_MODIFY, _modify_request(args))
 
     return {"content": [{"type": "text", "text": json.dumps(result, indent=2)}]}
 
 
-async def _create_object(args: dict) -> dict:
-    """プリミティブ形状作成"""
-    payload = json.dumps({
+def _create_object_request(args: dict) -> dict:
+    """プリミティブ形状作成のリクエスト構築"""
+    return {
         "type": args["type"],
         "params": args["params"],
         "position": args.get("position", [0, 0, 0]),
         "rotation": args.get("rotation", [0, 0, 0])
-    }).encode("utf-8")
+    }
 
-    response = await aidx_client.send_command(CMD_CREATE_OBJECT, payload)
-    result = json.loads(response.decode("utf-8"))
+
+async def _create_object(args: dict) -> dict:
+    """プリミティブ形状作成"""
+    result = await aidx_pool.call(CMD_CREATE_OBJECT, _create_object_request(args))
 
     return {"content": [{"type": "text", "text": json.dumps(result, indent=2, ensure_ascii=False)}]}
 
 
-async def _delete_object(args: dict) -> dict:
-    """オブジェクト削除"""
-    payload = json.dumps({
+def _delete_object_request(args: dict) -> dict:
+    """オブジェクト削除のリクエスト構築"""
+    return {
         "id": args["id"],
         "type": args.get("type", "BRepBody")
-    }).encode("utf-8")
+    }
 
-    response = await aidx_client.send_command(CMD_DELETE_OBJECT, payload)
-    result = json.loads(response.decode("utf-8"))
+
+async def _delete_object(args: dict) -> dict:
+    """オブジェクト削除"""
+    result = await aidx_pool.call(CMD_DELETE_OBJECT, _delete_object_request(args))
 
     return {"content": [{"type": "text", "text": json.dumps(result, indent=2, ensure_ascii=False)}]}
 
 
-async def _combine(args: dict) -> dict:
-    """結合演算"""
-    payload = json.dumps({
+def _combine_request(args: dict) -> dict:
+    """結合演算のリクエスト構築"""
+    return {
         "target_body_id": args["target_body_id"],
         "tool_body_ids": args["tool_body_ids"],
         "operation": args["operation"],
         "keep_tools": args.get("keep_tools", False)
-    }).encode("utf-8")
+    }
 
-    response = await aidx_client.send_command(CMD_COMBINE, payload)
-    result = json.loads(response.decode("utf-8"))
+
+async def _combine(args: dict) -> dict:
+    """結合演算"""
+    result = await aidx_pool.call(CMD_COMBINE, _combine_request(args))
 
     return {"content": [{"type": "text", "text": json.dumps(result, indent=2, ensure_ascii=False)}]}
 
 
-async def _fillet(args: dict) -> dict:
-    """フィレット"""
-    payload = json.dumps({
+def _fillet_request(args: dict) -> dict:
+    """フィレットのリクエスト構築"""
+    return {
         "edge_ids": args["edge_ids"],
         "radius": args["radius"]
-    }).encode("utf-8")
+    }
+
 
-    response = await aidx_client.send_command(CMD_FILLET, payload)
-    result = json.loads(response.decode("utf-8"))
+async def _fillet(args: dict) -> dict:
+    """フィレット"""
+    result = await aidx_pool.call(CMD_FILLET, _fillet_request(args))
 
     return {"content": [{"type": "text", "text": json.dumps(result, indent=2, ensure_ascii=False)}]}
 
 
-async def _chamfer(args: dict) -> dict:
-    """シャンファー"""
+def _chamfer_request(args: dict) -> dict:
+    """シャンファーのリクエスト構築"""
     payload_data = {"edge_ids": args["edge_ids"]}
 
     # distanceまたはdistance1/distance2を設定
@@ -553,68 +656,95 @@ async def _chamfer(args: dict) -> dict:
         payload_data["distance1"] = args.get("distance1", 5)
         payload_data["distance2"] = args.get("distance2", 5)
 
-    payload = json.dumps(payload_data).encode("utf-8")
+    return payload_data
 
-    response = await aidx_client.send_command(CMD_CHAMFER, payload)
-    result = json.loads(response.decode("utf-8"))
+
+async def _chamfer(args: dict) -> dict:
+    """シャンファー"""
+    result = await aidx_pool.call(CMD_CHAMFER, _chamfer_request(args))
 
     return {"content": [{"type": "text", "text": json.dumps(result, indent=2, ensure_ascii=False)}]}
 
 
-async def _extrude(args: dict) -> dict:
-    """押し出し"""
-    payload = json.dumps({
+def _extrude_request(args: dict) -> dict:
+    """押し出しのリクエスト構築"""
+    return {
         "profile_ids": args["profile_ids"],
         "distance": args["distance"],
         "operation": args["operation"],
         "direction": args.get("direction", "positive"),
         "taper_angle": args.get("taper_angle", 0)
-    }).encode("utf-8")
+    }
 
-    response = await aidx_client.send_command(CMD_EXTRUDE, payload)
-    result = json.loads(response.decode("utf-8"))
+
+async def _extrude(args: dict) -> dict:
+    """押し出し"""
+    result = await aidx_pool.call(CMD_EXTRUDE, _extrude_request(args))
 
     return {"content": [{"type": "text", "text": json.dumps(result, indent=2, ensure_ascii=False)}]}
 
 
-async def connect_with_retry() -> AIDXClient:
-    """
-    CADアドインへの接続（リトライ機能付き）
+# batchツールのステップで使用できるツール（ツール名 → (コマンドID, リクエスト構築関数)）
+# 単体のツール呼び出しと同じ既定値・引数の整形を適用する
+BATCH_TOOLS = {
+    "ping": (CMD_PING, lambda args: {}),
+    "import_file": (CMD_IMPORT_FILE, _import_file_request),
+    "get_objects": (CMD_GET_OBJECTS, _get_objects_request),
+    "modify": (CMD_MODIFY, _modify_request),
+    "create_object": (CMD_CREATE_OBJECT, _create_object_request),
+    "delete_object": (CMD_DELETE_OBJECT, _delete_object_request),
+    "combine": (CMD_COMBINE, _combine_request),
+    "fillet": (CMD_FILLET, _fillet_request),
+    "chamfer": (CMD_CHAMFER, _chamfer_request),
+    "extrude": (CMD_EXTRUDE, _extrude_request),
+}
+
+
+async def _batch(args: dict) -> dict:
+    """バッチ実行"""
+    steps = []
+    for index, step in enumerate(args["steps"]):
+        if step["tool"] not in BATCH_TOOLS:
+            raise ValueError(f"Tool cannot be used in batch: {step['tool']}")
+        cmd_id, build_request = BATCH_TOOLS[step["tool"]]
+        try:
+            request = build_request(step.get("args", {}))
+        except KeyError as e:
+            raise ValueError(f"Step {index} ({step['tool']}): missing argument {e}")
+        except ValueError as e:
+            raise ValueError(f"Step {index} ({step['tool']}): {e}")
+        steps.append({
+            "command_id": cmd_id,
+            "request": request
+        })
+
+    request = {
+        "steps": steps,
+        "stop_on_error": args.get("stop_on_error", True),
+        "defer_compute": args.get("defer_compute", False)
+    }
 
-    Returns:
-        接続済みのAIDXClient
+    result = await aidx_pool.call(CMD_BATCH, request)
 
-    Raises:
-        RuntimeError: 最大リトライ回数を超えても接続できなかった場合
-    """
-    client = AIDXClient()
+    return {"content": [{"type": "text", "text": json.dumps(result, indent=2, ensure_ascii=False)}]}
 
-    for attempt in range(1, CONNECT_RETRY_MAX + 1):
-        try:
-            logging.info(f"Connecting to {CAD_TYPE} at {AIDX_HOST}:{AIDX_PORT}... (attempt {attempt}/{CONNECT_RETRY_MAX})")
-            await client.connect()
-            logging.info(f"Successfully connected to {CAD_TYPE}!")
-            return client
-
-        except (ConnectionRefusedError, OSError) as e:
-            if attempt < CONNECT_RETRY_MAX:
-                logging.warning(f"Connection failed: {e}. Retrying in {CONNECT_RETRY_INTERVAL} seconds...")
-                await asyncio.sleep(CONNECT_RETRY_INTERVAL)
-            else:
-                logging.error(f"Connection failed after {CONNECT_RETRY_MAX} attempts.")
-                raise RuntimeError(
-                    f"Failed to connect to {CAD_TYPE} at {AIDX_HOST}:{AIDX_PORT}. "
-                    f"Please ensure the CAD addin is running."
-                )
+
+async def _defer_compute(args: dict) -> dict:
+    """再計算の保留/再開"""
+    request = {"deferred": args["deferred"]}
+
+    result = await aidx_pool.call(CMD_DEFER_COMPUTE, request)
+
+    return {"content": [{"type": "text", "text": json.dumps(result, indent=2, ensure_ascii=False)}]}
 
 
 async def main():
     """メインエントリーポイント"""
-    global aidx_client
+    global aidx_pool
 
     # 起動時は接続しない（遅延接続方式）
-    aidx_client = None
-    logging.info(f"AIDX MCP Server started (target: {CAD_TYPE} at {AIDX_HOST}:{AIDX_PORT})")
+    aidx_pool = None
+    logging.info(f"AIDX MCP Server started (target: {CAD_TYPE} at {AIDX_HOST}:{AIDX_PORT}, transport: {AIDX_TRANSPORT})")
     logging.info("Connection will be established on first tool use.")
 
     # MCPサーバー起動（stdio経由）
@@ -0,0 +1,180 @@
+"""AIDX接続プール（読み取りレーン / 書き込みレーン）"""
+import asyncio
+import random
+import sys
+from contextlib import aclosing
+from typing import Any, AsyncIterator, Optional
+from config import (
+    POOL_SIZE,
+    POOL_REFILL_MAX_DELAY,
+    READ_ONLY_COMMANDS,
+    CONNECT_TIMEOUT,
+    RECONNECT_BASE_DELAY,
+    COMMAND_TIMEOUT,
+)
+from protocol import AIDXClient, AIDXProtocolError, UploadSource
+
+
+class AIDXConnectionPool:
+    """
+    AIDX接続プール
+
+    状態を変更するコマンドは書き込み用の1接続（書き込みレーン）で送信し、発行順を保ちます。
+    読み取り専用のコマンド（READ_ONLY_COMMANDS）は読み取り用の接続（読み取りレーン）のうち
+    応答待ちが最も少ない接続へ振り分けます。大きなスクリーンショットの転送中でも、
+    並行して発行された軽い読み取りが同じ接続の後ろで待たされません。
+
+    読み取りと書き込みは別接続のため、書き込みの完了を待たずに発行した読み取りは
+    書き込み前の状態を返す場合があります（書き込みのレスポンスを待ってから読み取ってください）。
+
+    AIDXClientと同じ call() / send_command() / send_command_stream() を提供します。
+    """
+
+    def __init__(self, size: int = POOL_SIZE, **client_kwargs):
+        """
+        Args:
+            size: 接続数（書き込み用の1接続を含む、1なら全コマンドを1接続で送信）
+            client_kwargs: 各接続のAIDXClientに渡す引数（host, port, transport等）
+        """
+        self.size = max(1, size)
+        self._client_kwargs = client_kwargs
+        # 接続先の表示用文字列
+        self.address = AIDXClient(**client_kwargs).address
+        # 書き込みレーン（接続確立前はNone）
+        self.writer: Optional[AIDXClient] = None
+        # 読み取りレーン（接続できたもののみ）
+        self.readers: list[AIDXClient] = []
+        # 不足した読み取り用接続を補充するバックグラウンドタスク
+        self._refill_task: Optional[asyncio.Task] = None
+
+    async def connect(self) -> None:
+        """
+        書き込み用の接続を確立し、続けて読み取り用の接続を確立
+
+        読み取り用の接続に失敗した場合（アドインの同時接続数の上限等）は、
+        接続できた分だけで継続し、不足分はバックグラウンドで再試行します。
+        HELLOに対応していない旧アドインは同時に1接続しか処理できないため、
+        書き込み用の接続のみを使用します。確立済みの接続が切断された場合は各接続が自動で再接続します。
+        """
+        writer = AIDXClient(**self._client_kwargs)
+        await writer.connect()
+        self.writer = writer
+        self.readers = []
+
+        if writer.server_commands is None:
+            return
+
+        for _ in range(self.size - 1):
+            if not await self._add_reader():
+                print(f"[CLIENT] Continuing with {len(self.readers)} read connection(s), "
+                      f"retrying the rest in the background", file=sys.stderr)
+                self._refill_task = asyncio.create_task(self._refill_readers())
+                break
+
+    async def _add_reader(self) -> bool:
+        """読み取り用の接続を1本追加（失敗したらFalse）"""
+        reader = AIDXClient(**self._client_kwargs)
+        try:
+            await asyncio.wait_for(reader.connect(), timeout=CONNECT_TIMEOUT)
+        except (OSError, AIDXProtocolError, asyncio.TimeoutError) as e:
+            print(f"[CLIENT] Read connection to {reader.address} failed: {type(e).__name__}: {e}", file=sys.stderr)
+            await reader.close()
+            return False
+        self.readers.append(reader)
+        return True
+
+    async def _refill_readers(self) -> None:
+        """
+        不足した読み取り用接続を補充（バックグラウンドタスク）
+
+        AIDXClientの再接続と同じくフルジッターで待機し、失敗のたびに上限を倍にします
+        （POOL_REFILL_MAX_DELAYまで）。全ての読み取り用接続が揃うか、close()まで試行を続けます。
+        """
+        delay = RECONNECT_BASE_DELAY
+        while self.writer is not None and len(self.readers) < self.size - 1:
+            await asyncio.sleep(random.uniform(0, delay))
+            if self.writer is None or not self.writer.is_connected:
+                # 書き込み用の接続が再接続中ならアドインも停止している可能性が高い
+                delay = min(delay * 2, POOL_REFILL_MAX_DELAY)
+                continue
+            if await self._add_reader():
+                print(f"[CLIENT] Read connection added ({len(self.readers)} read connection(s))", file=sys.stderr)
+                delay = RECONNECT_BASE_DELAY
+            else:
+                delay = min(delay * 2, POOL_REFILL_MAX_DELAY)
+
+    async def close(self) -> None:
+        """全接続を閉じる"""
+        if self._refill_task is not None:
+            self._refill_task.cancel()
+            try:
+                await self._refill_task
+            except (asyncio.CancelledError, Exception):
+                pass
+            self._refill_task = None
+        clients = [c for c in [self.writer, *self.readers] if c is not None]
+        self.writer = None
+        self.readers = []
+        await asyncio.gather(*(c.close() for c in clients), return_exceptions=True)
+
+    @property
+    def is_connected(self) -> bool:
+        """書き込み用の接続が稼働中か"""
+        return self.writer is not None and self.writer.is_connected
+
+    def client_for(self, cmd_id: int) -> AIDXClient:
+        """
+        コマンドを送信する接続を選択
+
+        読み取り専用のコマンドは稼働中の読み取り用接続のうち応答待ちが最も少ないものを、
+        それ以外（および読み取り用接続がない場合）は書き込み用の接続を返します。
+        """
+        if self.writer is None:
+            raise ConnectionError("Not connected to AIDX server")
+
+        if cmd_id in READ_ONLY_COMMANDS:
+            readers = [c for c in self.readers if c.is_connected]
+            if readers:
+                return min(readers, key=lambda c: c.in_flight)
+        return self.writer
+
+    async def call(
+        self,
+        cmd_id: int,
+        request: Any = None,
+        timeout: Optional[float] = COMMAND_TIMEOUT
+    ) -> Any:
+        """オブジェクトを送信し、デコード済みのレスポンスを受信（AIDXClient.call()参照）"""
+        return await self.client_for(cmd_id).call(cmd_id, request, timeout)
+
+    async def send_command(
+        self,
+        cmd_id: int,
+        payload: UploadSource = b"",
+        total_size: Optional[int] = None,
+        timeout: Optional[float] = COMMAND_TIMEOUT
+    ) -> bytes:
+        """コマンドを送信しレスポンスを受信（AIDXClient.send_command()参照）"""
+        return await self.client_for(cmd_id).send_command(
+            cmd_id, payload, total_size=total_size, timeout=timeout
+        )
+
+    async def send_command_stream(
+        self,
+        cmd_id: int,
+        payload: bytes = b"",
+        flags: int = 0x0000,
+        timeout: Optional[float] = COMMAND_TIMEOUT
+    ) -> AsyncIterator[memoryview]:
+        """コマンドを送信し、レスポンスをチャンク単位で受信（AIDXClient.send_command_stream()参照）"""
+        client = self.client_for(cmd_id)
+        async with aclosing(client.send_command_stream(cmd_id, payload, flags, timeout)) as stream:
+            async for chunk in stream:
+                yield chunk
+
+    async def __aenter__(self):
+        await self.connect()
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.close()
@@ -1,121 +1,1436 @@
 """AIDXプロトコル実装（TCPクライアント）"""
 import asyncio
+import os
+import random
+import socket
 import struct
 import json
+import math
 import sys
-from typing import Optional
+import zlib
+from typing import Any, AsyncIterable, AsyncIterator, BinaryIO, Callable, Optional, Union
 from config import (
     AIDX_HOST,
     AIDX_PORT,
+    AIDX_TRANSPORT,
+    AIDX_SOCKET_PATH,
     AIDX_MAGIC,
+    AIDX_MAGIC_V2,
+    PROTOCOL_VERSION,
+    HEADER_FORMAT,
+    HEADER_FORMAT_V2,
+    HEADER_SIZE,
+    HEADER_SIZE_V2,
     CHUNK_SIZE,
+    MAX_CHUNK_SIZE,
+    MAX_IN_FLIGHT,
+    SEND_HIGH_WATER,
+    STREAM_MAX_BUFFERED,
+    RECV_WINDOW,
     RECV_TIMEOUT,
+    CONNECT_TIMEOUT,
+    COMMAND_TIMEOUT,
+    DEADLINE_UNIT,
+    DEADLINE_MAX,
+    DEADLINE_MAX_V2,
+    RECONNECT_BASE_DELAY,
+    RECONNECT_MAX_DELAY,
+    RECONNECT_WAIT,
+    RESEND_MAX,
+    RESUME_MAX,
+    READ_ONLY_COMMANDS,
+    BINARY_COMMANDS,
+    CMD_HELLO,
+    CMD_SHM_RELEASE,
+    CMD_CANCEL,
+    CMD_CREDIT,
+    CMD_RESUME,
     CMD_ERROR,
+    FLAG_COMPRESSED,
+    COMPRESSION_MASK,
+    COMPRESSION_SHIFT,
+    FLAG_ACCEPT_COMPRESSION,
+    FLAG_SHARED_MEMORY,
+    SHARED_MEMORY,
+    COMPRESSION_CODECS,
+    COMPRESSION,
+    COMPRESS_MIN_SIZE,
+    COMPRESS_SAMPLE_SIZE,
+    COMPRESS_MIN_RATIO,
+    CONTENT_TYPE_MASK,
+    CONTENT_TYPE_SHIFT,
+    CONTENT_TYPES,
+    CODEC,
 )
 
+# 任意のバイナリコーデック（インストールされている場合のみ使用）
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import cbor2
+except ImportError:
+    cbor2 = None
+
+# 任意の圧縮ライブラリ（インストールされている場合のみ使用）
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+try:
+    import lz4.frame
+except ImportError:
+    lz4 = None
+
+# 共有メモリ（大きなレスポンスのバルク転送）
+try:
+    from multiprocessing import resource_tracker, shared_memory
+except ImportError:
+    shared_memory = None
+
+# 3.13以降は参照側の共有メモリをresource_trackerに登録しない指定ができる
+SHARED_MEMORY_KWARGS = {"track": False} if sys.version_info >= (3, 13) else {}
+
 
 class AIDXProtocolError(Exception):
     """AIDXプロトコルエラー"""
     def __init__(self, code: int, message: str, cmd_id: int = 0, seq: int = 0):
         super().__init__(message)
         self.code = code
+        self.message = message
         self.cmd_id = cmd_id
         self.seq = seq
 
 
+class AIDXConnectionLost(ConnectionError):
+    """
+    応答待ちのまま接続が切断された（アドインの再起動等）
+
+    コマンドが実行されたかどうかは不明です。クライアントは自動的に再接続するため、
+    CADの状態を確認した上で再試行できます。
+    """
+    retryable = True
+
+    def __init__(self, message: str, cmd_id: int = 0, seq: int = 0):
+        super().__init__(message)
+        self.message = message
+        self.cmd_id = cmd_id
+        self.seq = seq
+
+
+def _content_codecs() -> dict[int, tuple[Callable[[Any], bytes], Callable[[bytes], Any]]]:
+    """利用可能なコンテントコーデック（コンテントタイプ → (エンコード関数, デコード関数)）"""
+    codecs = {
+        CONTENT_TYPES["json"]: (
+            lambda obj: json.dumps(obj, ensure_ascii=False).encode("utf-8"),
+            json.loads,
+        ),
+    }
+    if msgpack is not None:
+        # floatは8バイトのバイナリ（float64）としてそのまま格納される
+        codecs[CONTENT_TYPES["msgpack"]] = (
+            lambda obj: msgpack.packb(obj, use_bin_type=True),
+            lambda data: msgpack.unpackb(data, raw=False),
+        )
+    if cbor2 is not None:
+        codecs[CONTENT_TYPES["cbor"]] = (cbor2.dumps, cbor2.loads)
+    return codecs
+
+
+CONTENT_CODECS = _content_codecs()
+
+
+def decode_content(payload: bytes, flags: int, cmd_id: int = 0, seq: int = 0) -> Any:
+    """
+    レスポンスペイロードをFlagsのコンテントタイプに従ってデコード
+
+    生バイナリ（スクリーンショット等）はbytesのまま返します。
+    """
+    content_type = (flags & CONTENT_TYPE_MASK) >> CONTENT_TYPE_SHIFT
+    if content_type == CONTENT_TYPES["raw"]:
+        return payload
+    if len(payload) == 0:
+        return None
+
+    if content_type not in CONTENT_CODECS:
+        raise AIDXProtocolError(
+            0x1002,
+            f"Unsupported content type: {content_type}",
+            cmd_id,
+            seq
+        )
+
+    try:
+        return CONTENT_CODECS[content_type][1](payload)
+    except Exception as e:
+        raise AIDXProtocolError(
+            0x1002,
+            f"Failed to decode payload (content type {content_type}): {type(e).__name__}: {e}",
+            cmd_id,
+            seq
+        )
+
+
+def _compressors() -> dict[int, tuple[Callable[[bytes], bytes], Callable[[bytes], bytes]]]:
+    """利用可能な圧縮コーデック（コーデックID → (圧縮関数, 展開関数)）"""
+    codecs = {
+        COMPRESSION_CODECS["zlib"]: (lambda data: zlib.compress(data, 1), zlib.decompress),
+    }
+    if zstandard is not None:
+        codecs[COMPRESSION_CODECS["zstd"]] = (
+            lambda data: zstandard.ZstdCompressor().compress(data),
+            lambda data: zstandard.ZstdDecompressor().decompress(data),
+        )
+    if lz4 is not None:
+        codecs[COMPRESSION_CODECS["lz4"]] = (lz4.frame.compress, lz4.frame.decompress)
+    return codecs
+
+
+COMPRESSORS = _compressors()
+
+
+def compress_payload(payload: bytes, codec: int) -> Optional[bytes]:
+    """
+    ペイロードを圧縮
+
+    小さいペイロード、および先頭サンプルの圧縮効果が乏しいもの（PNG等の圧縮済みデータ）は圧縮しません。
+
+    Returns:
+        圧縮後のデータ、または圧縮しない場合None
+    """
+    if len(payload) < COMPRESS_MIN_SIZE or codec not in COMPRESSORS:
+        return None
+
+    compress = COMPRESSORS[codec][0]
+    if len(payload) > COMPRESS_SAMPLE_SIZE:
+        sample = memoryview(payload)[:COMPRESS_SAMPLE_SIZE]
+        if len(compress(sample)) >= len(sample) * COMPRESS_MIN_RATIO:
+            return None
+
+    compressed = compress(payload)
+    if len(compressed) >= len(payload) * COMPRESS_MIN_RATIO:
+        return None
+    return compressed
+
+
+def _stream_decompressors() -> dict[int, Callable[[], Any]]:
+    """利用可能な逐次展開器（コーデックID → decompress(data)を持つ展開器の生成関数）"""
+    factories = {
+        COMPRESSION_CODECS["zlib"]: zlib.decompressobj,
+    }
+    if zstandard is not None:
+        factories[COMPRESSION_CODECS["zstd"]] = lambda: zstandard.ZstdDecompressor().decompressobj()
+    if lz4 is not None:
+        factories[COMPRESSION_CODECS["lz4"]] = lz4.frame.LZ4FrameDecompressor
+    return factories
+
+
+STREAM_DECOMPRESSORS = _stream_decompressors()
+
+
+def open_shared_memory(descriptor: bytes, cmd_id: int = 0, seq: int = 0) -> tuple[Any, memoryview]:
+    """
+    アドインが作成した共有メモリをマップ
+
+    Args:
+        descriptor: 共有メモリの記述子（JSON: {"name", "offset", "size"}）
+
+    Returns:
+        (SharedMemory, ペイロード部分のmemoryview) のタプル。使用後はviewを解放してからcloseする
+    """
+    try:
+        info = json.loads(descriptor)
+        shm = shared_memory.SharedMemory(name=info["name"], **SHARED_MEMORY_KWARGS)
+    except Exception as e:
+        raise AIDXProtocolError(
+            0x1002,
+            f"Failed to open shared memory: {type(e).__name__}: {e}",
+            cmd_id,
+            seq
+        )
+    if not SHARED_MEMORY_KWARGS and sys.platform != "win32":
+        # 3.12以前は参照側も登録され、終了時にアドインの共有メモリが削除されるため登録を解除
+        resource_tracker.unregister(shm._name, "shared_memory")
+
+    offset, size = info["offset"], info["size"]
+    if offset < 0 or size < 0 or offset + size > shm.size:
+        shm.close()
+        raise AIDXProtocolError(
+            0x1002,
+            f"Shared memory descriptor out of range: offset={offset}, size={size}, mapped={shm.size}",
+            cmd_id,
+            seq
+        )
+    return shm, shm.buf[offset:offset + size]
+
+
+def decompress_payload(payload: bytes, flags: int, cmd_id: int = 0, seq: int = 0) -> bytes:
+    """Flagsの圧縮ビットに従ってペイロードを展開"""
+    if not flags & FLAG_COMPRESSED:
+        return payload
+
+    codec = (flags & COMPRESSION_MASK) >> COMPRESSION_SHIFT
+    if codec not in COMPRESSORS:
+        raise AIDXProtocolError(
+            0x1002,
+            f"Unsupported compression codec: {codec}",
+            cmd_id,
+            seq
+        )
+
+    try:
+        return COMPRESSORS[codec][1](payload)
+    except Exception as e:
+        raise AIDXProtocolError(
+            0x1002,
+            f"Failed to decompress payload (codec {codec}): {e}",
+            cmd_id,
+            seq
+        )
+
+
+# send_commandが受け付けるペイロード（bytes / ファイルパス / ファイルオブジェクト / 非同期イテラブル）
+UploadSource = Union[bytes, bytearray, memoryview, str, os.PathLike, BinaryIO, AsyncIterable[bytes]]
+
+
+class _PendingRequest:
+    """応答待ちリクエストの状態（Sequence単位）"""
+
+    def __init__(
+        self,
+        cmd_id: int,
+        future: asyncio.Future,
+        stream: bool = False,
+        deadline: Optional[float] = None,
+        send_credit: Optional[int] = None
+    ):
+        self.cmd_id = cmd_id
+        self.future = future
+        # 期限（イベントループの時刻、Noneなら期限なし）
+        self.deadline = deadline
+        # 期限をヘッダでアドインへ通知したか（通知した場合は期限まで応答を待つ）
+        self.deadline_sent = False
+        # ストリーミング受信時の受信キュー（(Flags, チャンク) / 完了時None / 失敗時は例外）
+        # ストリーミングではFutureは完了の印としてのみ使用する
+        # フロー制御が有効な場合、未消費のチャンクはウィンドウで制限されるためキューは無制限
+        self.stream: Optional[asyncio.Queue] = (
+            asyncio.Queue(maxsize=0 if send_credit is not None else STREAM_MAX_BUFFERED)
+            if stream else None
+        )
+        # 分割送信で送信できる残りバイト数（アドインがCREDITで追加、Noneならフロー制御なし）
+        self.send_credit = send_credit
+        # クレジットの追加・応答の完了を送信側へ通知
+        self.credit_changed = asyncio.Event()
+        future.add_done_callback(lambda _: self.credit_changed.set())
+        # 受信済み（ストリーミングでは消費済み）でアドインへまだCREDITを返していないバイト数
+        self.unacked = 0
+        # 分割受信バッファ（開始チャンク受信後に使用）
+        self.chunks: list[bytes] = []
+        self.total_size = 0
+        self.received_size = 0
+        self.resp_cmd_id: Optional[int] = None
+        # 完了フレームのFlags（圧縮ビットの判定に使用）
+        self.flags = 0
+        # リクエストの最終フレーム（単一パケット / 終了チャンク）の送信を開始した
+        # （接続断後、アドインがリクエスト全体を受信して実行した可能性があるかの判定に使用）
+        self.sent_end = False
+        # 最終フレーム（単一パケット / 終了チャンク）を受信済み、または接続断で応答が来ないことが確定
+        self.finished = False
+        # 応答を待たずに離脱済み（Sequenceは最終フレームかCANCELの応答を受信するまで予約したまま）
+        self.abandoned = False
+
+    def fail(self, error: Exception) -> None:
+        """リクエストを失敗させる（ストリーミングでは未消費のチャンクを破棄してエラーを通知）"""
+        if self.future.done():
+            return
+        if self.stream is None:
+            self.future.set_exception(error)
+            return
+        self.future.set_result(None)
+        self._drain_stream()
+        self.stream.put_nowait(error)
+
+    def close_stream(self) -> None:
+        """ストリーミング受信を打ち切る（受信タスクが満杯のキューで待機し続けないよう空にする）"""
+        if not self.future.done():
+            self.future.set_result(None)
+        self._drain_stream()
+
+    def _drain_stream(self) -> None:
+        while not self.stream.empty():
+            self.stream.get_nowait()
+
+
+class _Transfer:
+    """
+    再接続をまたいで再開する転送の状態（リクエスト単位）
+
+    アドインは切断された転送を (セッションID, Sequence番号) で保持しているため、
+    再接続後は同じSequence番号でRESUMEを送り、受信・送信済みのオフセットから続けます。
+    """
+
+    def __init__(self):
+        # 直前の試行のSequence番号と応答待ち状態（Noneなら初回）
+        self.seq: Optional[int] = None
+        self.pending: Optional[_PendingRequest] = None
+        # 直前の試行の接続断（再開できない場合に送出）
+        self.error: Optional[AIDXConnectionLost] = None
+
+
 class AIDXClient:
-    """AIDXプロトコルクライアント"""
+    """
+    AIDXプロトコルクライアント
 
-    def __init__(self, host: str = AIDX_HOST, port: int = AIDX_PORT):
+    受信はバックグラウンドの読み取りタスクが担当し、受信フレームを
+    Sequence番号ごとの応答待ちFutureへ振り分けます。これにより1本の
+    TCP接続上で複数のリクエストを同時に送信（パイプライン化）できます。
+
+    接続断（EOF・リセット）を検出するとジッター付き指数バックオフで自動的に再接続します。
+    RESUMEに対応したアドインでは、応答待ちのリクエストは再接続後に同じSequence番号で
+    転送を再開します（送信途中のリクエストは続きのチャンクから、受信途中のレスポンスは
+    受信済みのオフセットから）。再開できない場合、読み取り専用コマンド（READ_ONLY_COMMANDS）は
+    再送し、それ以外のコマンドは実行されたか不明なためAIDXConnectionLostで失敗させます
+    （読み取り専用コマンド以外は再接続を待たず、接続断の時点で再接続が完了していなければ失敗させる）。
+    """
+
+    def __init__(
+        self,
+        host: str = AIDX_HOST,
+        port: int = AIDX_PORT,
+        compression: Optional[str] = COMPRESSION,
+        codec: str = CODEC,
+        transport: str = AIDX_TRANSPORT,
+        socket_path: str = AIDX_SOCKET_PATH,
+        use_shared_memory: bool = SHARED_MEMORY,
+        auto_reconnect: bool = True
+    ):
         self.host = host
         self.port = port
+        # トランスポート（tcp / unix）
+        self.transport = transport
+        self.socket_path = socket_path
+        if self.transport == "unix" and not hasattr(socket, "AF_UNIX"):
+            print("[CLIENT] Unix domain sockets are not available, falling back to tcp", file=sys.stderr)
+            self.transport = "tcp"
+        # call()で使用するコンテントタイプ（ワイヤ形式）
+        self.content_type = CONTENT_TYPES.get(codec, CONTENT_TYPES["json"])
+        if self.content_type not in CONTENT_CODECS:
+            print(f"[CLIENT] Codec '{codec}' is not available, falling back to json", file=sys.stderr)
+            self.content_type = CONTENT_TYPES["json"]
+        # 圧縮コーデックID（Noneなら圧縮しない / 圧縮レスポンスも要求しない）
+        self.compression: Optional[int] = COMPRESSION_CODECS.get(compression) if compression else None
+        if self.compression is not None and self.compression not in COMPRESSORS:
+            print(f"[CLIENT] Compression '{compression}' is not available, falling back to zlib", file=sys.stderr)
+            self.compression = COMPRESSION_CODECS["zlib"]
+        # 設定された圧縮コーデック（HELLOでアドインが対応していると通知した場合のみ使用）
+        self._configured_compression = self.compression
+        # HELLOでネゴシエーションする値（旧アドインの場合は既定値のまま）
+        self.protocol_version = PROTOCOL_VERSION
+        self.chunk_size = CHUNK_SIZE
+        self.server_commands: Optional[set[int]] = None
+        self.server_control_commands: set[int] = set()
+        self._in_flight = asyncio.Semaphore(MAX_IN_FLIGHT)
+        # クレジットによるフロー制御（アドインの受信ウィンドウ、Noneなら無効）
+        self.send_window: Optional[int] = None
+        # 共有メモリによるバルク転送（要求するか / HELLOで有効になったか）
+        self.use_shared_memory = use_shared_memory
+        self.shared_memory = False
+        # 共有メモリ解放通知等のバックグラウンドタスク（参照を保持してGCを防ぐ）
+        self._background_tasks: set[asyncio.Task] = set()
         self.reader: Optional[asyncio.StreamReader] = None
         self.writer: Optional[asyncio.StreamWriter] = None
         self._seq_counter = 0
+        # フレーム送信の排他（フレーム単位、ヘッダとペイロードを連続させる）
         self._lock = asyncio.Lock()
+        # 応答待ちリクエスト（Sequence → _PendingRequest）
+        self._pending: dict[int, _PendingRequest] = {}
+        self._reader_task: Optional[asyncio.Task] = None
+        # 自動再接続（接続断の検出時に再接続タスクを起動）
+        self.auto_reconnect = auto_reconnect
+        self._reconnect_task: Optional[asyncio.Task] = None
+        # HELLOまで完了した接続が稼働中か
+        self._connected = asyncio.Event()
+        self._closing = False
+        # セッションID（HELLOで通知、再接続後のRESUMEで同じクライアントの転送を識別）
+        self.session = os.urandom(8).hex()
 
     async def connect(self) -> None:
-        """CADアドインへ接続"""
-        self.reader, self.writer = await asyncio.open_connection(
-            self.host, self.port
-        )
+        """CADアドインへ接続し、受信タスクを開始してHELLOハンドシェイクを行う"""
+        self._closing = False
+        await self._open()
+
+    async def _open(self) -> None:
+        """接続を開き、HELLOハンドシェイクを行う（失敗時は開いた接続を閉じる）"""
+        if self.transport == "unix":
+            self.reader, self.writer = await asyncio.open_unix_connection(self.socket_path)
+        else:
+            self.reader, self.writer = await asyncio.open_connection(
+                self.host, self.port
+            )
+        # drain待機の閾値を送信バッファの上限に合わせる
+        self.writer.transport.set_write_buffer_limits(high=SEND_HIGH_WATER)
+        self._reader_task = asyncio.create_task(self._reader_loop())
+
+        try:
+            await self._hello()
+        except BaseException:
+            await self._close_transport()
+            raise
+        self._connected.set()
+
+    async def _hello(self) -> None:
+        """
+        HELLOハンドシェイク
+
+        プロトコルバージョン・チャンクサイズ・対応形式・同時実行数・受信ウィンドウを交換し、
+        アドインが対応していない形式は使用しないよう切り替えます。
+        HELLOに対応していない旧アドインの場合は既定値（64KBチャンク、圧縮なし）で通信します。
+        HELLO自体はv1ヘッダで送信し、アドインがversion 2を返した場合のみ以降をv2ヘッダにします。
+        """
+        self.protocol_version = 1
+        self.chunk_size = CHUNK_SIZE
+        self.server_commands = None
+        self.server_control_commands = set()
+        self._in_flight = asyncio.Semaphore(MAX_IN_FLIGHT)
+        self.shared_memory = False
+        self.send_window = None
+        # HELLOの応答までは圧縮しない（旧アドインは圧縮ペイロードを展開できない）
+        self.compression = None
+
+        hello = {
+            "version": PROTOCOL_VERSION,
+            "max_chunk_size": MAX_CHUNK_SIZE,
+            "codecs": [name for name, t in CONTENT_TYPES.items() if t in CONTENT_CODECS],
+            "compression": [name for name, c in COMPRESSION_CODECS.items() if c in COMPRESSORS],
+            "max_in_flight": MAX_IN_FLIGHT,
+            "shared_memory": self.use_shared_memory and shared_memory is not None,
+            "platform": sys.platform,
+            "recv_window": RECV_WINDOW,
+            "session": self.session,
+        }
+        try:
+            resp_flags, response = await self._request(
+                CMD_HELLO,
+                json.dumps(hello).encode("utf-8"),
+                CONTENT_TYPES["json"] << CONTENT_TYPE_SHIFT
+            )
+        except AIDXProtocolError as e:
+            if e.code != 0x1001:
+                raise
+            print("[CLIENT] Addin does not support HELLO, using protocol defaults (no compression)", file=sys.stderr)
+            return
+
+        info = decode_content(response, resp_flags, CMD_HELLO)
+        self.protocol_version = min(info.get("version", 1), PROTOCOL_VERSION)
+        self.chunk_size = min(info.get("max_chunk_size", CHUNK_SIZE), MAX_CHUNK_SIZE)
+        self.server_commands = set(info.get("commands", []))
+        self.server_control_commands = set(info.get("control_commands", []))
+        self._in_flight = asyncio.Semaphore(info.get("max_in_flight", MAX_IN_FLIGHT))
+        self.shared_memory = bool(info.get("shared_memory", False))
+        if info.get("recv_window") is not None:
+            # ウィンドウは1チャンク以上（1チャンクも送れないと転送が止まる）
+            self.send_window = max(int(info["recv_window"]), self.chunk_size)
+
+        # アドインが対応していないコンテントタイプ・圧縮コーデックは使用しない
+        codec_names = {t: name for name, t in CONTENT_TYPES.items()}
+        if codec_names[self.content_type] not in info.get("codecs", ["json"]):
+            print(f"[CLIENT] Addin does not support codec '{codec_names[self.content_type]}', "
+                  f"falling back to json", file=sys.stderr)
+            self.content_type = CONTENT_TYPES["json"]
+        compression_names = {c: name for name, c in COMPRESSION_CODECS.items()}
+        self.compression = self._configured_compression
+        if self.compression is not None:
+            supported = info.get("compression", [])
+            if compression_names[self.compression] not in supported:
+                fallback = "zlib" if "zlib" in supported else None
+                print(f"[CLIENT] Addin does not support compression '{compression_names[self.compression]}', "
+                      f"falling back to {fallback or 'none'}", file=sys.stderr)
+                self.compression = COMPRESSION_CODECS[fallback] if fallback else None
+
+        print(f"[CLIENT] HELLO: version={self.protocol_version}, chunk_size={self.chunk_size}, "
+              f"commands={len(self.server_commands)}, shared_memory={self.shared_memory}, "
+              f"send_window={self.send_window}", file=sys.stderr)
 
     async def close(self) -> None:
-        """接続を閉じる"""
+        """接続を閉じる（自動再接続も停止）"""
+        self._closing = True
+        if self._reconnect_task and self._reconnect_task is not asyncio.current_task():
+            self._reconnect_task.cancel()
+            try:
+                await self._reconnect_task
+            except (asyncio.CancelledError, Exception):
+                pass
+        self._reconnect_task = None
+
+        await self._close_transport()
+        self._fail_all_pending(ConnectionError("Connection closed"))
+
+    async def _close_transport(self) -> None:
+        """受信タスクを止めてソケットを閉じる"""
+        self._connected.clear()
+        if self._reader_task and self._reader_task is not asyncio.current_task():
+            self._reader_task.cancel()
+            try:
+                await self._reader_task
+            except (asyncio.CancelledError, Exception):
+                pass
+        self._reader_task = None
+
         if self.writer:
             self.writer.close()
-            await self.writer.wait_closed()
+            try:
+                await self.writer.wait_closed()
+            except OSError:
+                # 切断済みの接続
+                pass
+
+    @property
+    def address(self) -> str:
+        """接続先の表示用文字列"""
+        if self.transport == "unix":
+            return f"unix:{self.socket_path}"
+        return f"{self.host}:{self.port}"
+
+    @property
+    def is_connected(self) -> bool:
+        """HELLOまで完了した接続の受信タスクが稼働中か（再接続中はFalse）"""
+        return self._connected.is_set() and self._reader_alive
+
+    @property
+    def _reader_alive(self) -> bool:
+        return self._reader_task is not None and not self._reader_task.done()
+
+    async def _ensure_connected(self, cmd_id: int) -> None:
+        """
+        送信前の接続確認（再接続中なら完了を待つ）
+
+        Raises:
+            ConnectionError: 未接続、または再接続がRECONNECT_WAIT以内に完了しない場合
+        """
+        if cmd_id == CMD_HELLO and self._reader_alive:
+            # ハンドシェイク中（接続の確立処理の一部）
+            return
+        if self.is_connected:
+            return
+        if self._reconnect_task is None or self._reconnect_task.done():
+            raise ConnectionError("Not connected to AIDX server")
+        try:
+            await asyncio.wait_for(self._connected.wait(), timeout=RECONNECT_WAIT)
+        except asyncio.TimeoutError:
+            raise ConnectionError(
+                f"Not connected to AIDX server (reconnecting to {self.address}, "
+                f"not completed within {RECONNECT_WAIT} seconds)"
+            )
+
+    @property
+    def in_flight(self) -> int:
+        """応答待ちのリクエスト数"""
+        return len(self._pending)
+
+    @property
+    def seq_space(self) -> int:
+        """Sequence番号の個数（v2ヘッダは32bit、v1ヘッダは16bit）"""
+        return 1 << 32 if self.protocol_version >= 2 else 1 << 16
 
     def _next_seq(self) -> int:
-        """次のSequence番号を取得（スレッドセーフ）"""
-        seq = self._seq_counter
-        self._seq_counter = (self._seq_counter + 1) % 65536
-        return seq
+        """次のSequence番号を取得（応答待ち中の番号はスキップ）"""
+        seq_space = self.seq_space
+        # 応答待ちの数+1個を調べれば空き番号が見つかる
+        for _ in range(min(len(self._pending) + 1, seq_space)):
+            seq = self._seq_counter % seq_space
+            self._seq_counter = (seq + 1) % seq_space
+            if seq not in self._pending:
+                return seq
+
+        raise AIDXProtocolError(
+            0x3001,
+            f"No free sequence number ({seq_space} requests in flight)"
+        )
 
     async def send_command(
         self,
         cmd_id: int,
-        payload: bytes = b"",
-        seq: Optional[int] = None
+        payload: UploadSource = b"",
+        seq: Optional[int] = None,
+        total_size: Optional[int] = None,
+        timeout: Optional[float] = COMMAND_TIMEOUT
     ) -> bytes:
         """
         コマンドを送信しレスポンスを受信（分割送信対応）
 
+        複数のコルーチンから同時に呼び出し可能です。レスポンスは受信タスクが
+        Sequence番号で振り分けるため、応答順序はリクエスト順と一致しなくても構いません。
+        ペイロードは生バイナリ（従来形式、アドイン側ではJSONテキストとして解釈）として送信します。
+
+        ペイロードにファイルパス・ファイルオブジェクト・非同期イテラブルを渡すと、
+        全体をメモリに読み込まずにチャンクサイズ単位で読みながら送信します（非圧縮）。
+
         Args:
             cmd_id: コマンドID
-            payload: ペイロードデータ
+            payload: ペイロードデータ、ファイルパス、ファイルオブジェクト、またはbytesの非同期イテラブル
             seq: Sequence番号（省略時は自動採番）
+            total_size: 総データサイズ（非同期イテラブル・シーク不可のファイルでは必須）
+            timeout: 期限（秒、Noneなら期限なし）。アドインは期限切れのリクエストを実行せず
+                ERR_TIMEOUT（0x3000）で応答する
 
         Returns:
             レスポンスのペイロード
 
         Raises:
             AIDXProtocolError: プロトコルエラー
+            ConnectionError: 応答待ち中に接続が切断された場合
+            ValueError: 送信データがtotal_sizeと一致しない場合
+            asyncio.TimeoutError: 期限までにレスポンスを受信できなかった場合
+        """
+        if isinstance(payload, (bytes, bytearray, memoryview)):
+            _, response = await self._request(cmd_id, payload, seq=seq, timeout=timeout)
+        else:
+            _, response = await self._upload(cmd_id, payload, total_size, seq, timeout)
+        return response
+
+    async def call(
+        self,
+        cmd_id: int,
+        request: Any = None,
+        timeout: Optional[float] = COMMAND_TIMEOUT
+    ) -> Any:
+        """
+        オブジェクトを送信し、デコード済みのレスポンスを受信
+
+        リクエストは接続のコンテントタイプ（JSON / MessagePack / CBOR）でエンコードされ、
+        アドインは同じ形式で応答します。HELLO非対応の旧アドインにはJSONで送信し、
+        生バイナリ（JSONテキスト）のレスポンスをJSONとしてデコードします（BINARY_COMMANDSを除く）。
+
+        Args:
+            cmd_id: コマンドID
+            request: リクエストオブジェクト（通常はdict、Noneなら空ペイロード）
+            timeout: 期限（秒、Noneなら期限なし、send_command()参照）
+
+        Returns:
+            デコード済みのレスポンス（生バイナリのレスポンスはbytes）
+
+        Raises:
+            AIDXProtocolError: プロトコルエラー
+            asyncio.TimeoutError: 期限までにレスポンスを受信できなかった場合
+        """
+        legacy = self.server_commands is None
+        content_type = CONTENT_TYPES["json"] if legacy else self.content_type
+        if request is None:
+            payload = b""
+        else:
+            payload = CONTENT_CODECS[content_type][0](request)
+
+        flags = content_type << CONTENT_TYPE_SHIFT
+        resp_flags, response = await self._request(cmd_id, payload, flags, timeout=timeout)
+        if (
+            legacy
+            and cmd_id not in BINARY_COMMANDS
+            and (resp_flags & CONTENT_TYPE_MASK) >> CONTENT_TYPE_SHIFT == CONTENT_TYPES["raw"]
+        ):
+            # 旧アドインのレスポンスはコンテントタイプなしのJSONテキスト
+            resp_flags |= CONTENT_TYPES["json"] << CONTENT_TYPE_SHIFT
+        return decode_content(response, resp_flags, cmd_id)
+
+    async def _request(
+        self,
+        cmd_id: int,
+        payload: bytes,
+        flags: int = 0x0000,
+        seq: Optional[int] = None,
+        timeout: Optional[float] = COMMAND_TIMEOUT
+    ) -> tuple[int, bytes]:
+        """
+        リクエストを送信しレスポンスを受信
+
+        期限は再接続の待機・再送を含めた全体に適用します。
+
+        Args:
+            cmd_id: コマンドID
+            payload: ペイロードデータ（エンコード済み）
+            flags: 全フレームに立てるFlags（コンテントタイプ等）
+            seq: Sequence番号（省略時は自動採番）
+            timeout: 期限（秒、Noneなら期限なし）
+
+        Returns:
+            (レスポンスのFlags, 展開済みペイロード) のタプル
+
+        Raises:
+            AIDXConnectionLost: 応答待ちのまま接続が切断された場合（RESUME_MAX回までRESUMEで再開し、
+                再開できない読み取り専用コマンドはRESEND_MAX回まで再送してから）。
+                読み取り専用コマンド以外は、再接続が完了していなければ再接続を待たずに送出
+        """
+        deadline = self._deadline(timeout)
+        transfer = _Transfer()
+        send_payload, send_flags = payload, flags
+
+        async def send(seq: int, offset: int) -> None:
+            await self._send_frames(cmd_id, seq, send_payload, send_flags, offset)
+
+        resends = 0
+        resumes = 0
+        while True:
+            await self._ensure_connected(cmd_id)
+            if transfer.pending is None:
+                # 再接続後はネゴシエーションし直した圧縮コーデックで圧縮
+                # （再開する場合はアドインが受信済みの部分と同じペイロードを送る）
+                send_payload, send_flags = await self._compress_request(payload, flags)
+            try:
+                return await self._request_once(cmd_id, send, seq, deadline, transfer)
+            except AIDXConnectionLost as e:
+                if not self.auto_reconnect:
+                    raise
+                transfer.error = e
+                if self._can_resume(cmd_id, transfer) and resumes < RESUME_MAX:
+                    resumes += 1
+                    print(f"[CLIENT] Resuming CMD=0x{cmd_id:04X} (Seq={transfer.seq}) after reconnect "
+                          f"({resumes}/{RESUME_MAX})", file=sys.stderr)
+                    continue
+                if cmd_id not in READ_ONLY_COMMANDS or resends >= RESEND_MAX:
+                    raise
+                resends += 1
+                transfer = _Transfer()
+                print(f"[CLIENT] Re-sending CMD=0x{cmd_id:04X} after reconnect "
+                      f"({resends}/{RESEND_MAX})", file=sys.stderr)
+
+    async def _request_once(
+        self,
+        cmd_id: int,
+        send: Callable[[int, int], Any],
+        seq: Optional[int],
+        deadline: Optional[float] = None,
+        transfer: Optional[_Transfer] = None
+    ) -> tuple[int, bytes]:
+        """
+        リクエストを1回送信しレスポンスを受信（送信中の切断はAIDXConnectionLost）
+
+        Args:
+            cmd_id: コマンドID
+            send: (Sequence番号, 送信を開始するオフセット) を受け取りフレームを送信するコルーチン関数
+            seq: Sequence番号（省略時は自動採番）
+            deadline: 期限（イベントループの時刻、Noneなら期限なし）
+            transfer: 転送の状態（直前の試行が接続断で終わっていればRESUMEで再開し、この試行の状態を記録）
+        """
+        transfer = transfer or _Transfer()
+        # アドインが通知した同時実行数を超えないよう待機
+        async with self._in_flight:
+            seq, pending, previous = self._register_attempt(cmd_id, seq, deadline, transfer)
+            try:
+                try:
+                    offset = await self._resume(cmd_id, transfer, previous) if previous is not None else 0
+                    if offset is not None:
+                        await send(seq, offset)
+                except OSError as e:
+                    if isinstance(e, AIDXConnectionLost):
+                        raise
+                    if pending.future.done() and not pending.future.cancelled():
+                        # 受信タスクが設定した接続断は以下の例外で通知する（未取得の警告を抑止）
+                        pending.future.exception()
+                    raise AIDXConnectionLost(
+                        f"Connection lost while sending CMD=0x{cmd_id:04X} (Seq={seq}): {e}",
+                        cmd_id,
+                        seq
+                    )
+
+                # レスポンス待機（受信タスクがFutureを完了させる）
+                response = await self._wait_response(seq, pending)
+
+            finally:
+                self._release_pending(seq, pending)
+
+        return pending.flags, await self._load_response(pending, response, seq)
+
+    async def _upload(
+        self,
+        cmd_id: int,
+        source: UploadSource,
+        total_size: Optional[int],
+        seq: Optional[int] = None,
+        timeout: Optional[float] = COMMAND_TIMEOUT
+    ) -> tuple[int, bytes]:
+        """
+        ファイル・非同期イテラブルからのストリーミング送信
+
+        Args:
+            cmd_id: コマンドID
+            source: ファイルパス、ファイルオブジェクト、またはbytesの非同期イテラブル
+            total_size: 総データサイズ（Noneならファイルサイズから算出）
+            seq: Sequence番号（省略時は自動採番）
+            timeout: 期限（秒、Noneなら期限なし、転送時間を含む）
+
+        Returns:
+            (レスポンスのFlags, 展開済みペイロード) のタプル
+        """
+        if isinstance(source, (str, os.PathLike)):
+            f = await asyncio.to_thread(open, source, "rb")
+            try:
+                return await self._upload(cmd_id, f, total_size, seq, timeout)
+            finally:
+                f.close()
+
+        # シーク可能なファイルは再接続後にアドインが受信済みのオフセットから読み直して再開できる
+        seekable = hasattr(source, "read") and source.seekable()
+        position = source.tell() if seekable else 0
+        if hasattr(source, "read"):
+            if total_size is None:
+                if not seekable:
+                    raise ValueError("total_size is required for non-seekable file objects")
+                total_size = source.seek(0, os.SEEK_END) - position
+                source.seek(position)
+            chunks = self._read_file_chunks(source)
+        elif hasattr(source, "__aiter__"):
+            if total_size is None:
+                raise ValueError("total_size is required for async iterable payloads")
+            chunks = source
+        else:
+            raise TypeError(f"Unsupported payload type: {type(source).__name__}")
+
+        deadline = self._deadline(timeout)
+
+        # ストリーミング送信は非圧縮（レスポンスの圧縮のみ要求）
+        flags = FLAG_ACCEPT_COMPRESSION if self.compression is not None else 0x0000
+
+        async def send(seq: int, offset: int) -> None:
+            if seekable:
+                await asyncio.to_thread(source.seek, position + offset)
+            await self._send_stream(cmd_id, seq, chunks, total_size, flags, offset)
+
+        # シーク不可の送信元は読み直せないため、接続断時は再開せずAIDXConnectionLostで失敗させる
+        transfer = _Transfer()
+        resumes = 0
+        while True:
+            await self._ensure_connected(cmd_id)
+            try:
+                return await self._request_once(cmd_id, send, seq, deadline, transfer)
+            except AIDXConnectionLost as e:
+                if (not seekable or not self.auto_reconnect or not self._can_resume(cmd_id, transfer)
+                        or resumes >= RESUME_MAX):
+                    raise
+                transfer.error = e
+                resumes += 1
+                print(f"[CLIENT] Resuming upload CMD=0x{cmd_id:04X} (Seq={transfer.seq}) after reconnect "
+                      f"({resumes}/{RESUME_MAX})", file=sys.stderr)
+
+    async def _read_file_chunks(self, f: BinaryIO) -> AsyncIterator[bytes]:
+        """ファイルをチャンクサイズ単位で読み出す（読み込みは別スレッドで実行）"""
+        while True:
+            data = await asyncio.to_thread(f.read, self.chunk_size)
+            if not data:
+                return
+            yield data
+
+    async def _load_response(self, pending: _PendingRequest, response: bytes, seq: int) -> bytes:
+        """
+        レスポンス本体の取得
+
+        共有メモリ経由のレスポンスは1回のコピーで読み出し、圧縮レスポンスは展開します
+        （大きなレスポンスは別スレッドで展開）。
         """
+        if pending.flags & FLAG_SHARED_MEMORY:
+            shm, view = open_shared_memory(response, pending.cmd_id, seq)
+            try:
+                return bytes(view)
+            finally:
+                view.release()
+                shm.close()
+                self._release_shared_memory(shm.name)
+
+        if pending.flags & FLAG_COMPRESSED and len(response) > CHUNK_SIZE:
+            return await asyncio.to_thread(decompress_payload, response, pending.flags, pending.cmd_id, seq)
+        return decompress_payload(response, pending.flags, pending.cmd_id, seq)
+
+    async def send_command_stream(
+        self,
+        cmd_id: int,
+        payload: bytes = b"",
+        flags: int = 0x0000,
+        timeout: Optional[float] = COMMAND_TIMEOUT
+    ) -> AsyncIterator[memoryview]:
+        """
+        コマンドを送信し、レスポンスをチャンク単位で受信（ストリーミング）
+
+        レスポンス全体をメモリに保持せず、受信したチャンクから順に返します。
+        圧縮レスポンスは逐次展開され、展開後のデータが返ります。
+        受信済みで未消費のチャンクはRECV_WINDOWバイトまで（旧アドインではSTREAM_MAX_BUFFERED個まで）で、
+        それを超えるとアドインが消費を待つため、転送サイズによらずメモリ使用量は一定です。
+        共有メモリ経由のレスポンスは共有メモリ上のviewをコピーせずに返します
+        （viewは次のチャンクを読み取るまで有効）。
+
+        途中で読み取りをやめる場合は contextlib.aclosing で囲み、確実に受信を打ち切ってください。
+
+        Args:
+            cmd_id: コマンドID
+            payload: ペイロードデータ（エンコード済み）
+            flags: 全フレームに立てるFlags（コンテントタイプ等）
+            timeout: 期限（秒、Noneなら期限なし、最終チャンクの受信までに適用）
+
+        Yields:
+            レスポンスのチャンク（memoryview）
+
+        Raises:
+            AIDXProtocolError: プロトコルエラー（チャンク順序・サイズ不整合を含む）
+            ConnectionError: 受信中に接続が切断された場合
+        """
+        deadline = self._deadline(timeout)
+
+        # 受信済みのチャンクは返却済みのため、接続断時は再送せずAIDXConnectionLostで失敗させる
+        await self._ensure_connected(cmd_id)
+
+        payload, flags = await self._compress_request(payload, flags)
+
+        async with self._in_flight:
+            seq, pending = self._register_pending(cmd_id, None, stream=True, deadline=deadline)
+            try:
+                await self._send_frames(cmd_id, seq, payload, flags)
+
+                decompressor = None
+                while True:
+                    try:
+                        item = await asyncio.wait_for(
+                            pending.stream.get(), timeout=self._wait_timeout(pending)
+                        )
+                    except asyncio.TimeoutError:
+                        raise self._timeout_error(seq, pending)
+                    if item is None:
+                        break
+                    if isinstance(item, Exception):
+                        raise item
+
+                    frame_flags, chunk = item
+                    if frame_flags & 0x0003 in (0x0001, 0x0002):
+                        self._grant_credit(seq, pending, len(chunk))
+                    if frame_flags & FLAG_SHARED_MEMORY:
+                        # 共有メモリ上のデータをコピーせずに返す（次の読み取りまで有効）
+                        shm, view = open_shared_memory(chunk, cmd_id, seq)
+                        try:
+                            yield view
+                        finally:
+                            view.release()
+                            try:
+                                shm.close()
+                            except BufferError:
+                                print(f"[CLIENT] Shared memory view for Seq={seq} is still referenced", file=sys.stderr)
+                            self._release_shared_memory(shm.name)
+                        continue
+
+                    if not frame_flags & FLAG_COMPRESSED:
+                        yield memoryview(chunk)
+                        continue
+
+                    if decompressor is None:
+                        codec = (frame_flags & COMPRESSION_MASK) >> COMPRESSION_SHIFT
+                        if codec not in STREAM_DECOMPRESSORS:
+                            raise AIDXProtocolError(
+                                0x1002,
+                                f"Unsupported compression codec: {codec}",
+                                cmd_id,
+                                seq
+                            )
+                        decompressor = STREAM_DECOMPRESSORS[codec]()
+                    # zlibは展開後のサイズをチャンクサイズ以下に区切る（高圧縮率のデータ対策）
+                    bounded = hasattr(decompressor, "unconsumed_tail")
+                    while chunk:
+                        try:
+                            if bounded:
+                                data = decompressor.decompress(chunk, self.chunk_size)
+                                chunk = decompressor.unconsumed_tail
+                            else:
+                                data = decompressor.decompress(chunk)
+                                chunk = b""
+                        except Exception as e:
+                            raise AIDXProtocolError(
+                                0x1002,
+                                f"Failed to decompress payload: {e}",
+                                cmd_id,
+                                seq
+                            )
+                        if data:
+                            yield memoryview(data)
+
+                if hasattr(decompressor, "flush"):
+                    data = decompressor.flush()
+                    if data:
+                        yield memoryview(data)
+
+            finally:
+                self._release_pending(seq, pending)
+                pending.close_stream()
+
+    def _release_shared_memory(self, name: str) -> None:
+        """共有メモリをマップし終えたことをアドインへ通知（応答は待たない）"""
+        self._spawn_background(self._request(
+            CMD_SHM_RELEASE,
+            json.dumps({"name": name}).encode("utf-8"),
+            CONTENT_TYPES["json"] << CONTENT_TYPE_SHIFT
+        ))
+
+    def _release_pending(self, seq: int, pending: _PendingRequest) -> None:
+        """
+        応答待ちの登録を解除
+
+        最終フレームを受け取らずに離脱した場合（タスクのキャンセル・タイムアウト・ストリーミングの
+        途中終了）は、遅れて届くフレームが同じSequenceを再利用した別のリクエストへ振り分けられないよう
+        Sequenceを予約したままにし、アドインへCANCELを送信します。予約は最終フレームか
+        CANCELの応答を受信した時点で解除します（CANCEL非対応の旧アドインでは最終フレームのみ）。
+        """
+        if self._pending.get(seq) is not pending:
+            return
+        if pending.finished or not self._reader_alive:
+            del self._pending[seq]
+            return
+
+        pending.abandoned = True
+        if pending.stream is not None:
+            pending.close_stream()
+        elif not pending.future.done():
+            pending.future.cancel()
+        if (pending.cmd_id != CMD_CANCEL and CMD_CANCEL in self.server_control_commands
+                and not self._transport_closing):
+            self._spawn_background(self._cancel(seq, pending))
+
+    @property
+    def _transport_closing(self) -> bool:
+        """close()中、またはソケットが閉じられている（CANCEL等を送信しても届かない）"""
+        return self._closing or self.writer is None or self.writer.transport.is_closing()
+
+    async def _cancel(self, seq: int, pending: _PendingRequest) -> None:
+        """
+        CANCELを送信し、応答を受信したらSequenceの予約を解除
+
+        送信前・応答待ちの間にclose()された場合は何もしません（予約は接続を閉じた時点で解除される）。
+        """
+        try:
+            if self._transport_closing:
+                return
+            resp_flags, response = await self._request(
+                CMD_CANCEL,
+                json.dumps({"seq": seq}).encode("utf-8"),
+                CONTENT_TYPES["json"] << CONTENT_TYPE_SHIFT
+            )
+            result = decode_content(response, resp_flags, CMD_CANCEL)
+            print(f"[CLIENT] Cancelled CMD=0x{pending.cmd_id:04X}, Seq={seq}: {result.get('state')}",
+                  file=sys.stderr)
+        except ConnectionError:
+            if not self._closing:
+                raise
+        finally:
+            if self._pending.get(seq) is pending:
+                del self._pending[seq]
+
+    def _spawn_background(self, coro) -> None:
+        """応答を待たない制御コマンドをバックグラウンドで送信（タスクの参照を保持してGCを防ぐ）"""
+        task = asyncio.create_task(coro)
+        self._background_tasks.add(task)
+        task.add_done_callback(self._background_task_done)
+
+    def _background_task_done(self, task: asyncio.Task) -> None:
+        """バックグラウンドタスク完了時の後処理（失敗はログ出力のみ）"""
+        self._background_tasks.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            error = task.exception()
+            print(f"[CLIENT] Background task failed: {type(error).__name__}: {error}", file=sys.stderr)
+
+    async def _compress_request(self, payload: bytes, flags: int) -> tuple[bytes, int]:
+        """
+        リクエストペイロードの圧縮
+
+        大きなペイロードはイベントループを塞がないよう別スレッドで圧縮します。
+
+        Returns:
+            (送信するペイロード, 圧縮ビットを立てたFlags) のタプル
+        """
+        if self.compression is None:
+            return payload, flags
+
+        flags |= FLAG_ACCEPT_COMPRESSION
+        if len(payload) > CHUNK_SIZE:
+            compressed = await asyncio.to_thread(compress_payload, payload, self.compression)
+        else:
+            compressed = compress_payload(payload, self.compression)
+        if compressed is None:
+            return payload, flags
+        return compressed, flags | FLAG_COMPRESSED | (self.compression << COMPRESSION_SHIFT)
+
+    def _register_pending(
+        self,
+        cmd_id: int,
+        seq: Optional[int],
+        stream: bool = False,
+        deadline: Optional[float] = None
+    ) -> tuple[int, _PendingRequest]:
+        """Sequence番号を確保して応答待ちリクエストを登録"""
         if seq is None:
             seq = self._next_seq()
+        elif seq in self._pending:
+            raise AIDXProtocolError(
+                0x1003,
+                f"Sequence {seq} is already in flight",
+                cmd_id,
+                seq
+            )
+
+        pending = _PendingRequest(
+            cmd_id, asyncio.get_running_loop().create_future(), stream, deadline, self.send_window
+        )
+        self._pending[seq] = pending
+        return seq, pending
+
+    def _register_attempt(
+        self,
+        cmd_id: int,
+        seq: Optional[int],
+        deadline: Optional[float],
+        transfer: _Transfer
+    ) -> tuple[int, _PendingRequest, Optional[_PendingRequest]]:
+        """
+        応答待ちリクエストを登録し、この試行を転送の状態に記録
+
+        直前の試行を再開する場合は同じSequence番号で登録し、受信途中のレスポンスの
+        チャンクを引き継ぎます（RESUMEの応答より先に続きのチャンクが届くことがあるため）。
+
+        Returns:
+            (Sequence番号, 応答待ちリクエスト, 再開する直前の試行（Noneなら最初から送信）) のタプル
+
+        Raises:
+            AIDXConnectionLost: 再開できず、リクエストが実行された可能性がある場合（読み取り専用コマンドを除く）
+        """
+        previous = transfer.pending
+        if previous is not None and (
+            transfer.seq in self._pending or CMD_RESUME not in self.server_control_commands
+            or transfer.seq >= self.seq_space
+        ):
+            # 再接続先がRESUME非対応、v1ヘッダで表せないSequence番号、
+            # または再接続までに同じSequence番号が別のリクエストに使われた
+            if previous.sent_end and cmd_id not in READ_ONLY_COMMANDS:
+                transfer.seq = None
+                raise transfer.error
+            previous = None
+        if previous is not None:
+            seq = transfer.seq
+
+        seq, pending = self._register_pending(cmd_id, seq, deadline=deadline)
+        if previous is not None:
+            pending.chunks = previous.chunks
+            pending.total_size = previous.total_size
+            pending.received_size = previous.received_size
+            pending.resp_cmd_id = previous.resp_cmd_id
+        transfer.seq, transfer.pending = seq, pending
+        return seq, pending, previous
+
+    async def _resume(self, cmd_id: int, transfer: _Transfer, previous: _PendingRequest) -> Optional[int]:
+        """
+        RESUMEで接続断前の転送を引き継ぐ（transferには登録済みのこの試行を記録済み）
+
+        Returns:
+            リクエストの送信を再開するオフセット（アドインが受信済みのバイト数、最初から送る場合は0）、
+            またはNone（アドインがリクエスト全体を受信済みで、応答を待つだけの場合）
+
+        Raises:
+            AIDXConnectionLost: アドインに転送の状態がなく、リクエストが実行された可能性がある場合
+                （読み取り専用コマンドを除く）
+        """
+        seq, pending = transfer.seq, transfer.pending
+        result = await self._control(CMD_RESUME, {"seq": seq, "received": previous.received_size})
+        state = result.get("state")
+        print(f"[CLIENT] RESUME CMD=0x{cmd_id:04X}, Seq={seq}: {state}, "
+              f"offset={result.get('offset', 0)}", file=sys.stderr)
+
+        if state == "receiving":
+            return int(result.get("offset", 0))
+        if state in ("sending", "executing"):
+            pending.sent_end = True
+            return None
+
+        # アドインに状態がない（保持期限切れ・送信済み等）
+        if previous.sent_end and cmd_id not in READ_ONLY_COMMANDS:
+            transfer.seq = None
+            raise AIDXConnectionLost(
+                f"Could not resume CMD=0x{cmd_id:04X} (Seq={seq}) after reconnect: "
+                f"the addin has no state for it; the command may or may not have been executed",
+                cmd_id,
+                seq
+            )
+        pending.chunks = []
+        pending.total_size = 0
+        pending.received_size = 0
+        pending.resp_cmd_id = None
+        return 0
+
+    def _can_resume(self, cmd_id: int, transfer: _Transfer) -> bool:
+        """
+        接続断で終わった転送をRESUMEで再開できるか（制御コマンドは接続ごとの状態のため再開しない）
+
+        読み取り専用コマンド以外は、再接続が既に完了している場合のみ再開します。
+        再接続を待つと実行されたか不明なまま呼び出し元を待たせるため、直ちにAIDXConnectionLostで失敗させます。
+        """
+        if cmd_id >= CMD_HELLO or transfer.seq is None:
+            return False
+        if cmd_id not in READ_ONLY_COMMANDS and not self.is_connected:
+            return False
+        return CMD_RESUME in self.server_control_commands
+
+    async def _control(self, cmd_id: int, request: dict) -> Any:
+        """
+        制御コマンドを送信し、デコード済みの応答を受信
+
+        同時実行数の枠を確保済みのリクエストから呼び出すため、枠を使わずに送信します。
+        """
+        seq, pending = self._register_pending(cmd_id, None, deadline=self._deadline(RECV_TIMEOUT))
+        try:
+            await self._send_frames(
+                cmd_id, seq, json.dumps(request).encode("utf-8"), CONTENT_TYPES["json"] << CONTENT_TYPE_SHIFT
+            )
+            response = await self._wait_response(seq, pending)
+        finally:
+            self._release_pending(seq, pending)
+        return decode_content(response, pending.flags, cmd_id)
+
+    async def _send_frames(self, cmd_id: int, seq: int, payload: bytes, flags: int, offset: int = 0) -> None:
+        """
+        リクエストのフレームを送信（チャンクサイズ超過時は分割送信）
+
+        offsetを指定すると、RESUMEで再開した分割送信の続きのチャンクから送信します。
+        """
+        total_size = len(payload)
+        if total_size > self.chunk_size or offset > 0:
+            # 分割送信（送信ロックはフレーム単位）
+            await self._send_chunked(cmd_id, seq, payload, total_size, flags, offset)
+            return
+
+        # 単一パケット送信
+        header = self._pack_header(cmd_id, flags, seq, len(payload), total_size)
 
         async with self._lock:
-            total_size = len(payload)
-
-            if total_size <= CHUNK_SIZE:
-                # 単一パケット送信
-                header = struct.pack(
-                    "<IHHHHII",
-                    AIDX_MAGIC,      # Magic (4)
-                    cmd_id,          # CommandID (2)
-                    0x0000,          # Flags (2) - 単一パケット
-                    seq,             # Sequence (2)
-                    0x0000,          # Reserved (2)
-                    len(payload),    # PayloadSize (4)
-                    len(payload),    # TotalSize (4)
+            print(f"[CLIENT] Sending: CMD=0x{cmd_id:04X}, Seq={seq}, PayloadSize={len(payload)}, TotalSize={total_size}", file=sys.stderr)
+            self._mark_sent_end(cmd_id, seq)
+            self.writer.writelines((header, payload))
+            await self._drain_if_needed()
+
+    def _pack_header(self, cmd_id: int, flags: int, seq: int, payload_size: int, total_size: int) -> bytes:
+        """
+        ヘッダ構築（HELLOでversion 2をネゴシエーションした接続ではv2ヘッダ）
+
+        v1: IHHHHII = Magic(4) CommandID(2) Flags(2) Sequence(2) Reserved(2) PayloadSize(4) TotalSize(4)
+        v2: IHHIIIQ = Magic(4) CommandID(2) Flags(2) Sequence(4) Reserved(4) PayloadSize(4) TotalSize(8)
+        Reservedにはリクエストの期限を格納します。
+        """
+        if self.protocol_version >= 2:
+            return struct.pack(
+                HEADER_FORMAT_V2, AIDX_MAGIC_V2, cmd_id, flags, seq,
+                self._deadline_field(seq), payload_size, total_size
+            )
+        if total_size > 0xFFFFFFFF:
+            raise AIDXProtocolError(
+                0x1002,
+                f"Payload too large for protocol version 1: {total_size} bytes",
+                cmd_id,
+                seq
+            )
+        return struct.pack(
+            HEADER_FORMAT, AIDX_MAGIC, cmd_id, flags, seq,
+            self._deadline_field(seq), payload_size, total_size
+        )
+
+    async def _wait_response(self, seq: int, pending: _PendingRequest) -> bytes:
+        """
+        レスポンス完了を待機
+
+        期限をアドインへ通知したリクエストは期限まで待機します（アドインは期限切れのリクエストを
+        ERR_TIMEOUTで応答する）。期限を通知していない場合は、RECV_TIMEOUTの間に1バイトも受信が
+        進まなかった場合、または期限を過ぎた場合にタイムアウトとします（分割受信中は受信が進む限り待機を継続）。
+        """
+        last_progress = -1
+        while True:
+            try:
+                return await asyncio.wait_for(
+                    asyncio.shield(pending.future),
+                    timeout=self._wait_timeout(pending)
                 )
+            except asyncio.TimeoutError:
+                if (pending.received_size == last_progress or not pending.chunks
+                        or self._wait_timeout(pending) <= 0):
+                    raise self._timeout_error(seq, pending)
+                last_progress = pending.received_size
 
-                print(f"[CLIENT] Sending: CMD=0x{cmd_id:04X}, Seq={seq}, PayloadSize={len(payload)}, TotalSize={total_size}", file=sys.stderr)
-                self.writer.write(header + payload)
-                await self.writer.drain()
-                print(f"[CLIENT] Data flushed to server", file=sys.stderr)
-            else:
-                # 分割送信
-                await self._send_chunked(cmd_id, seq, payload, total_size)
+    def _deadline(self, timeout: Optional[float]) -> Optional[float]:
+        """期限（秒）をイベントループの時刻に変換"""
+        if timeout is None:
+            return None
+        return asyncio.get_running_loop().time() + timeout
 
-            # レスポンス受信
-            return await self._recv_response(seq)
+    def _deadline_field(self, seq: int) -> int:
+        """
+        ヘッダのReservedに格納する期限（送信時点からの残り時間、DEADLINE_UNIT単位）
+
+        期限なし、またはDEADLINE_MAX（v2ヘッダではDEADLINE_MAX_V2）を超える場合は0（アドインは期限なしとして扱う）。
+        期限切れでも1以上とし、アドインに実行させずERR_TIMEOUTで応答させます。
+        """
+        pending = self._pending.get(seq)
+        if pending is None or pending.deadline is None:
+            return 0
+        remaining = pending.deadline - asyncio.get_running_loop().time()
+        units = math.ceil(remaining / DEADLINE_UNIT)
+        if units > (DEADLINE_MAX_V2 if self.protocol_version >= 2 else DEADLINE_MAX):
+            return 0
+        pending.deadline_sent = True
+        return max(1, units)
+
+    def _wait_timeout(self, pending: _PendingRequest) -> float:
+        """
+        次の受信を待つ時間
 
-    async def _send_chunked(self, cmd_id: int, seq: int, payload: bytes, total_size: int):
+        期限をアドインへ通知した場合は期限までの残り時間、それ以外は
+        RECV_TIMEOUTと期限までの残り時間の短い方です。
+        """
+        if pending.deadline is None:
+            return RECV_TIMEOUT
+        remaining = pending.deadline - asyncio.get_running_loop().time()
+        if pending.deadline_sent:
+            return max(0.0, remaining)
+        return max(0.0, min(RECV_TIMEOUT, remaining))
+
+    def _timeout_error(self, seq: int, pending: _PendingRequest) -> asyncio.TimeoutError:
+        """受信待ちのタイムアウト（期限切れ / 受信が進まない）の例外"""
+        if pending.deadline is not None and asyncio.get_running_loop().time() >= pending.deadline:
+            return asyncio.TimeoutError(
+                f"CMD=0x{pending.cmd_id:04X}, Seq={seq} did not complete before its deadline"
+            )
+        return asyncio.TimeoutError(
+            f"No response for CMD=0x{pending.cmd_id:04X}, Seq={seq} "
+            f"within {RECV_TIMEOUT} seconds"
+        )
+
+    def _mark_sent_end(self, cmd_id: int, seq: int) -> None:
+        """リクエストの最終フレームの送信開始を記録（同じSequenceのCREDIT等は対象外）"""
+        pending = self._pending.get(seq)
+        if pending is not None and pending.cmd_id == cmd_id:
+            pending.sent_end = True
+
+    async def _send_chunked(
+        self, cmd_id: int, seq: int, payload: bytes, total_size: int, extra_flags: int = 0, offset: int = 0
+    ):
         """
         ペイロードを分割送信
 
+        送信ロックはフレーム単位で取得するため、大きなリクエストの送信中でも
+        他のリクエストのフレームが1チャンクごとに割り込めます（アドイン側はSequence単位で再構築）。
+        フロー制御が有効な場合は、アドインのクレジットの範囲でのみ送信します。
+
         Args:
             cmd_id: コマンドID
             seq: Sequence番号
             payload: ペイロードデータ
             total_size: 総データサイズ
+            extra_flags: 全チャンクに共通で立てるFlags（圧縮ビット等）
+            offset: 送信を開始するオフセット（RESUMEで再開する場合はアドインが受信済みのバイト数）
         """
-        offset = 0
+        view = memoryview(payload).cast("B")
         while offset < total_size:
-            chunk_size = min(CHUNK_SIZE, total_size - offset)
-            chunk = payload[offset:offset + chunk_size]
+            chunk_size = min(self.chunk_size, total_size - offset)
+            # memoryviewのスライス（コピーなし）
+            chunk = view[offset:offset + chunk_size]
 
             # Flags算出（bit 0-1: ChunkState）
             if offset == 0:
@@ -124,222 +1439,515 @@ class AIDXClient:
                 flags = 0x0003  # 終了
             else:
                 flags = 0x0002  # 中間
+            flags |= extra_flags
 
-            # ヘッダ構築
-            header = struct.pack(
-                "<IHHHHII",
-                AIDX_MAGIC,
-                cmd_id,
-                flags,
-                seq,
-                0x0000,
-                len(chunk),
-                total_size
-            )
+            # ヘッダ構築（期限は開始チャンクの値をアドインが使用）
+            header = self._pack_header(cmd_id, flags, seq, len(chunk), total_size)
 
-            self.writer.write(header + chunk)
-            await self.writer.drain()
+            await self._wait_credit(seq, len(chunk))
+            async with self._lock:
+                if flags & 0x0003 == 0x0003:
+                    self._mark_sent_end(cmd_id, seq)
+                self.writer.writelines((header, chunk))
+                await self._drain_if_needed()
 
             offset += chunk_size
 
-    async def _recv_response(self, expected_seq: int) -> bytes:
+        await self.writer.drain()
+
+    async def _send_stream(
+        self,
+        cmd_id: int,
+        seq: int,
+        chunks: AsyncIterable[bytes],
+        total_size: int,
+        flags: int,
+        offset: int = 0
+    ) -> None:
         """
-        レスポンスを受信（分割受信対応）
+        非同期イテラブルのデータをチャンクサイズ単位のフレームに詰め直して送信
 
-        Args:
-            expected_seq: 期待するSequence番号
+        送信ロックはフレーム単位で取得するため、ディスクからの読み込み待ちの間も
+        他のリクエストを送信できます（アドイン側はSequence単位で再構築）。
+        offsetを指定すると、chunksはそのオフセット以降のデータとして続きのチャンクから送信します。
 
-        Returns:
-            レスポンスペイロード
+        Raises:
+            ValueError: データ量がtotal_sizeと一致しない場合
+        """
+        chunk_size = self.chunk_size
+
+        if total_size <= chunk_size and offset == 0:
+            # 単一パケット
+            payload = b"".join([bytes(piece) async for piece in chunks])
+            if len(payload) != total_size:
+                raise ValueError(f"Payload size {len(payload)} does not match total_size {total_size}")
+            await self._send_frames(cmd_id, seq, payload, flags)
+            return
+
+        async def send_frame(frame) -> None:
+            nonlocal offset
+            # Flags算出（bit 0-1: ChunkState）
+            if offset == 0:
+                state = 0x0001  # 開始
+            elif offset + len(frame) >= total_size:
+                state = 0x0003  # 終了
+            else:
+                state = 0x0002  # 中間
+            header = self._pack_header(cmd_id, state | flags, seq, len(frame), total_size)
+            await self._wait_credit(seq, len(frame))
+            async with self._lock:
+                if state == 0x0003:
+                    self._mark_sent_end(cmd_id, seq)
+                self.writer.writelines((header, frame))
+                await self._drain_if_needed()
+            offset += len(frame)
+
+        buffer = bytearray()
+        async for piece in chunks:
+            if offset + len(buffer) + len(piece) > total_size:
+                raise ValueError(f"Payload exceeds total_size {total_size}")
+            if not buffer and len(piece) == chunk_size:
+                # ファイルからの読み出し等、チャンクサイズ通りのデータはそのまま送信
+                await send_frame(piece)
+                continue
+            buffer += piece
+            while len(buffer) >= chunk_size:
+                await send_frame(bytes(buffer[:chunk_size]))
+                del buffer[:chunk_size]
+
+        if buffer:
+            await send_frame(bytes(buffer))
+        if offset != total_size:
+            raise ValueError(f"Payload ended at {offset} bytes, expected total_size {total_size}")
+
+        await self.writer.drain()
+
+    async def _wait_credit(self, seq: int, size: int) -> None:
+        """
+        分割送信のクレジットを確保（足りなければアドインのCREDITを待機）
 
         Raises:
-            AIDXProtocolError: エラーレスポンス受信時
+            asyncio.TimeoutError: RECV_TIMEOUT（期限が先、または期限を通知した場合はその時刻）までに
+                クレジットが届かない場合
+            Exception: 待機中にエラー応答を受信した、または接続が切断された場合はその例外
         """
-        # ヘッダ受信（20バイト: IHHHHII = 4+2+2+2+2+4+4）
-        header_data = await asyncio.wait_for(
-            self.reader.readexactly(20),
-            timeout=RECV_TIMEOUT
-        )
+        pending = self._pending.get(seq)
+        if pending is None or pending.send_credit is None:
+            return
+        while pending.send_credit < size:
+            if pending.future.done():
+                # 送信完了前に応答（エラー・接続断）: 例外を送出して残りのチャンクを送信しない
+                await pending.future
+                return
+            pending.credit_changed.clear()
+            try:
+                await asyncio.wait_for(pending.credit_changed.wait(), timeout=self._wait_timeout(pending))
+            except asyncio.TimeoutError:
+                raise self._timeout_error(seq, pending)
+        pending.send_credit -= size
 
-        # ヘッダ解析
-        magic, cmd_id, flags, seq, reserved, payload_size, total_size = struct.unpack(
-            "<IHHHHII", header_data
-        )
+    def _add_credit(self, payload: bytes, flags: int) -> None:
+        """アドインのCREDIT（{"seq", "credit"}）を分割送信中のリクエストに加算"""
+        try:
+            grant = decode_content(payload, flags, CMD_CREDIT)
+            seq, credit = grant["seq"], grant["credit"]
+        except (AIDXProtocolError, KeyError, TypeError) as e:
+            print(f"[CLIENT] Invalid CREDIT frame: {type(e).__name__}: {e}", file=sys.stderr)
+            return
+        pending = self._pending.get(seq)
+        if pending is None or pending.send_credit is None:
+            return
+        pending.send_credit += credit
+        pending.credit_changed.set()
 
-        # Magic確認
-        if magic != AIDX_MAGIC:
-            raise AIDXProtocolError(
-                0x1000,
-                f"Invalid magic: {magic:#x}",
-                cmd_id,
-                seq
-            )
+    def _grant_credit(self, seq: int, pending: _PendingRequest, size: int) -> None:
+        """
+        受信（ストリーミングでは消費）した分割レスポンスのバイト数をCREDITでアドインへ返す
 
-        # Sequence確認
-        if seq != expected_seq:
-            raise AIDXProtocolError(
-                0x1003,
-                f"Sequence mismatch: expected {expected_seq}, got {seq}",
-                cmd_id,
+        CREDITの送信回数を抑えるため、ウィンドウの半分がたまるごとにまとめて返します（応答は待たない）。
+        """
+        if self.send_window is None or pending.finished or pending.abandoned:
+            return
+        pending.unacked += size
+        if pending.unacked < RECV_WINDOW // 2:
+            return
+        credit, pending.unacked = pending.unacked, 0
+        self._spawn_background(self._send_frames(
+            CMD_CREDIT,
+            seq,
+            json.dumps({"seq": seq, "credit": credit}).encode("utf-8"),
+            CONTENT_TYPES["json"] << CONTENT_TYPE_SHIFT
+        ))
+
+    async def _drain_if_needed(self) -> None:
+        """送信バッファがSEND_HIGH_WATERを超えた場合のみdrain（チャンク毎のawaitを省略）"""
+        if self.writer.transport.get_write_buffer_size() >= SEND_HIGH_WATER:
+            await self.writer.drain()
+
+    async def _reader_loop(self) -> None:
+        """
+        受信ループ（バックグラウンドタスク）
+
+        フレームを1つずつ受信し、Sequence番号に対応する応答待ちリクエストへ振り分けます。
+        接続断やMagic不一致など、ストリームを継続できないエラーでは全ての応答待ちを失敗させます。
+        """
+        try:
+            while True:
+                # ヘッダ受信（v1: 20バイト、v2: Magicで判別して残り8バイトを追加で受信）
+                header_data = await self.reader.readexactly(HEADER_SIZE)
+                if header_data[:4] == struct.pack("<I", AIDX_MAGIC_V2):
+                    header_data += await self.reader.readexactly(HEADER_SIZE_V2 - HEADER_SIZE)
+                    header_format = HEADER_FORMAT_V2
+                else:
+                    header_format = HEADER_FORMAT
+
+                # ヘッダ解析
+                magic, cmd_id, flags, seq, reserved, payload_size, total_size = struct.unpack(
+                    header_format, header_data
+                )
+
+                # Magic確認（以降のフレーム境界が不明になるため接続継続不可）
+                if magic not in (AIDX_MAGIC, AIDX_MAGIC_V2):
+                    raise AIDXProtocolError(
+                        0x1000,
+                        f"Invalid magic: {magic:#x}",
+                        cmd_id,
+                        seq
+                    )
+
+                # ペイロード受信
+                payload = await self.reader.readexactly(payload_size) if payload_size > 0 else b""
+
+                await self._dispatch_frame(cmd_id, flags, seq, payload, total_size)
+
+        except asyncio.CancelledError:
+            raise
+        except (asyncio.IncompleteReadError, ConnectionError) as e:
+            print(f"[CLIENT] Connection closed by server: {type(e).__name__}", file=sys.stderr)
+            self._connection_lost("connection closed by server")
+        except Exception as e:
+            print(f"[CLIENT] Reader loop error: {type(e).__name__}: {e}", file=sys.stderr)
+            self._connection_lost(f"{type(e).__name__}: {e}")
+
+    def _connection_lost(self, reason: str) -> None:
+        """
+        接続断の処理（受信タスクから呼び出し）
+
+        応答待ちを全てAIDXConnectionLostで失敗させ、ソケットを閉じて再接続タスクを起動します。
+        接続確立中（HELLO前）の切断では再接続せず、connect()の呼び出し元へエラーを返します。
+        """
+        was_connected = self._connected.is_set()
+        self._connected.clear()
+        for seq, pending in list(self._pending.items()):
+            pending.finished = True
+            pending.fail(AIDXConnectionLost(
+                f"Connection to {self.address} lost while CMD=0x{pending.cmd_id:04X} (Seq={seq}) "
+                f"was in flight ({reason}); the command may or may not have been executed",
+                pending.cmd_id,
                 seq
-            )
+            ))
+        self._discard_abandoned()
+        if self.writer:
+            self.writer.close()
 
-        # ペイロード受信
-        payload = await asyncio.wait_for(
-            self.reader.readexactly(payload_size),
-            timeout=RECV_TIMEOUT
-        )
+        if (was_connected and self.auto_reconnect and not self._closing
+                and (self._reconnect_task is None or self._reconnect_task.done())):
+            self._reconnect_task = asyncio.create_task(self._reconnect_loop())
 
-        # ChunkState取得（Flags bit 0-1）
-        chunk_state = flags & 0x0003
+    async def _reconnect_loop(self) -> None:
+        """
+        自動再接続（バックグラウンドタスク）
 
-        # 分割受信チェック
-        if chunk_state == 0x0000:
-            # 単一パケット
-            full_payload = payload
-        else:
-            # 分割受信
-            full_payload = await self._recv_chunked(
-                expected_seq, chunk_state, payload, total_size, cmd_id
-            )
+        待機時間を0〜上限の一様乱数とし（フルジッター）、失敗のたびに上限を倍にします
+        （RECONNECT_BASE_DELAYからRECONNECT_MAX_DELAYまで）。close()まで試行を続けます。
+        """
+        print(f"[CLIENT] Reconnecting to {self.address}...", file=sys.stderr)
+        delay = RECONNECT_BASE_DELAY
+        attempt = 0
+        while not self._closing:
+            attempt += 1
+            await asyncio.sleep(random.uniform(0, delay))
+            try:
+                await asyncio.wait_for(self._open(), timeout=CONNECT_TIMEOUT)
+            except (OSError, AIDXProtocolError, asyncio.TimeoutError):
+                delay = min(delay * 2, RECONNECT_MAX_DELAY)
+                continue
+            print(f"[CLIENT] Reconnected to {self.address} (attempt {attempt})", file=sys.stderr)
+            return
+
+    async def _dispatch_frame(
+        self,
+        cmd_id: int,
+        flags: int,
+        seq: int,
+        payload: bytes,
+        total_size: int
+    ) -> None:
+        """
+        受信フレームを応答待ちリクエストへ振り分け
+
+        Args:
+            cmd_id: コマンドID
+            flags: Flags
+            seq: Sequence番号
+            payload: フレームのペイロード
+            total_size: 総データサイズ
+        """
+        if cmd_id == CMD_CREDIT:
+            # アドインからの送信クレジット（応答ではない）
+            self._add_credit(payload, flags)
+            return
+
+        pending = self._pending.get(seq)
+        if pending is not None and flags & 0x0003 in (0x0000, 0x0003):
+            pending.finished = True
+            if pending.abandoned:
+                # 離脱済みリクエストの最終フレーム: 以降このSequenceのフレームは届かないため予約を解除
+                del self._pending[seq]
+                if flags & FLAG_SHARED_MEMORY and cmd_id != CMD_ERROR:
+                    self._release_abandoned_shared_memory(payload)
+                return
+
+        if pending is None or pending.future.done():
+            # 離脱済み等、応答待ちでないSequenceのフレームは破棄
+            if pending is None or not pending.abandoned:
+                print(f"[CLIENT] Discarding frame for Seq={seq} (CMD=0x{cmd_id:04X})", file=sys.stderr)
+            return
+
+        if pending.stream is not None:
+            await self._dispatch_stream_frame(pending, cmd_id, flags, seq, payload, total_size)
+            return
+
+        try:
+            full_payload = self._reassemble(pending, cmd_id, flags, seq, payload, total_size)
+        except AIDXProtocolError as e:
+            pending.future.set_exception(e)
+            return
+
+        if full_payload is None:
+            # まだ全チャンク受信していない
+            self._grant_credit(seq, pending, len(payload))
+            return
+
+        pending.flags = flags
 
         # エラーレスポンスチェック
         if cmd_id == CMD_ERROR:
             error_data = json.loads(full_payload.decode("utf-8"))
-            raise AIDXProtocolError(
+            pending.future.set_exception(AIDXProtocolError(
                 error_data["ErrorCode"],
                 error_data["Message"],
                 error_data["OriginalCommandID"],
                 error_data["OriginalSequence"]
-            )
+            ))
+            return
 
-        return full_payload
+        pending.future.set_result(full_payload)
 
-    async def _recv_chunked(
+    async def _dispatch_stream_frame(
         self,
-        expected_seq: int,
-        initial_state: int,
-        initial_payload: bytes,
-        total_size: int,
-        expected_cmd_id: int
-    ) -> bytes:
+        pending: _PendingRequest,
+        cmd_id: int,
+        flags: int,
+        seq: int,
+        payload: bytes,
+        total_size: int
+    ) -> None:
         """
-        分割レスポンスを受信して再構築
-
-        Args:
-            expected_seq: 期待するSequence番号
-            initial_state: 最初のチャンクのChunkState
-            initial_payload: 最初のチャンクのペイロード
-            total_size: 総データサイズ
-            expected_cmd_id: 期待するCommandID
+        ストリーミング受信のフレームを検証して受信キューへ追加
 
-        Returns:
-            再構築された完全なペイロード
-
-        Raises:
-            AIDXProtocolError: プロトコルエラー
+        フロー制御が有効な場合は消費したチャンクの分だけCREDITを返し、アドインは
+        ウィンドウを使い切るとこのSequenceの送信を止めます（他のSequenceの受信は止まりません）。
+        旧アドインではキューが満杯の場合は消費されるまで待機します（受信タスク全体が待機し、TCPの
+        フロー制御でアドイン側の送信も止まります）。
         """
-        if initial_state != 0x0001:
-            raise AIDXProtocolError(
-                0x1003,
-                f"Expected chunk start (0x01), got {initial_state:#x}",
-                expected_cmd_id,
-                expected_seq
-            )
-
-        # バッファ初期化
-        chunks = [initial_payload]
-        received_size = len(initial_payload)
-
-        # 残りのチャンクを受信
-        while True:
-            # ヘッダ受信（20バイト: IHHHHII = 4+2+2+2+2+4+4）
-            header_data = await asyncio.wait_for(
-                self.reader.readexactly(20),
-                timeout=RECV_TIMEOUT
-            )
-
-            # ヘッダ解析
-            magic, cmd_id, flags, seq, reserved, payload_size, chunk_total_size = struct.unpack(
-                "<IHHHHII", header_data
-            )
+        # エラーレスポンス（単一パケット）
+        if cmd_id == CMD_ERROR:
+            error_data = json.loads(payload.decode("utf-8"))
+            pending.fail(AIDXProtocolError(
+                error_data["ErrorCode"],
+                error_data["Message"],
+                error_data["OriginalCommandID"],
+                error_data["OriginalSequence"]
+            ))
+            return
 
-            # Magic確認
-            if magic != AIDX_MAGIC:
-                raise AIDXProtocolError(
-                    0x1000,
-                    f"Invalid magic in chunk: {magic:#x}",
-                    cmd_id,
-                    seq
-                )
+        chunk_state = flags & 0x0003
+        try:
+            if chunk_state == 0x0000:
+                # 単一パケット
+                if pending.resp_cmd_id is not None:
+                    raise AIDXProtocolError(
+                        0x1003,
+                        "Unexpected single packet during chunked response",
+                        cmd_id,
+                        seq
+                    )
+            elif chunk_state == 0x0001:
+                # 開始チャンク
+                if pending.resp_cmd_id is not None:
+                    raise AIDXProtocolError(
+                        0x1003,
+                        "Duplicate chunk start",
+                        cmd_id,
+                        seq
+                    )
+                pending.resp_cmd_id = cmd_id
+                pending.total_size = total_size
+            else:
+                # 中間/終了チャンク
+                if pending.resp_cmd_id is None:
+                    raise AIDXProtocolError(
+                        0x1003,
+                        f"Expected chunk start (0x01), got {chunk_state:#x}",
+                        cmd_id,
+                        seq
+                    )
+                if cmd_id != pending.resp_cmd_id:
+                    raise AIDXProtocolError(
+                        0x1003,
+                        f"CommandID mismatch in chunk: expected {pending.resp_cmd_id:#x}, got {cmd_id:#x}",
+                        cmd_id,
+                        seq
+                    )
+                if total_size != pending.total_size:
+                    raise AIDXProtocolError(
+                        0x1003,
+                        f"TotalSize mismatch in chunk: expected {pending.total_size}, got {total_size}",
+                        cmd_id,
+                        seq
+                    )
 
-            # Sequence確認
-            if seq != expected_seq:
+            pending.received_size += len(payload)
+            if pending.received_size > total_size or (
+                chunk_state in (0x0000, 0x0003) and pending.received_size != total_size
+            ):
                 raise AIDXProtocolError(
                     0x1003,
-                    f"Sequence mismatch in chunk: expected {expected_seq}, got {seq}",
+                    f"Total size mismatch: expected {total_size}, got {pending.received_size}",
                     cmd_id,
                     seq
                 )
+        except AIDXProtocolError as e:
+            pending.fail(e)
+            return
 
-            # CommandID確認
-            if cmd_id != expected_cmd_id:
-                raise AIDXProtocolError(
-                    0x1003,
-                    f"CommandID mismatch in chunk: expected {expected_cmd_id:#x}, got {cmd_id:#x}",
-                    cmd_id,
-                    seq
-                )
+        await pending.stream.put((flags, payload))
+        if chunk_state in (0x0000, 0x0003) and not pending.future.done():
+            # 完了（待機中に打ち切られていなければ終端を通知）
+            pending.future.set_result(None)
+            await pending.stream.put(None)
+
+    def _release_abandoned_shared_memory(self, descriptor: bytes) -> None:
+        """離脱済みリクエストへの共有メモリ経由のレスポンスを、マップせずに解放"""
+        try:
+            name = json.loads(descriptor.decode("utf-8"))["name"]
+        except (ValueError, KeyError, TypeError) as e:
+            print(f"[CLIENT] Invalid shared memory descriptor: {type(e).__name__}: {e}", file=sys.stderr)
+            return
+        self._release_shared_memory(name)
+
+    def _reassemble(
+        self,
+        pending: _PendingRequest,
+        cmd_id: int,
+        flags: int,
+        seq: int,
+        payload: bytes,
+        total_size: int
+    ) -> Optional[bytes]:
+        """
+        分割レスポンスの再構築
+
+        Returns:
+            完全なペイロード（全チャンク受信完了時）、またはNone（受信中）
+
+        Raises:
+            AIDXProtocolError: チャンク順序・サイズ不整合
+        """
+        # ChunkState取得（Flags bit 0-1）
+        chunk_state = flags & 0x0003
+
+        if chunk_state == 0x0000:
+            # 単一パケット
+            return payload
 
-            # TotalSize確認
-            if chunk_total_size != total_size:
+        if chunk_state == 0x0001:
+            # 開始チャンク
+            if pending.chunks:
                 raise AIDXProtocolError(
                     0x1003,
-                    f"TotalSize mismatch in chunk: expected {total_size}, got {chunk_total_size}",
+                    "Duplicate chunk start",
                     cmd_id,
                     seq
                 )
+            pending.resp_cmd_id = cmd_id
+            pending.total_size = total_size
+            pending.chunks.append(payload)
+            pending.received_size = len(payload)
+            return None
+
+        # 中間/終了チャンク
+        if not pending.chunks:
+            raise AIDXProtocolError(
+                0x1003,
+                f"Expected chunk start (0x01), got {chunk_state:#x}",
+                cmd_id,
+                seq
+            )
 
-            # ペイロード受信
-            payload = await asyncio.wait_for(
-                self.reader.readexactly(payload_size),
-                timeout=RECV_TIMEOUT
+        # CommandID確認
+        if cmd_id != pending.resp_cmd_id:
+            raise AIDXProtocolError(
+                0x1003,
+                f"CommandID mismatch in chunk: expected {pending.resp_cmd_id:#x}, got {cmd_id:#x}",
+                cmd_id,
+                seq
             )
 
-            chunks.append(payload)
-            received_size += len(payload)
+        # TotalSize確認
+        if total_size != pending.total_size:
+            raise AIDXProtocolError(
+                0x1003,
+                f"TotalSize mismatch in chunk: expected {pending.total_size}, got {total_size}",
+                cmd_id,
+                seq
+            )
 
-            # ChunkState確認
-            chunk_state = flags & 0x0003
+        pending.chunks.append(payload)
+        pending.received_size += len(payload)
 
-            if chunk_state == 0x0003:
-                # 終了チャンク
-                break
-            elif chunk_state == 0x0002:
-                # 中間チャンク、継続
-                continue
-            else:
-                raise AIDXProtocolError(
-                    0x1003,
-                    f"Invalid chunk state in middle: {chunk_state:#x}",
-                    cmd_id,
-                    seq
-                )
+        if chunk_state == 0x0002:
+            # 中間チャンク、継続
+            return None
 
-        # 全チャンク結合
-        full_payload = b"".join(chunks)
+        # 終了チャンク: 全チャンク結合
+        full_payload = b"".join(pending.chunks)
+        pending.chunks = []
 
         # サイズ確認
         if len(full_payload) != total_size:
             raise AIDXProtocolError(
                 0x1003,
                 f"Total size mismatch after reassembly: expected {total_size}, got {len(full_payload)}",
-                expected_cmd_id,
-                expected_seq
+                cmd_id,
+                seq
             )
 
         return full_payload
 
+    def _fail_all_pending(self, error: Exception) -> None:
+        """全ての応答待ちリクエストを失敗させる"""
+        for pending in self._pending.values():
+            pending.finished = True
+            pending.fail(error)
+        self._discard_abandoned()
+
+    def _discard_abandoned(self) -> None:
+        """離脱済みリクエストのSequenceの予約を解除（接続断後は遅れて届くフレームがない）"""
+        for seq in [seq for seq, pending in self._pending.items() if pending.abandoned]:
+            del self._pending[seq]
+
     async def __aenter__(self):
         await self.connect()
         return self
@@ -1,6 +1,7 @@
 """AIDX 分割送受信テスト"""
 import socket
 import struct
+import json
 import sys
 
 # プロトコル定数
@@ -9,6 +10,7 @@ CHUNK_SIZE = 64 * 1024
 
 # コマンドID（テスト用ダミー）
 CMD_TEST_LARGE = 0x0F00
+CMD_HELLO = 0xFF00
 
 # Flags
 FLAG_SINGLE = 0x0000
@@ -25,6 +27,8 @@ class ChunkingTestClient:
         self.port = port
         self.sock: socket.socket = None
         self.seq_counter = 0
+        # 送信チャンクサイズ（HELLOでネゴシエーション）
+        self.chunk_size = CHUNK_SIZE
 
     def connect(self):
         """接続"""
@@ -39,6 +43,21 @@ class ChunkingTestClient:
             self.sock = None
             print("✓ Disconnected")
 
+    def hello(self):
+        """
+        HELLOハンドシェイク
+
+        境界テストのためCHUNK_SIZEでのチャンク分割を要求します。
+        HELLO非対応の旧アドインの場合は既定値（64KB）のままです。
+        """
+        payload = json.dumps({"version": 1, "max_chunk_size": CHUNK_SIZE}).encode("utf-8")
+        result = json.loads(self.send_chunked_command(CMD_HELLO, payload).decode("utf-8"))
+        if "max_chunk_size" in result:
+            self.chunk_size = result["max_chunk_size"]
+            print(f"✓ Hello: Version={result.get('version')}, ChunkSize={self.chunk_size}")
+        else:
+            print(f"⚠ Hello not supported (older addin): {result.get('Message')}")
+
     def _next_seq(self) -> int:
         """次のSequence番号"""
         seq = self.seq_counter
@@ -61,7 +80,7 @@ class ChunkingTestClient:
 
         print(f"  Sending chunked command: CommandID=0x{cmd_id:04X}, Seq={seq}, TotalSize={total_size}")
 
-        if total_size <= CHUNK_SIZE:
+        if total_size <= self.chunk_size:
             # 単一パケット
             self._send_packet(cmd_id, seq, FLAG_SINGLE, payload, total_size)
         else:
@@ -69,7 +88,7 @@ class ChunkingTestClient:
             offset = 0
             chunk_num = 0
             while offset < total_size:
-                chunk_size = min(CHUNK_SIZE, total_size - offset)
+                chunk_size = min(self.chunk_size, total_size - offset)
                 chunk = payload[offset:offset + chunk_size]
 
                 # Flags算出
@@ -95,7 +114,7 @@ class ChunkingTestClient:
     def _send_packet(self, cmd_id: int, seq: int, flags: int, payload: bytes, total_size: int):
         """パケット送信"""
         header = struct.pack(
-            "<IHHHII",
+            "<IHHHHII",
             AIDX_MAGIC,
             cmd_id,
             flags,
@@ -109,10 +128,10 @@ class ChunkingTestClient:
     def _recv_chunked_response(self, expected_seq: int) -> bytes:
         """分割受信対応レスポンス受信"""
         # 最初のヘッダ受信
-        header_data = self._recv_exact(16)
+        header_data = self._recv_exact(20)
 
         magic, cmd_id, flags, seq, reserved, payload_size, total_size = struct.unpack(
-            "<IHHHII", header_data
+            "<IHHHHII", header_data
         )
 
         # 検証
@@ -143,9 +162,9 @@ class ChunkingTestClient:
 
             # 残りのチャンク受信
             while True:
-                header_data = self._recv_exact(16)
+                header_data = self._recv_exact(20)
                 magic, cmd_id, flags, seq, reserved, payload_size, chunk_total_size = struct.unpack(
-                    "<IHHHII", header_data
+                    "<IHHHHII", header_data
                 )
 
                 # 検証
@@ -250,7 +269,7 @@ def test_boundary_payload(client: ChunkingTestClient):
     print("\n[Test 4] Boundary Payload (exactly 64KB)")
     try:
         # 正確に64KB（単一パケットとして送信されるはず）
-        payload = b"D" * CHUNK_SIZE
+        payload = b"D" * client.chunk_size
         response = client.send_chunked_command(CMD_TEST_LARGE, payload)
 
         if len(response) > 0:
@@ -279,6 +298,7 @@ def main():
     try:
         # 接続
         client.connect()
+        client.hello()
 
         # テスト実行
         test_small_payload(client)
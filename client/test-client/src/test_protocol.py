@@ -7,12 +7,14 @@ import sys
 # プロトコル定数
 AIDX_MAGIC = 0x41494458
 CHUNK_SIZE = 64 * 1024
+MAX_CHUNK_SIZE = 4 * 1024 * 1024  # HELLOで要求するチャンクサイズ（単一パケット受信のため最大値）
 
 # コマンドID
 CMD_SCREENSHOT = 0x0100
 CMD_IMPORT_FILE = 0x0200
 CMD_GET_OBJECTS = 0x0300
 CMD_MODIFY = 0x0400
+CMD_HELLO = 0xFF00
 CMD_ERROR = 0xFFFF
 
 # Flags
@@ -62,7 +64,7 @@ class AIDXTestClient:
 
         # ヘッダ構築
         header = struct.pack(
-            "<IHHHII",
+            "<IHHHHII",
             AIDX_MAGIC,
             cmd_id,
             FLAG_SINGLE,
@@ -81,12 +83,12 @@ class AIDXTestClient:
 
     def _recv_response(self, expected_seq: int, sent_cmd_id: int) -> bytes:
         """レスポンス受信（単一パケットのみ）"""
-        # ヘッダ受信
-        header_data = self._recv_exact(16)
+        # ヘッダ受信（20バイト: IHHHHII = 4+2+2+2+2+4+4）
+        header_data = self._recv_exact(20)
 
         # ヘッダ解析
         magic, cmd_id, flags, seq, reserved, payload_size, total_size = struct.unpack(
-            "<IHHHII", header_data
+            "<IHHHHII", header_data
         )
 
         print(f"  ← Recv: CommandID=0x{cmd_id:04X}, Seq={seq}, PayloadSize={payload_size}, TotalSize={total_size}, Flags=0x{flags:04X}")
@@ -181,6 +183,31 @@ def test_get_objects(client: AIDXTestClient):
         print(f"  ✗ Failed: {e}")
 
 
+def test_hello(client: AIDXTestClient):
+    """HELLOハンドシェイクテスト（以降のレスポンスを可能な限り単一パケットにする）"""
+    print("\n[Test 0] Hello (capabilities)")
+    try:
+        payload = json.dumps({
+            "version": 1,
+            "max_chunk_size": MAX_CHUNK_SIZE,
+            "codecs": ["json"],
+            "compression": [],
+            "max_in_flight": 1
+        }).encode("utf-8")
+
+        response = client.send_command(CMD_HELLO, payload)
+        result = json.loads(response.decode("utf-8"))
+        print(f"  Version: {result.get('version')}, ChunkSize: {result.get('max_chunk_size')}, "
+              f"MaxInFlight: {result.get('max_in_flight')}")
+        print(f"  Commands: {', '.join(f'0x{cid:04X}' for cid in result.get('commands', []))}")
+        print(f"  ✓ Hello succeeded")
+
+    except RuntimeError as e:
+        print(f"  ⚠ Hello not supported (older addin): {e}")
+    except Exception as e:
+        print(f"  ✗ Failed: {e}")
+
+
 def test_invalid_command(client: AIDXTestClient):
     """無効なコマンドIDテスト"""
     print("\n[Test 4] Invalid Command ID")
@@ -213,6 +240,7 @@ def main():
         client.connect()
 
         # テスト実行
+        test_hello(client)
         test_screenshot(client)
         test_import_file(client)
         test_get_objects(client)